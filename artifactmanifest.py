@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import tempfile
+
+MANIFEST_NAME = ".ralbot-manifest.json"
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def list_files(path):
+    """ `path` itself if it is a file, else every file below it in a stable order """
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+        for filename in sorted(filenames):
+            if filename.endswith((".pyc", ".pyo")):
+                continue
+            files.append(os.path.join(dirpath, filename))
+    return files
+
+def hash_tree(path):
+    """ Content hash of a file or of every file below a directory """
+    h = hashlib.sha256()
+    for f in list_files(path):
+        h.update(os.path.relpath(f, path).encode())
+        h.update(hash_file(f).encode())
+    return h.hexdigest()
+
+#===============================================================================
+class ArtifactManifest:
+    """
+    Record of the generated artifacts in an output directory.
+
+    Each entry maps an artifact key to the fingerprint of the inputs it was
+    generated from and the hash of every file it produced, with paths relative
+    to the output directory. An artifact is up to date when its fingerprint is
+    unchanged and its files are still the ones we wrote. File size and mtime
+    are checked first so that unchanged files are not read back.
+
+    An entry also lists the files its exporter read besides the RDL sources,
+    e.g. HTML templates, so that they can be reported while the artifact is
+    not regenerated.
+    """
+    def __init__(self, output_dir):
+        self.base_dir = output_dir or "."
+        self.path = os.path.join(self.base_dir, MANIFEST_NAME)
+        self.entries = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def isFresh(self, key, fingerprint):
+        entry = self.entries.get(key)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            return False
+
+        for relpath, rec in entry["outputs"].items():
+            path = os.path.join(self.base_dir, relpath)
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_size == rec["size"] and st.st_mtime_ns == rec["mtime_ns"]:
+                continue
+            if st.st_size != rec["size"] or hash_file(path) != rec["sha256"]:
+                return False
+        return True
+
+    def getInputs(self, key):
+        return self.entries.get(key, {}).get("inputs", [])
+
+    def record(self, key, fingerprint, outputs, inputs=()):
+        files = {}
+        for output in outputs:
+            for path in list_files(output):
+                if not os.path.isfile(path):
+                    continue
+                st = os.stat(path)
+                files[os.path.relpath(path, self.base_dir)] = {
+                    "sha256": hash_file(path),
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                }
+        self.entries[key] = {
+            "fingerprint": fingerprint,
+            "outputs": files,
+            "inputs": list(inputs),
+        }
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def save(self):
+        dirname = os.path.dirname(self.path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
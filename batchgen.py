@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import argparse
+import collections
+import multiprocessing
+
+from systemrdl import RDLCompileError
+
+# Manifest exporter names and the command line options they stand for
+EXPORTER_OPTIONS = {
+    "header":           {"gen_header": "all"},
+    "header-c":         {"gen_header": "c"},
+    "header-verilog":   {"gen_header": "verilog"},
+    "uvmregs":          {"gen_uvm": True},
+    "doc":              {"gen_docs": True},
+    "xml":              {"gen_xml": True},
+}
+
+# Outcome of one block: its report entry, and the messages, profile records
+# and trace events of a forked block worker
+BlockResult = collections.namedtuple("BlockResult", ["entry", "lines", "records", "events"])
+
+class BatchManifestError(RDLCompileError):
+    """ Malformed batch manifest """
+    pass
+
+def load_batch_manifest(path):
+    """
+    Read a batch manifest. Either a list of blocks, or an object:
+
+        {
+            "shared": ["common/fields.rdl", "common/regs.rdl"],
+            "include_dirs": ["common"],
+            "blocks": [
+                {
+                    "name": "uart",
+                    "sources": ["uart/uart.rdl"],
+                    "top": "uart",
+                    "output": "out/uart/uart",
+                    "exporters": ["header", "uvmregs", "doc", "xml"]
+                }
+            ]
+        }
+
+    "shared" sources are compiled ahead of every block's own sources and are
+    parsed only once for the whole batch, searching the top-level
+    "include_dirs". "include_dirs" may also be given per block. Relative
+    paths are relative to the manifest.
+
+    Returns (shared sources, include dirs, list of block dicts) with absolute
+    paths.
+    """
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise BatchManifestError("%s: %s" % (path, e))
+
+    if isinstance(data, list):
+        data = {"blocks": data}
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    def resolve(paths):
+        return [os.path.join(base_dir, p) for p in paths]
+
+    shared = resolve(data.get("shared", []))
+    include_dirs = resolve(data.get("include_dirs", []))
+    blocks = []
+    for i, entry in enumerate(data.get("blocks", [])):
+        for key in ("sources", "output", "exporters"):
+            if key not in entry:
+                raise BatchManifestError("%s: block %d has no '%s'" % (path, i, key))
+        for exporter in entry["exporters"]:
+            if exporter not in EXPORTER_OPTIONS:
+                raise BatchManifestError("%s: block %d: unknown exporter '%s'" % (path, i, exporter))
+        blocks.append({
+            "name": entry.get("name", entry.get("top") or "block%d" % i),
+            "sources": resolve(entry["sources"]),
+            "top": entry.get("top"),
+            "output": os.path.join(base_dir, entry["output"]),
+            "exporters": entry["exporters"],
+            "include_dirs": resolve(entry.get("include_dirs", [])) + include_dirs,
+        })
+    return shared, include_dirs, blocks
+
+def get_top_blocks(cfg, tops):
+    """
+    One block per top-level addrmap of `cfg.src_files`, exported with the
+    command line's exporters to <output>/<top>/<top>.*
+    """
+    return [{
+        "name": top,
+        "sources": [],
+        "top": top,
+        "output": os.path.join(cfg.output, top, top),
+        "exporters": None,
+        "include_dirs": [],
+    } for top in tops]
+
+def get_block_cfg(cfg, shared, block):
+    """
+    Command line configuration for one block, inheriting the global options.
+    A block whose "exporters" is None keeps the command line's exporters.
+    """
+    block_cfg = argparse.Namespace(**vars(cfg))
+    block_cfg.src_files = shared + block["sources"]
+    block_cfg.top_def_name = block["top"]
+    block_cfg.output = block["output"]
+    block_cfg.incl_search_paths = block["include_dirs"] or cfg.incl_search_paths
+    # Every block writes its own <output>.d
+    block_cfg.gen_depfile = cfg.gen_depfile or bool(cfg.depfile)
+    block_cfg.depfile = None
+    if block["exporters"] is not None:
+        block_cfg.gen_header = None
+        block_cfg.gen_uvm = block_cfg.gen_docs = block_cfg.gen_xml = block_cfg.gen_verilog = False
+        for exporter in block["exporters"]:
+            for key, value in EXPORTER_OPTIONS[exporter].items():
+                setattr(block_cfg, key, value)
+    # Blocks already run in parallel, and pool workers cannot fork again
+    block_cfg.jobs = 1
+    return block_cfg
+
+def is_cached(generator, block_cfg):
+    """ True if the block's elaborated model is in the model cache """
+    try:
+        cache_path = generator.createCompiler(block_cfg).getCachePath()
+    except (RDLCompileError, OSError):
+        # Reported when the block runs
+        return False
+    return cache_path is not None and os.path.exists(cache_path)
+
+# Batch state shared with the forked block workers
+_batchState = None
+
+def _runForkedBlock(index):
+    generator, blocks, block_cfgs, preloaded = _batchState
+    return run_block(generator, blocks[index]["name"], block_cfgs[index], preloaded, capture=True)
+
+def run_block(generator, name, block_cfg, preloaded=None, capture=False):
+    """
+    Generate the block `name`, profiled as a phase of that name. Returns its
+    BlockResult. Messages, profile records and trace events are only captured
+    when `capture` is set, in a forked worker.
+    """
+    if capture:
+        generator.printer.startCapture()
+    first_record = len(generator.profiler.records)
+    first_event = len(generator.tracer.events)
+    generator.artifacts = []
+    written, skipped = generator.output_sink.written, generator.output_sink.skipped
+    start = time.time()
+    with generator.profiler.phase(name):
+        try:
+            rdl_compiler = generator.createCompiler(block_cfg)
+            rdl_compiler.preloaded = preloaded
+            failed = generator.generate(rdl_compiler, block_cfg)
+            status = "failed" if failed else "ok"
+        except RDLCompileError as e:
+            generator.printer.print_message("error", generator.formatCompileError(e), None)
+            failed = []
+            status = "failed"
+        except OSError as e:
+            generator.printer.print_message("error", str(e), None)
+            failed = []
+            status = "failed"
+    entry = {
+        "output": block_cfg.output,
+        "status": status,
+        "failed_exporters": failed,
+        "seconds": round(time.time() - start, 3),
+        "artifacts": generator.artifacts,
+        "files_written": generator.output_sink.written - written,
+        "files_unchanged": generator.output_sink.skipped - skipped,
+    }
+    if not capture:
+        return BlockResult(entry, [], [], [])
+    return BlockResult(
+        entry, generator.printer.stopCapture(),
+        generator.profiler.records[first_record:], generator.tracer.events[first_event:]
+    )
+
+def run_blocks(generator, cfg, shared, blocks, include_dirs=None):
+    """
+    Generate `blocks`, each from the `shared` sources followed by its own.
+
+    The shared sources are compiled once in this process, searching
+    `include_dirs` (by default the command line's), then each block runs in a
+    worker forked from it (`cfg.jobs` at a time) which only has to parse the
+    block's own sources and elaborate its top. If the shared sources do not
+    compile, every block fails without running. Messages and a status line
+    are printed per block in block order, and each block is profiled as a
+    top-level phase named after it. Returns the report of the run.
+    """
+    from ralbotgen import preload_exporters
+
+    start = time.time()
+    block_cfgs = [get_block_cfg(cfg, shared, block) for block in blocks]
+    use_fork = "fork" in multiprocessing.get_all_start_methods()
+    # Elaboration does not modify the compiler, so blocks that add no sources
+    # of their own can share it even when they run one after the other
+    share = use_fork or not any(block["sources"] for block in blocks)
+
+    preloaded = None
+    if use_fork:
+        preload_exporters()
+    if share and shared and not all(is_cached(generator, block_cfg) for block_cfg in block_cfgs):
+        generator.printer.print_message("info", "Compiling shared %s ..." % " ".join(shared))
+        shared_compiler = generator.createCompiler(cfg)
+        shared_compiler.src_files = shared
+        shared_compiler.incl_search_paths = include_dirs or cfg.incl_search_paths
+        try:
+            with generator.profiler.phase("shared sources"):
+                preloaded = (shared_compiler.parseSources(), shared)
+        except (RDLCompileError, OSError) as e:
+            message = generator.formatCompileError(e) if isinstance(e, RDLCompileError) else str(e)
+            generator.printer.print_message("error", message, None)
+            # No block can be compiled without the shared sources
+            return get_report(generator, blocks, [get_failed_entry(block_cfg) for block_cfg in block_cfgs], start)
+
+    if use_fork:
+        global _batchState
+        _batchState = (generator, blocks, block_cfgs, preloaded)
+        try:
+            # A worker per block: compiling a block adds its sources to the
+            # worker's copy of the shared compiler
+            with multiprocessing.get_context("fork").Pool(max(1, cfg.jobs), maxtasksperchild=1) as pool:
+                results = pool.map(_runForkedBlock, range(len(blocks)), chunksize=1)
+        finally:
+            _batchState = None
+        for result in results:
+            generator.profiler.merge(result.records)
+            generator.tracer.merge(result.events)
+    else:
+        results = [
+            run_block(generator, block["name"], block_cfg, preloaded)
+            for block, block_cfg in zip(blocks, block_cfgs)
+        ]
+    return get_report(generator, blocks, results, start)
+
+def get_failed_entry(block_cfg):
+    """ BlockResult of a block that could not run """
+    entry = {
+        "output": block_cfg.output,
+        "status": "failed",
+        "failed_exporters": [],
+        "seconds": 0,
+        "artifacts": [],
+        "files_written": 0,
+        "files_unchanged": 0,
+    }
+    return BlockResult(entry, [], [], [])
+
+def get_report(generator, blocks, results, start):
+    """ Print the messages and status of every block. Returns the report of the run """
+    report = {"blocks": [], "seconds": 0}
+    for block, result in zip(blocks, results):
+        entry = result.entry
+        if result.lines:
+            generator.printer.emit_message(result.lines)
+        entry["name"] = block["name"]
+        report["blocks"].append(entry)
+    report["seconds"] = round(time.time() - start, 3)
+    report["failed"] = len([entry for entry in report["blocks"] if entry["status"] != "ok"])
+    generator.artifacts = [path for entry in report["blocks"] for path in entry["artifacts"]]
+
+    for entry in report["blocks"]:
+        generator.printer.emit_message(["%-24s %-6s %8.3fs" % (entry["name"], entry["status"], entry["seconds"])])
+    return report
+
+def run_batch(generator, cfg):
+    """
+    Generate every block of the batch manifest `cfg.batch_manifest`, and write
+    a status and timing report to `cfg.batch_report`.
+    Returns the number of failed blocks.
+    """
+    shared, include_dirs, blocks = load_batch_manifest(cfg.batch_manifest)
+    report = run_blocks(generator, cfg, shared, blocks, include_dirs)
+
+    with open(cfg.batch_report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    generator.printer.emit_message([
+        "%d blocks, %d failed, %.3fs total. Report written to %s"
+        % (len(blocks), report["failed"], report["seconds"], cfg.batch_report)
+    ])
+    return report["failed"]
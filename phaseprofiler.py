@@ -0,0 +1,356 @@
+import os
+import re
+import sys
+import json
+import time
+import cProfile
+import functools
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Where allocations come from, by the file that made them
+MEMORY_CATEGORIES = [
+    ("systemrdl nodes",         os.sep + "systemrdl" + os.sep),
+    ("antlr parse trees",       os.sep + "antlr4" + os.sep),
+    ("uvmgen class tables",     os.path.join("ralbot", "uvmgen")),
+    ("headergen content",       os.path.join("ralbot", "headergen")),
+    ("IP-XACT minidom tree",    os.path.join("xml", "dom")),
+    ("HTML RALIndex",           os.path.join("ralbot", "html")),
+    ("jinja2 templates",        os.sep + "jinja2" + os.sep),
+    # Sections buffered by spool() until written out
+    ("output spools",           os.sep + "tempfile.py"),
+    ("module imports",          "<frozen importlib"),
+]
+
+def memory_category(filename):
+    for category, pattern in MEMORY_CATEGORIES:
+        if pattern in filename:
+            return category
+    return "other"
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def memory_record(peak, allocations, top=10):
+    """ Memory record of a phase from its traced peak and getAllocations() """
+    categories = {}
+    for (filename, _), (size, _) in allocations.items():
+        category = memory_category(filename)
+        categories[category] = categories.get(category, 0) + size
+    largest = sorted(allocations.items(), key=lambda x: -x[1][0])[:top]
+    return {
+        "peak_traced_kb": peak // 1024,
+        "max_rss_kb": max_rss_kb(),
+        "categories_kb": dict(
+            (k, v // 1024) for k, v in sorted(categories.items(), key=lambda x: -x[1])
+        ),
+        "top_allocators": [
+            {"where": "%s:%d" % where, "kb": size // 1024, "count": count}
+            for where, (size, count) in largest
+        ],
+    }
+
+#===============================================================================
+class PhaseProfiler:
+    """
+    Records wall and CPU time of named generation phases.
+
+    Phases nest: a phase opened inside another is recorded as
+    ``outer/inner``. When `prof_dir` is set, each top-level phase also runs
+    under cProfile and its stats are dumped to ``<prof_dir>/<phase>.prof``.
+
+    With `track_memory`, each top-level phase also records the peak of the
+    memory traced by tracemalloc, the process' peak RSS, and the allocations
+    still alive at the end of the phase (or at the last :meth:`sample` taken
+    inside it), grouped by file and by MEMORY_CATEGORIES.
+
+    Work interleaved with other work, such as the callbacks of one of the
+    exporters sharing a walk, is recorded as a single phase by an
+    :meth:`account`.
+
+    A disabled profiler only costs the call to :meth:`phase`.
+    """
+    def __init__(self, enabled=False, prof_dir=None, track_memory=False):
+        self.enabled = enabled
+        self.prof_dir = prof_dir
+        self.track_memory = track_memory
+        self.records = []
+        self.stack = []
+        self.t0 = time.perf_counter()
+        self.start_snapshot = None
+        self.sampled_snapshot = None
+        if track_memory:
+            tracemalloc.start()
+
+    def phase(self, name):
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._phase(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name):
+        self.stack.append(name)
+        path = "/".join(self.stack)
+
+        # Only one cProfile can be active at a time, so nested phases are
+        # covered by their top-level phase's dump
+        prof = None
+        if self.prof_dir and len(self.stack) == 1:
+            prof = cProfile.Profile()
+
+        track_memory = self.track_memory and len(self.stack) == 1
+        if track_memory:
+            self.start_snapshot = self.takeSnapshot()
+            self.sampled_snapshot = None
+            start_traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if prof:
+            prof.enable()
+        try:
+            yield
+        finally:
+            if prof:
+                prof.disable()
+            record = {
+                "phase": path,
+                "depth": len(self.stack) - 1,
+                "start": round(wall - self.t0, 6),
+                "wall": round(time.perf_counter() - wall, 6),
+                "cpu": round(time.process_time() - cpu, 6),
+                "pid": os.getpid(),
+            }
+            if track_memory:
+                record["memory"] = self.getMemoryRecord(start_traced)
+            self.records.append(record)
+            if prof:
+                os.makedirs(self.prof_dir, exist_ok=True)
+                prof.dump_stats(os.path.join(self.prof_dir, re.sub(r'[^\w.-]', '_', path) + ".prof"))
+            self.stack.pop()
+
+    def account(self, name, parent=None, snapshots=False):
+        """
+        Returns a PhaseAccount adding up the pieces of phase `name`, nested in
+        the account `parent` if given. With `snapshots`, the allocations of
+        each piece are grouped like those of a phase. Pieces of nested
+        accounts are never snapshot, so that they can be small.
+        """
+        if not self.enabled:
+            return NullAccount()
+        return PhaseAccount(self, name, parent, snapshots)
+
+    def takeSnapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+
+    def sample(self):
+        """
+        Snapshot the live allocations of the current phase now, e.g. while an
+        exporter still holds its output buffers.
+        """
+        if self.enabled and self.track_memory and self.stack:
+            self.sampled_snapshot = self.takeSnapshot()
+
+    def getMemoryRecord(self, start_traced, top=10):
+        _, peak = tracemalloc.get_traced_memory()
+        allocations = self.getAllocations(self.start_snapshot)
+        self.start_snapshot = None
+        return memory_record(peak - start_traced, allocations, top)
+
+    def getAllocations(self, start_snapshot):
+        """
+        Returns {(file, line): [bytes, count]} of the allocations made since
+        `start_snapshot` and still alive now, or at the last sample().
+        """
+        snapshot = self.sampled_snapshot or self.takeSnapshot()
+        self.sampled_snapshot = None
+        allocations = {}
+        for d in snapshot.compare_to(start_snapshot, 'lineno'):
+            if d.size_diff > 0:
+                allocations[(d.traceback[0].filename, d.traceback[0].lineno)] = [d.size_diff, d.count_diff]
+        return allocations
+
+    def getMemorySummary(self):
+        """ Human readable per-phase memory summary, one line per phase """
+        lines = ["%-20s %12s %12s  %s" % ("phase", "peak traced", "max RSS", "largest live allocations")]
+        for record in sorted(self.records, key=lambda r: r["start"]):
+            mem = record.get("memory")
+            if mem is None:
+                continue
+            categories = ", ".join(
+                "%s %.1f MB" % (k, v / 1024) for k, v in list(mem["categories_kb"].items())[:3]
+            )
+            lines.append("%-20s %9.1f MB %9.1f MB  %s" % (
+                record["phase"], mem["peak_traced_kb"] / 1024,
+                (mem["max_rss_kb"] or 0) / 1024, categories
+            ))
+        return lines
+
+    def merge(self, records):
+        """ Add records collected by a forked worker """
+        self.records.extend(records)
+
+    def report(self):
+        records = sorted(self.records, key=lambda r: r["start"])
+        return {
+            "wall": round(time.perf_counter() - self.t0, 6),
+            "phases": records,
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+#===============================================================================
+class PhaseAccount:
+    """
+    Phase of a PhaseProfiler run in pieces: every ``with`` block of piece(),
+    and every call of the methods instrument() wraps, adds to it. close()
+    records the pieces as one phase, starting with the first of them.
+
+    The pieces of an account nested in a `parent` also count in the parent's.
+    Without a parent, the account is nested in the phases open when it is
+    created. Phases opened during a piece are nested in the account, and
+    top-level accounts are profiled like top-level phases: each has a cProfile
+    dump of its pieces, and with memory tracking, a peak made of what its
+    pieces allocated.
+    """
+    def __init__(self, profiler, name, parent=None, snapshots=False):
+        self.profiler = profiler
+        self.parent = parent
+        self.names = (parent.names if parent else list(profiler.stack)) + [name]
+        self.path = "/".join(self.names)
+        self.snapshots = snapshots
+        self.prof = None
+        if profiler.prof_dir and len(self.names) == 1:
+            self.prof = cProfile.Profile()
+        self.track_memory = profiler.track_memory and len(self.names) == 1
+        self.reset()
+
+    def reset(self):
+        """ Forget the pieces so far, e.g. in a forked worker """
+        self.start = None
+        self.wall = 0.0
+        self.cpu = 0.0
+        # Traced memory the pieces allocated and kept so far, and its peak
+        self.traced = 0
+        self.peak = 0
+        self.allocations = {}
+
+    def begin(self, snapshots=True):
+        parent_state = None
+        if self.parent is not None:
+            parent_state = self.parent.begin(snapshots=False)
+        if self.start is None:
+            self.start = time.perf_counter() - self.profiler.t0
+        outer = self.profiler.stack
+        self.profiler.stack = list(self.names)
+        state = [outer, parent_state, None, None, None, None]
+        if self.track_memory:
+            if self.snapshots and snapshots:
+                state[3] = self.profiler.takeSnapshot()
+            state[2] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        state[4] = time.perf_counter()
+        state[5] = time.process_time()
+        if self.prof:
+            self.prof.enable()
+        return state
+
+    def end(self, state):
+        if self.prof:
+            self.prof.disable()
+        outer, parent_state, start_traced, start_snapshot, wall, cpu = state
+        self.wall += time.perf_counter() - wall
+        self.cpu += time.process_time() - cpu
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Not counting what this account's snapshots take
+            self.peak = max(self.peak, self.traced + peak - start_traced)
+            self.traced += current - start_traced
+            if start_snapshot is not None:
+                for where, (size, count) in self.profiler.getAllocations(start_snapshot).items():
+                    total = self.allocations.setdefault(where, [0, 0])
+                    total[0] += size
+                    total[1] += count
+        self.profiler.stack = outer
+        if self.parent is not None:
+            self.parent.end(parent_state)
+
+    def piece(self):
+        return _Piece(self)
+
+    def instrument(self, obj, methods):
+        """ Count every call of the `methods` of `obj` as a piece, wrapping them on this instance only """
+        for name in methods:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self._wrap(method))
+        return obj
+
+    def _wrap(self, method):
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            state = self.begin()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.end(state)
+        return counted
+
+    def close(self):
+        """ Record the phase, unless no piece ran """
+        if self.start is None:
+            return
+        record = {
+            "phase": self.path,
+            "depth": len(self.names) - 1,
+            "start": round(self.start, 6),
+            "wall": round(self.wall, 6),
+            "cpu": round(self.cpu, 6),
+            "pid": os.getpid(),
+        }
+        if self.track_memory:
+            record["memory"] = memory_record(self.peak, self.allocations)
+        self.profiler.records.append(record)
+        if self.prof:
+            os.makedirs(self.profiler.prof_dir, exist_ok=True)
+            self.prof.dump_stats(os.path.join(self.profiler.prof_dir, re.sub(r'[^\w.-]', '_', self.path) + ".prof"))
+        self.reset()
+
+class _Piece:
+    def __init__(self, account):
+        self.account = account
+
+    def __enter__(self):
+        self.state = self.account.begin()
+
+    def __exit__(self, *exc):
+        self.account.end(self.state)
+
+class NullAccount:
+    """ PhaseAccount of a disabled profiler """
+    def reset(self):
+        pass
+
+    def piece(self):
+        return contextlib.nullcontext()
+
+    def instrument(self, obj, methods):
+        return obj
+
+    def close(self):
+        pass
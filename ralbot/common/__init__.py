@@ -0,0 +1,7 @@
+from .__about__ import __version__
+
+from .outputsink import OutputSink, MemorySink, StreamSink
+from .regtable import RegisterTable
+from .nodecache import NodeCache, CachedNode
+from .walker import TableWalker, TableListener, ShardableListener, WalkerAction, ShardedWalk
+from .tracing import Tracer
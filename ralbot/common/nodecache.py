@@ -0,0 +1,127 @@
+import re
+import collections
+
+# RDLFormatCode tags whose HTML depends on the node, not only on the text
+_node_tags = re.compile(r"\[(index|index_parent|name|instname)\]", re.IGNORECASE)
+
+#===============================================================================
+class NodeCache:
+    """
+    Memoized access to the systemrdl nodes of one export.
+
+    systemrdl computes the result of every ``children()``, ``fields()`` and
+    ``get_property()`` call anew, and ``children()`` creates new node objects
+    each time. Templates and hooks that look at the same node several times
+    go through a `CachedNode` instead, which keeps the results for as long as
+    the cache lives, or until the node is released. Create one cache per
+    export: results are never invalidated.
+
+    HTML descriptions are shared between nodes by text, since most nodes of
+    one type carry the same 'desc'.
+
+    `requests` counts the calls made through the cache and `forwarded` the
+    ones passed on to systemrdl, by method name.
+    """
+    def __init__(self):
+        self.nodes = {}
+        self.html_descs = {}
+        self.requests = collections.Counter()
+        self.forwarded = collections.Counter()
+
+    def wrap(self, node):
+        """ Returns the CachedNode of `node`, the same one until it is released """
+        # systemrdl nodes compare by path and are not hashable
+        cached = self.nodes.get(id(node))
+        if cached is None or cached.node is not node:
+            cached = CachedNode(node, self)
+            self.nodes[id(node)] = cached
+        return cached
+
+    def release(self, cached):
+        """ Forget a node returned by wrap(), with everything memoized for it """
+        self.nodes.pop(id(cached.node), None)
+
+    @property
+    def saved(self):
+        """ Number of calls answered without systemrdl """
+        return sum(self.requests.values()) - sum(self.forwarded.values())
+
+#===============================================================================
+class CachedNode:
+    """
+    Read-only view of a systemrdl node that memoizes its queries.
+
+    Method results are kept per argument set. Any other attribute is read from
+    the node once and kept as well. Nodes returned by ``children()`` and
+    ``fields()`` are CachedNodes of the same cache.
+    """
+    def __init__(self, node, cache):
+        self.node = node
+        self._cache = cache
+        self._memo = {}
+
+    def __getattr__(self, name):
+        # Only called for attributes not set yet: keep the node's value so the
+        # next lookup is a plain attribute read
+        value = getattr(self.node, name)
+        setattr(self, name, value)
+        return value
+
+    def __eq__(self, other):
+        if isinstance(other, CachedNode):
+            other = other.node
+        return self.node == other
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return "<CachedNode %r>" % self.node
+
+    #---------------------------------------------------------------------------
+    def _lookup(self, key, method, compute):
+        return self._lookup_in(self._memo, key, method, compute)
+
+    def _lookup_in(self, memo, key, method, compute):
+        self._cache.requests[method] += 1
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        self._cache.forwarded[method] += 1
+        value = memo[key] = compute()
+        return value
+
+    def children(self, unroll=False, skip_not_present=True):
+        children = self._lookup(
+            ("children", unroll, skip_not_present), "children",
+            lambda: [CachedNode(child, self._cache) for child in self.node.children(unroll, skip_not_present)]
+        )
+        return iter(children)
+
+    def fields(self, skip_not_present=True):
+        fields = self._lookup(
+            ("fields", skip_not_present), "fields",
+            lambda: [CachedNode(field, self._cache) for field in self.node.fields(skip_not_present)]
+        )
+        return iter(fields)
+
+    def get_property(self, prop_name, **kwargs):
+        key = ("get_property", prop_name) + tuple(sorted(kwargs.items()))
+        return self._lookup(key, "get_property", lambda: self.node.get_property(prop_name, **kwargs))
+
+    def list_properties(self, list_all=False, include_native=True, include_udp=True):
+        properties = self._lookup(
+            ("list_properties", list_all, include_native, include_udp), "list_properties",
+            lambda: self.node.list_properties(list_all, include_native, include_udp)
+        )
+        return list(properties)
+
+    def get_html_desc(self, markdown_inst=None):
+        desc = self.get_property("desc")
+        if desc is None:
+            return None
+        if _node_tags.search(desc):
+            memo, key = self._memo, ("get_html_desc", id(markdown_inst))
+        else:
+            memo, key = self._cache.html_descs, (desc, id(markdown_inst))
+        return self._lookup_in(memo, key, "get_html_desc", lambda: self.node.get_html_desc(markdown_inst))
@@ -0,0 +1,376 @@
+import os
+import io
+import hashlib
+import tempfile
+import threading
+import contextlib
+import collections
+
+# Mode given to new files, as open() would
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+# Characters (or bytes) a PendingFile collects before writing them out
+BUFFER_SIZE = 1 << 16
+
+# Characters a spool keeps in memory before moving to a temporary file
+SPOOL_SIZE = 1 << 20
+
+def spool():
+    """
+    Text buffer for an output section written before the sections preceding
+    it in the file. Kept in memory while small, in a temporary file beyond.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode="w+", encoding="utf-8", newline="")
+
+def copy_spool(buffer, f):
+    """ Write the content of a spool() to `f` and close it """
+    buffer.seek(0)
+    while True:
+        chunk = buffer.read(BUFFER_SIZE)
+        if not chunk:
+            break
+        f.write(chunk)
+    buffer.close()
+
+def read_spool(buffer):
+    """ Returns the content of a spool() and closes it """
+    buffer.seek(0)
+    content = buffer.read()
+    buffer.close()
+    return content
+
+def spool_digest(buffers):
+    """ Returns a hash of the content of the spool()s `buffers`, leaving them open """
+    h = hashlib.sha256()
+    for buffer in buffers:
+        buffer.seek(0)
+        while True:
+            chunk = buffer.read(BUFFER_SIZE)
+            if not chunk:
+                break
+            h.update(chunk.encode("utf-8"))
+    return h.digest()
+
+#===============================================================================
+class OutputSink:
+    """
+    Writes generated files only when their content changed.
+
+    Every file is compared against what is already on disk. Unchanged files
+    are left alone, so their modification time is kept and make-style tools
+    and file watchers see no change. Changed files are written to a temporary
+    file next to the target and renamed over it, so a reader never sees a
+    half-written file.
+
+    Large outputs can be written in pieces with create(), which streams them
+    to the temporary file and compares them when done, so their whole content
+    is never held in memory.
+
+    `written` and `skipped` count the files written and left alone. A sink
+    can be shared by exports running in several threads.
+    """
+    def __init__(self):
+        self.written = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def count(self, written):
+        """ Count a file as written, or as left alone """
+        with self.lock:
+            if written:
+                self.written += 1
+            else:
+                self.skipped += 1
+
+    #---------------------------------------------------------------------------
+    def isUnchanged(self, path, content):
+        try:
+            if os.path.getsize(path) != len(content):
+                return False
+            with open(path, 'rb') as f:
+                return f.read() == content
+        except OSError:
+            return False
+
+    def write_bytes(self, path, content):
+        """ Write `content` to `path` unless the file already holds it. Returns True if written """
+        if self.isUnchanged(path, content):
+            self.count(False)
+            return False
+
+        dirname = os.path.dirname(path) or "."
+        os.makedirs(dirname, exist_ok=True)
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode = NEW_FILE_MODE
+
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix="." + os.path.basename(path) + ".")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.count(True)
+        return True
+
+    def write_file(self, path, text):
+        """ Write the string `text` to `path` unless the file already holds it """
+        return self.write_bytes(path, text.encode("utf-8"))
+
+    def makedirs(self, path):
+        """ Make sure the directory `path` exists """
+        os.makedirs(path, exist_ok=True)
+
+    def remove_stale(self, dirname, keep, suffix=""):
+        """
+        Remove the files of `dirname` ending with `suffix` that are not among
+        the paths `keep`, left there by earlier runs. Returns their paths.
+        """
+        keep = {os.path.normpath(path) for path in keep}
+        removed = []
+        try:
+            names = sorted(os.listdir(dirname))
+        except OSError:
+            return removed
+        for name in names:
+            path = os.path.join(dirname, name)
+            if name.endswith(suffix) and os.path.normpath(path) not in keep and os.path.isfile(path):
+                os.remove(path)
+                removed.append(path)
+        return removed
+
+    def create(self, path, mode='w'):
+        """
+        Returns a PendingFile for writing `path` in pieces. `mode` is 'w' or
+        'wb'. Its content replaces `path` on commit(), unless the file
+        already holds it, and is dropped by discard().
+        """
+        return PendingFile(self, path, mode)
+
+    @contextlib.contextmanager
+    def open(self, path, mode='w'):
+        """
+        File object whose content is written to `path` when the ``with``
+        block exits without an exception. `mode` is 'w' or 'wb'.
+        """
+        f = self.create(path, mode)
+        try:
+            yield f
+        except BaseException:
+            f.discard()
+            raise
+        f.commit()
+
+    #---------------------------------------------------------------------------
+    def copy_file(self, src, dst):
+        """ Copy `src` to `dst` unless `dst` already has the same content """
+        with open(src, 'rb') as f:
+            return self.write_bytes(dst, f.read())
+
+    def copy_tree(self, src_dir, dst_dir):
+        """
+        Copy every file below `src_dir` to `dst_dir`, skipping unchanged ones.
+        Returns the source files.
+        """
+        src_files = []
+        for dirpath, dirnames, filenames in os.walk(src_dir):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, src_dir)
+            for filename in sorted(filenames):
+                src_files.append(os.path.join(dirpath, filename))
+                self.copy_file(
+                    src_files[-1],
+                    os.path.normpath(os.path.join(dst_dir, rel_dir, filename))
+                )
+        return src_files
+
+#===============================================================================
+class PendingFile:
+    """
+    Output file being written in pieces to a temporary file next to its
+    target. Writes are collected and written out BUFFER_SIZE at a time.
+
+    There is deliberately no finalizer: a process forked while the file is
+    pending must be able to drop its copy without flushing or removing it.
+    """
+    def __init__(self, sink, path, mode='w'):
+        self.sink = sink
+        self.path = path
+        self.binary = 'b' in mode
+        self.buffer = []
+        self.size = 0
+        dirname = os.path.dirname(path) or "."
+        os.makedirs(dirname, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=dirname, prefix="." + os.path.basename(path) + ".")
+        self.file = io.FileIO(fd, 'w')
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= BUFFER_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        data = b"".join(self.buffer) if self.binary else "".join(self.buffer).encode("utf-8")
+        self.buffer = []
+        self.size = 0
+        view = memoryview(data)
+        while view:
+            view = view[self.file.write(view):]
+
+    def commit(self):
+        """ Move the content to the target unless it already holds it. Returns True if written """
+        self.flush()
+        self.file.close()
+        if self.isUnchanged():
+            os.remove(self.tmp_path)
+            self.sink.count(False)
+            return False
+        try:
+            try:
+                mode = os.stat(self.path).st_mode & 0o7777
+            except OSError:
+                mode = NEW_FILE_MODE
+            os.chmod(self.tmp_path, mode)
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            os.remove(self.tmp_path)
+            raise
+        self.sink.count(True)
+        return True
+
+    def discard(self):
+        """ Drop the content, leaving the target alone """
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            # A commit that failed already removed it
+            pass
+
+    def isUnchanged(self):
+        try:
+            if os.path.getsize(self.path) != os.path.getsize(self.tmp_path):
+                return False
+            with open(self.path, 'rb') as old, open(self.tmp_path, 'rb') as new:
+                while True:
+                    old_chunk = old.read(BUFFER_SIZE)
+                    if old_chunk != new.read(BUFFER_SIZE):
+                        return False
+                    if not old_chunk:
+                        return True
+        except OSError:
+            return False
+
+class BufferedFile:
+    """ PendingFile of a sink that takes the whole content at once """
+    def __init__(self, sink, path, mode='w'):
+        self.sink = sink
+        self.path = path
+        self.buffer = io.BytesIO() if 'b' in mode else io.StringIO()
+        self.write = self.buffer.write
+
+    def flush(self):
+        pass
+
+    def commit(self):
+        content = self.buffer.getvalue()
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        return self.sink.write_bytes(self.path, content)
+
+    def discard(self):
+        self.buffer = None
+
+#===============================================================================
+class MemorySink(OutputSink):
+    """
+    Keeps the generated files in memory instead of writing them to disk.
+
+    `files` maps the path of every file an exporter wrote to its content, as
+    bytes, in the order they were written. Paths are only names here: no
+    directory is created.
+    """
+    def __init__(self):
+        super().__init__()
+        self.files = collections.OrderedDict()
+
+    def write_bytes(self, path, content):
+        self.files[path] = bytes(content)
+        self.count(True)
+        return True
+
+    def create(self, path, mode='w'):
+        return BufferedFile(self, path, mode)
+
+    def makedirs(self, path):
+        pass
+
+    def remove_stale(self, dirname, keep, suffix=""):
+        return []
+
+    def getvalue(self, path=None):
+        """ Returns the content of `path`, or of the only file written if not given """
+        if path is None:
+            if len(self.files) != 1:
+                raise ValueError("%d files were written, give the path of one" % len(self.files))
+            path = next(iter(self.files))
+        return self.files[path]
+
+#===============================================================================
+class StreamSink(OutputSink):
+    """
+    Writes the generated files to a caller-supplied file object.
+
+    Meant for exporters writing a single file. The content of every file is
+    passed on to `stream` as it is generated, as text if it is a text stream
+    and as bytes otherwise, and is not kept.
+    """
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.text = isinstance(stream, io.TextIOBase)
+
+    def write_bytes(self, path, content):
+        self.stream.write(content.decode("utf-8") if self.text else content)
+        self.count(True)
+        return True
+
+    def create(self, path, mode='w'):
+        return StreamFile(self, 'b' in mode)
+
+    def makedirs(self, path):
+        pass
+
+    def remove_stale(self, dirname, keep, suffix=""):
+        return []
+
+class StreamFile:
+    """ PendingFile of a StreamSink """
+    def __init__(self, sink, binary):
+        self.sink = sink
+        self.convert = binary == sink.text
+
+    def write(self, data):
+        if self.convert:
+            data = data.decode("utf-8") if self.sink.text else data.encode("utf-8")
+        return self.sink.stream.write(data)
+
+    def flush(self):
+        pass
+
+    def commit(self):
+        self.sink.count(True)
+        return True
+
+    def discard(self):
+        pass
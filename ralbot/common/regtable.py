@@ -0,0 +1,174 @@
+from systemrdl.node import RootNode, AddrmapNode, RegfileNode, MemNode, RegNode, FieldNode
+
+#===============================================================================
+# Table entries
+#
+# Plain __slots__ records holding everything the exporters look up, so that
+# each property is read from the systemrdl model once. `node` is kept for the
+# few users that need the full Node API (templates, vendor extension hooks,
+# message source references).
+#===============================================================================
+class Entry:
+    __slots__ = ("node", "parent", "inst_name", "name", "desc", "is_present")
+
+class AddressableEntry(Entry):
+    # Arrays are not unrolled: one entry stands for every element, and
+    # absolute_address is the address of element 0.
+    __slots__ = (
+        "is_array", "array_dimensions", "array_stride",
+        "raw_address_offset", "absolute_address", "size",
+    )
+
+class BlockEntry(AddressableEntry):
+    __slots__ = ("children",)
+
+class AddrmapEntry(BlockEntry):
+    __slots__ = ()
+
+class RegfileEntry(BlockEntry):
+    __slots__ = ()
+
+class MemEntry(BlockEntry):
+    __slots__ = ("memwidth", "mementries", "sw")
+
+class RegEntry(AddressableEntry):
+    __slots__ = (
+        "fields", "regwidth", "accesswidth",
+        "has_sw_readable", "has_sw_writable",
+    )
+
+class FieldEntry(Entry):
+    __slots__ = (
+        "low", "high", "lsb", "msb", "width", "reset",
+        "sw", "is_sw_readable", "is_sw_writable", "is_volatile",
+        "rclr", "rset", "woclr", "woset", "onread", "onwrite",
+        "encode", "donttest",
+    )
+
+#===============================================================================
+class RegisterTable:
+    """
+    Flattened register model of an elaborated addrmap or mem.
+
+    Built in a single pass over the systemrdl tree. `blocks` (addrmaps,
+    regfiles and mems), `registers` and `fields` list every entry in tree
+    order, including the ones whose 'ispresent' is false. `top` is the entry
+    of the exported node. Entries link to their `parent` and, for blocks and
+    registers, to their `children` and `fields`.
+    """
+    def __init__(self, node):
+        # If it is the root node, skip to top addrmap
+        if isinstance(node, RootNode):
+            node = node.top
+
+        self.blocks = []
+        self.registers = []
+        self.fields = []
+        self.top = self.add_node(node, None, node.absolute_address - node.raw_address_offset)
+
+    #---------------------------------------------------------------------------
+    def add_node(self, node, parent, base_address):
+        if isinstance(node, RegNode):
+            entry = RegEntry()
+        elif isinstance(node, AddrmapNode):
+            entry = AddrmapEntry()
+        elif isinstance(node, RegfileNode):
+            entry = RegfileEntry()
+        elif isinstance(node, MemNode):
+            entry = MemEntry()
+        else:
+            # Signals
+            return None
+
+        self.fill_entry(entry, node, parent)
+        inst = node.inst
+        entry.is_array = inst.is_array
+        entry.array_dimensions = inst.array_dimensions
+        entry.array_stride = inst.array_stride
+        entry.raw_address_offset = inst.addr_offset
+        entry.absolute_address = base_address + inst.addr_offset
+        entry.size = node.size
+
+        if isinstance(entry, RegEntry):
+            self.registers.append(entry)
+            entry.regwidth = node.get_property("regwidth")
+            entry.accesswidth = node.get_property("accesswidth")
+            entry.fields = [self.add_field(field, entry) for field in node.fields(skip_not_present=False)]
+            present = [field for field in entry.fields if field.is_present]
+            entry.has_sw_readable = any(field.is_sw_readable for field in present)
+            entry.has_sw_writable = any(field.is_sw_writable for field in present)
+        else:
+            self.blocks.append(entry)
+            if isinstance(entry, MemEntry):
+                entry.memwidth = node.get_property("memwidth")
+                entry.mementries = node.get_property("mementries")
+                entry.sw = node.get_property("sw")
+            entry.children = []
+            for child in node.children(skip_not_present=False):
+                child_entry = self.add_node(child, entry, entry.absolute_address)
+                if child_entry is not None:
+                    entry.children.append(child_entry)
+        return entry
+
+    def add_field(self, node, parent):
+        entry = FieldEntry()
+        self.fill_entry(entry, node, parent)
+        self.fields.append(entry)
+        inst = node.inst
+        entry.low = node.low
+        entry.high = node.high
+        entry.lsb = inst.lsb
+        entry.msb = inst.msb
+        entry.width = node.width
+        entry.reset = node.get_property("reset")
+        entry.sw = node.get_property("sw")
+        entry.is_sw_readable = node.is_sw_readable
+        entry.is_sw_writable = node.is_sw_writable
+        entry.is_volatile = node.is_volatile
+        entry.rclr = node.get_property("rclr")
+        entry.rset = node.get_property("rset")
+        entry.woclr = node.get_property("woclr")
+        entry.woset = node.get_property("woset")
+        entry.onread = node.get_property("onread")
+        entry.onwrite = node.get_property("onwrite")
+        entry.encode = node.get_property("encode")
+        entry.donttest = node.get_property("donttest")
+        return entry
+
+    def fill_entry(self, entry, node, parent):
+        entry.node = node
+        entry.parent = parent
+        entry.inst_name = node.inst.inst_name
+        entry.name = node.get_property("name", default=None)
+        entry.desc = node.get_property("desc")
+        entry.is_present = node.get_property("ispresent")
+
+#===============================================================================
+def present(entries):
+    """ The entries whose 'ispresent' property is not false """
+    return [entry for entry in entries if entry.is_present]
+
+def is_exploded(top, skip_not_present=True):
+    """
+    True if the top-level node should be exploded across multiple address
+    blocks: it is an addrmap and its children are exclusively non-array
+    addrmaps or mems.
+    """
+    if not isinstance(top, AddrmapEntry):
+        return False
+    children = present(top.children) if skip_not_present else top.children
+    if not children:
+        return False
+    for child in children:
+        if not isinstance(child, (AddrmapEntry, MemEntry)) or child.is_array:
+            return False
+    return True
+
+def address_blocks(top, skip_not_present=True):
+    """
+    The entries exported as address blocks: the children of an exploded top,
+    otherwise the top itself.
+    """
+    if is_exploded(top, skip_not_present):
+        return top.children if not skip_not_present else present(top.children)
+    return [top]
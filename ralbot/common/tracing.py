@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import functools
+
+# Exporter methods timed by Tracer.instrument(), where the exporter has them
+TRACED_METHODS = (
+    "add_addressBlock",
+    "add_registerFile",
+    "add_registerBlock",
+    "add_register",
+    "add_memFile",
+    "render_page",
+)
+
+#===============================================================================
+class Tracer:
+    """
+    Records spans of an export as Chrome trace events, to be loaded in a
+    trace viewer such as chrome://tracing or Perfetto.
+
+    Spans come from the walk, one per addrmap, regfile, mem and register
+    covering its whole subtree (see TableWalker's `tracer`), and from the
+    exporter methods listed in TRACED_METHODS (see instrument()).
+
+    Nothing is traced unless `enabled`: instrument() leaves exporters as they
+    are and walkers ignore a disabled tracer, so an untraced export runs the
+    same code as one without a tracer. `t0` is the time origin of the events,
+    by default when the tracer is created.
+    """
+    def __init__(self, enabled=False, t0=None):
+        self.enabled = enabled
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.events = []
+
+    def instrument(self, exporter, methods=TRACED_METHODS):
+        """
+        Time every call to the `methods` of `exporter` by replacing them, on
+        this instance only, with traced wrappers. Returns `exporter`.
+        """
+        if not self.enabled:
+            return exporter
+        category = type(exporter).__name__
+        for name in methods:
+            method = getattr(exporter, name, None)
+            if method is not None:
+                setattr(exporter, name, self._wrap(method, name, category))
+        return exporter
+
+    def _wrap(self, method, name, category):
+        @functools.wraps(method)
+        def traced(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add_span(name, category, start, time.perf_counter(), span_args(args))
+        return traced
+
+    def add_span(self, name, category, start, end, args=None):
+        """ Record a span between two time.perf_counter() readings """
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.t0) * 1e6, 3),
+            "dur": round((end - start) * 1e6, 3),
+            "pid": os.getpid(),
+            "tid": 0,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def add_phases(self, records):
+        """ Record the phases of a PhaseProfiler sharing this tracer's `t0` """
+        for record in records:
+            self.events.append({
+                "name": record["phase"].rsplit("/", 1)[-1],
+                "cat": "phase",
+                "ph": "X",
+                "ts": round(record["start"] * 1e6, 3),
+                "dur": round(record["wall"] * 1e6, 3),
+                "pid": record["pid"],
+                "tid": 0,
+                "args": {"phase": record["phase"], "cpu": record["cpu"]},
+            })
+
+    def merge(self, events):
+        """ Add events recorded by a forked worker """
+        self.events.extend(events)
+
+    def report(self):
+        return {
+            "traceEvents": sorted(self.events, key=lambda e: (e["pid"], e["ts"], -e["dur"])),
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f)
+
+def span_args(args):
+    """ Describes the nodes and templates among a traced call's arguments """
+    described = {}
+    for arg in args:
+        # Register table entries and CachedNodes keep their systemrdl node
+        node = getattr(arg, "node", None)
+        if node is not None and hasattr(node, "get_path"):
+            described["node"] = node.get_path()
+        elif hasattr(arg, "render") and isinstance(getattr(arg, "name", None), str):
+            described["template"] = arg.name
+    return described
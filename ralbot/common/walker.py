@@ -0,0 +1,346 @@
+import time
+import enum
+
+from .regtable import AddrmapEntry, RegfileEntry, MemEntry, RegEntry, FieldEntry
+
+#===============================================================================
+class WalkerAction(enum.Enum):
+    """ Returned by an ``enter_*()`` callback to steer the walk """
+    #: Visit the entry's children (same as returning None)
+    Continue = 0
+    #: Do not visit the entry's children. Its ``exit_*()`` callback still runs.
+    SkipDescendants = 1
+
+#===============================================================================
+class TableListener:
+    """
+    Base class of RegisterTable traversal listeners.
+
+    Callbacks mirror systemrdl's ``RDLListener`` but receive table entries.
+    Listeners that want the entries whose 'ispresent' property is false set
+    `skip_not_present` to False.
+
+    Listeners that can take part in a `ShardedWalk` derive from
+    `ShardableListener`.
+
+    `walk_phase` names the time spent in the callbacks in profile reports.
+    """
+    skip_not_present = True
+    walk_phase = "walk"
+
+    def enter_Addrmap(self, entry):
+        pass
+
+    def exit_Addrmap(self, entry):
+        pass
+
+    def enter_Regfile(self, entry):
+        pass
+
+    def exit_Regfile(self, entry):
+        pass
+
+    def enter_Mem(self, entry):
+        pass
+
+    def exit_Mem(self, entry):
+        pass
+
+    def enter_Reg(self, entry):
+        pass
+
+    def exit_Reg(self, entry):
+        pass
+
+    def enter_Field(self, entry):
+        pass
+
+    def exit_Field(self, entry):
+        pass
+
+class ShardableListener(TableListener):
+    """
+    Base class of the TableListeners that can take part in a `ShardedWalk`.
+
+    A listener that cannot shard a given walk, depending on its options,
+    clears `shardable`.
+    """
+    shardable = True
+
+    def shard_begin(self, parent, start, stop):
+        """
+        Called before walking ``parent.children[start:stop]`` as one shard,
+        in the state the listener had right after entering `parent`.
+        """
+        raise NotImplementedError
+
+    def shard_end(self):
+        """ Returns what the shard walked since shard_begin() added to the output """
+        raise NotImplementedError
+
+    def shard_merge(self, parent, fragment):
+        """ Add the fragment returned by shard_end() for the next shard of `parent` """
+        raise NotImplementedError
+
+def is_shardable(listener):
+    """ True if `listener` can take part in a ShardedWalk """
+    return isinstance(listener, ShardableListener) and listener.shardable
+
+#===============================================================================
+# Callback names of each entry type
+_callbacks = {
+    AddrmapEntry: ("enter_Addrmap", "exit_Addrmap"),
+    RegfileEntry: ("enter_Regfile", "exit_Regfile"),
+    MemEntry: ("enter_Mem", "exit_Mem"),
+    RegEntry: ("enter_Reg", "exit_Reg"),
+    FieldEntry: ("enter_Field", "exit_Field"),
+}
+
+_span_names = {entry_type: entry_type.__name__[:-len("Entry")] for entry_type in _callbacks}
+
+# Every method a walk calls on its listeners
+CALLBACKS = tuple(name for names in _callbacks.values() for name in names) + (
+    "shard_begin", "shard_end", "shard_merge",
+)
+
+class TableWalker:
+    """
+    Walks a RegisterTable once for any number of listeners.
+
+    Each entry is visited as follows, calling every listener in the order they
+    are given:
+
+    1. Run the type-specific ``enter_*()`` callback
+    2. Traverse the children (blocks) or fields (registers), for the listeners
+       that did not return ``WalkerAction.SkipDescendants``
+    3. Run the type-specific ``exit_*()`` callback
+    """
+    def __init__(self, catch=(), tracer=None):
+        """
+        Parameters
+        ----------
+        catch : tuple
+            Exception types that only stop the listener whose callback raised
+            them: it gets no further callbacks and the walk goes on for the
+            others. Any other exception aborts the walk.
+        tracer : Tracer
+            If enabled, records a span for every entry above the fields,
+            covering its subtree.
+        """
+        self.catch = catch
+        self.errors = {}
+        self.tracer = tracer
+        if tracer is not None and tracer.enabled:
+            self._walk = self._traced_walk
+
+    def walk(self, entry, *listeners: TableListener):
+        """
+        Traverse `entry` and its descendants.
+        Listener traversal includes `entry` itself.
+        Returns {listener: exception} for the listeners stopped by an exception
+        listed in `catch`.
+        """
+        self.errors = {}
+        self._walk(entry, self._bind(listeners))
+        return self.errors
+
+    def _bind(self, listeners):
+        bound = []
+        for listener in listeners:
+            callbacks = {}
+            for entry_type, (enter, exit) in _callbacks.items():
+                callbacks[entry_type] = (getattr(listener, enter), getattr(listener, exit))
+            bound.append((listener, listener.skip_not_present, callbacks))
+        return bound
+
+    def _walk(self, entry, listeners):
+        entered, descend = self._enter(entry, listeners)
+
+        if descend:
+            entry_type = type(entry)
+            if entry_type is RegEntry:
+                children = entry.fields
+            elif entry_type is FieldEntry:
+                children = ()
+            else:
+                children = entry.children
+            for child in children:
+                self._walk(child, descend)
+
+        self._exit(entry, entered)
+
+    def _traced_walk(self, entry, listeners):
+        entry_type = type(entry)
+        if entry_type is FieldEntry:
+            return TableWalker._walk(self, entry, listeners)
+        start = time.perf_counter()
+        try:
+            TableWalker._walk(self, entry, listeners)
+        finally:
+            self.tracer.add_span(
+                _span_names[entry_type], "walk", start, time.perf_counter(),
+                {"node": entry.node.get_path()}
+            )
+
+    def _enter(self, entry, listeners):
+        """ Runs the enter_*() callbacks. Returns the entered listeners and the ones to descend with """
+        entry_type = type(entry)
+        entered = []
+        descend = []
+        for bound in listeners:
+            listener, skip_not_present, callbacks = bound
+            if skip_not_present and not entry.is_present:
+                continue
+            if self.errors and listener in self.errors:
+                continue
+            enter, exit = callbacks[entry_type]
+            try:
+                action = enter(entry)
+            except self.catch as e:
+                self.errors[listener] = e
+                continue
+            entered.append((listener, exit))
+            if action is not WalkerAction.SkipDescendants:
+                descend.append(bound)
+        return entered, descend
+
+    def _exit(self, entry, entered):
+        for listener, exit in entered:
+            if self.errors and listener in self.errors:
+                continue
+            try:
+                exit(entry)
+            except self.catch as e:
+                self.errors[listener] = e
+
+#===============================================================================
+class ShardedWalk:
+    """
+    Walk of a RegisterTable entry whose children are split into shards that
+    are walked apart, typically in forked worker processes.
+
+    1. enter() runs the entry's ``enter_*()`` callbacks
+    2. walk_shard() walks one shard of children and returns its fragments.
+       Every shard starts from the listeners' state right after enter(), so
+       shards can be walked in any order and in any process.
+    3. merge() adds the fragments of every shard, in shard order
+    4. exit() runs the entry's ``exit_*()`` callbacks
+
+    Merging leaves the listeners as a single walk would, so their output does
+    not depend on how the walk was split. Unless every listener is shardable,
+    the children are kept as a single shard: with less than two shards, walk()
+    the entry serially instead.
+    """
+    def __init__(self, entry, listeners, shards, catch=(), tracer=None):
+        """
+        Parameters
+        ----------
+        entry:
+            Entry whose children are split, usually the table's top.
+        listeners: list
+            TableListeners, walked apart only if they are all
+            `ShardableListener`s.
+        shards: int
+            Number of shards to split the children into, at most.
+        catch: tuple
+            Exception types that stop the listener raising them, as for
+            TableWalker.
+        tracer: Tracer
+            Traces the walk of the shards, as for TableWalker.
+        """
+        self.entry = entry
+        self.listeners = list(listeners)
+        # Listeners are identified by index in the results of the shards
+        self.listener_indexes = {listener: i for i, listener in enumerate(self.listeners)}
+        self.walker = TableWalker(catch, tracer)
+        if not all(is_shardable(listener) for listener in self.listeners):
+            shards = 1
+        self.shards = split_children(entry, shards)
+        self.errors = {}
+        self.entered = []
+        self.descend = []
+
+    def walk(self):
+        """
+        Walk the entry in this process without splitting it, for the walks
+        with less than two shards. Returns {listener: exception} as
+        TableWalker.walk() does.
+        """
+        self.errors = self.walker.walk(self.entry, *self.listeners)
+        return self.errors
+
+    def enter(self):
+        self.walker.errors = self.errors
+        self.entered, self.descend = self.walker._enter(self.entry, self.walker._bind(self.listeners))
+
+    def walk_shard(self, index):
+        """
+        Walk shard `index`. Returns ({listener index: fragment},
+        {listener index: exception}) of the listeners walking it.
+        """
+        start, stop = self.shards[index]
+        walker = self.walker
+        walker.errors = {}
+        descend = []
+        for bound in self.descend:
+            listener = bound[0]
+            if listener in self.errors:
+                continue
+            try:
+                listener.shard_begin(self.entry, start, stop)
+            except walker.catch as e:
+                walker.errors[listener] = e
+                continue
+            descend.append(bound)
+
+        for child in self.entry.children[start:stop]:
+            walker._walk(child, descend)
+
+        # Listeners stopped by shard_begin() are reported too
+        errors = {self.listener_indexes[listener]: e for listener, e in walker.errors.items()}
+        fragments = {}
+        for bound in descend:
+            listener = bound[0]
+            if listener not in walker.errors:
+                fragments[self.listener_indexes[listener]] = listener.shard_end()
+        return fragments, errors
+
+    def merge(self, results):
+        """ Add the results of walk_shard() for every shard, in shard order """
+        for fragments, errors in results:
+            for index, e in errors.items():
+                self.errors.setdefault(self.listeners[index], e)
+            for index in sorted(fragments):
+                listener = self.listeners[index]
+                if listener not in self.errors:
+                    listener.shard_merge(self.entry, fragments[index])
+
+    def exit(self):
+        """ Returns {listener: exception} for the listeners stopped during the walk """
+        self.walker.errors = self.errors
+        self.walker._exit(self.entry, self.entered)
+        return self.errors
+
+def subtree_size(entry):
+    """ Number of entries below and including `entry`, fields included """
+    if isinstance(entry, RegEntry):
+        return 1 + len(entry.fields)
+    return 1 + sum(subtree_size(child) for child in entry.children)
+
+def split_children(entry, shards):
+    """
+    Split the children of `entry` into at most `shards` contiguous ranges of
+    similar subtree size. Returns a list of (start, stop) indexes.
+    """
+    sizes = [subtree_size(child) for child in entry.children]
+    total = sum(sizes)
+    ranges = []
+    start = 0
+    done = 0
+    for index, size in enumerate(sizes):
+        done += size
+        # Close the shard once it reaches its share of what is done so far
+        if done * shards >= total * (len(ranges) + 1) or index == len(sizes) - 1:
+            ranges.append((start, index + 1))
+            start = index + 1
+    return ranges
@@ -1,14 +1,17 @@
 import os
-from systemrdl.node import AddressableNode, RootNode
-from systemrdl.node import AddrmapNode, MemNode
-from systemrdl.node import RegNode, RegfileNode, FieldNode
+from systemrdl.node import RootNode, AddrmapNode
+from ..common import OutputSink
+from ..common.outputsink import spool, read_spool
+from ..common.regtable import RegisterTable, address_blocks
+from ..common.walker import TableWalker, ShardableListener, WalkerAction
 
 #===============================================================================
 class headerGenExporter:
+
     def __init__(self, **kwargs):
 
         self.languages = kwargs.pop("languages", "verilog")
-        self.headerFileContent = list()
+        self.output_sink = kwargs.pop("output_sink", None) or OutputSink()
 
         # Check for stray kwargs
         if kwargs:
@@ -21,19 +24,56 @@ class headerGenExporter:
             self.definePrefix = '#'
             self.hexPrefix = '0x'
 
-        self.baseAddressName = ""
-        self.filename = ""
-        self.dirname = "."
         self.define = self.definePrefix + 'define '
         self.ifnDef = self.definePrefix + 'ifndef '
         self.ifDef = self.definePrefix + 'ifdef '
         self.endIf = self.definePrefix + 'endif'
 
     #---------------------------------------------------------------------------
-    def export(self, node, path):
+    def export(self, node, path, table=None):
+        context = self.begin(node, path, table)
+        try:
+            TableWalker().walk(context.table.top, context)
+            context.finish()
+        except BaseException:
+            context.abort()
+            raise
+
+    def begin(self, node, path, table=None):
+        """
+        Prepare an export of `node` to `path` and return its headerGenContext.
+        The header content is then emitted by walking the context's register
+        `table` with the context as listener, and written out by its finish().
+
+        Every export has a context of its own: the exporter only holds the
+        options, so it can run any number of exports, in turn or concurrently.
+        """
+        return headerGenContext(self, node, path, table)
+
+#===============================================================================
+class headerGenContext(ShardableListener):
+    """
+    State of one export of a headerGenExporter, and listener of its walk.
+
+    The header is written to the output as it is emitted, so it is never
+    held in memory whole.
+    """
+
+    def __init__(self, exporter, node, path, table=None):
+        self.exporter = exporter
+        self.output_sink = exporter.output_sink
+        self.languages = exporter.languages
+        self.hexPrefix = exporter.hexPrefix
+        self.define = exporter.define
+        self.ifnDef = exporter.ifnDef
+        self.endIf = exporter.endIf
+        self.baseAddressName = ""
+        self.dirname = "."
+        self._outputHeaderFile = None
+
         # Make sure output directory structure exists
         if os.path.dirname(path):
-            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.output_sink.makedirs(os.path.dirname(path))
             self.dirname = os.path.split(path)[0]
         filename = os.path.basename(path)
         filename = os.path.splitext(filename)[0]
@@ -41,8 +81,7 @@ class headerGenExporter:
             self.filename = filename + ".svh"
         elif self.languages == 'c' or self.languages == 'cpp':
             self.filename = filename + ".h"
-        filename = self.filename.upper().replace('.', '_')
-        self.genDefineMacro(filename)
+        tag = self.filename.upper().replace('.', '_')
 
         # If it is the root node, skip to top addrmap
         if isinstance(node, RootNode):
@@ -51,77 +90,85 @@ class headerGenExporter:
         if not isinstance(node, AddrmapNode):
             raise TypeError("'node' argument expects type AddrmapNode. Got '%s'" % type(node).__name__)
 
-        # Determine if top-level node should be exploded across multiple
-        # addressBlock groups
-        explode = False
-
-        if isinstance(node, AddrmapNode):
-            addrblockable_children = 0
-            non_addrblockable_children = 0
-
-            for child in node.children(unroll=False):
-                if not isinstance(child, AddressableNode):
-                    continue
-
-                if isinstance(child, (AddrmapNode, MemNode)) and not child.is_array:
-                    addrblockable_children += 1
-                else:
-                    non_addrblockable_children += 1
-
-            if (non_addrblockable_children == 0) and (addrblockable_children >= 1):
-                explode = True
-
-        # Do the export!
-        if explode:
-            # top-node becomes the memoryMap
-            # Top-node's children become their own addressBlocks
-            for child in node.children(unroll=True):
-                if not isinstance(child, AddressableNode):
-                    continue
-                self.add_addressBlock(child)
-        else:
-            # Not exploding apart the top-level node
-            # Wrap it in a dummy memoryMap that bears it's name
-            # Export top-level node as a single addressBlock
-            self.add_addressBlock(node)
-
-        self.headerFileContent.append("\n" + self.endIf)
-        # Write out UVM RegModel file
-        with open(os.path.join(self.dirname, self.filename), "w") as f:
-            f.write('\n'.join(self.headerFileContent))
+        if table is None:
+            table = RegisterTable(node)
+
+        self.outputFile = self.output_sink.create(os.path.join(self.dirname, self.filename))
+        self.headerFile = self.outputFile
+        self.genDefineMacro(tag)
+
+        # If the top-level node is exploded, its children are the address
+        # blocks. Otherwise the top-level node is exported as a single one.
+        self.addressBlocks = set(address_blocks(table.top))
+        self.table = table
+
+    def finish(self):
+        self.headerFile.write("\n" + self.endIf)
+        self.outputFile.commit()
+        self.outputFile = self.headerFile = None
+
+    def abort(self):
+        """ Drop the output of an export that will not be finished """
+        if self.outputFile is not None:
+            self.outputFile.discard()
+        self.outputFile = self.headerFile = None
     
+    #---------------------------------------------------------------------------
+    def shard_begin(self, parent, start, stop):
+        self._outputHeaderFile = self.headerFile
+        self.headerFile = spool()
+
+    def shard_end(self):
+        content = read_spool(self.headerFile)
+        self.headerFile = self._outputHeaderFile
+        return content
+
+    def shard_merge(self, parent, fragment):
+        self.headerFile.write(fragment)
+
     #---------------------------------------------------------------------------
     def genDefineMacro(self, tag): 
-        self.headerFileContent.append(self.ifnDef + " __%s__" % tag)
-        self.headerFileContent.append(self.define + " __%s__\n" % tag)
+        self.add_line(self.ifnDef + " __%s__" % tag)
+        self.add_line(self.define + " __%s__\n" % tag)
+    #---------------------------------------------------------------------------
+    def add_line(self, line):
+        self.headerFile.write(line + "\n")
     #---------------------------------------------------------------------------
     def add_content(self, content):
-        self.headerFileContent.append(self.define + content)
+        self.add_line(self.define + content)
+    #---------------------------------------------------------------------------
+    # Listener callbacks
+    #---------------------------------------------------------------------------
+    def enter_Addrmap(self, entry):
+        if entry in self.addressBlocks:
+            self.add_addressBlock(entry)
+
+    def enter_Mem(self, entry):
+        if entry in self.addressBlocks:
+            self.add_addressBlock(entry)
+        else:
+            # Mems nested in hierarchy are not exported
+            return WalkerAction.SkipDescendants
+
+    def enter_Reg(self, entry):
+        self.add_register(entry.parent, entry)
+
+    def enter_Field(self, entry):
+        self.add_field(entry.parent, entry)
+
     #---------------------------------------------------------------------------
     def add_addressBlock(self, node):
 
         self.add_content("%s 0" % ("%s_BASE_ADDR" % node.inst_name.upper()))   
         self.baseAddressName = ("`%s_BASE_ADDR" % node.inst_name.upper()) if self.languages == "verilog" else ("%s_BASE_ADDR" % node.inst_name.upper())
 
-        for child in node.children():
-            if isinstance(child, RegNode):
-                self.add_register(node, child)
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
-                self.add_registerFile(child)
-
-    def add_registerFile(self, node):
-        for child in node.children():
-            if isinstance(child, RegNode):
-                self.add_register(node, child)
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
-                self.add_registerFile(child)
     #---------------------------------------------------------------------------
     def add_register(self, parent, node):
         X = "X``" if self.languages == "verilog" else "X"
-        self.headerFileContent.append("//register: %s" % node.inst_name)
+        self.add_line("//register: %s" % node.inst_name)
         if parent.is_array:
             regMacro = parent.inst_name.upper() + "_" + node.inst_name.upper() + "(X)" 
-            self.add_content(regMacro + " %s + %s%x + %s*%s%x + %s%x" % (self.baseAddressName, self.hexPrefix, parent.raw_address_offset, X, self.hexPrefix, parent.array_stride, self.hexPrefix, node.address_offset)) 
+            self.add_content(regMacro + " %s + %s%x + %s*%s%x + %s%x" % (self.baseAddressName, self.hexPrefix, parent.raw_address_offset, X, self.hexPrefix, parent.array_stride, self.hexPrefix, node.raw_address_offset)) 
         elif node.is_array:
             regMacro = parent.inst_name.upper() + "_" + node.inst_name.upper() + "(X)" 
             self.add_content(regMacro + " %s + %s%x + %s*%s%x" % (self.baseAddressName, self.hexPrefix, node.raw_address_offset, X, self.hexPrefix, node.array_stride))            
@@ -129,9 +176,6 @@ class headerGenExporter:
             regMacro = parent.inst_name.upper() + "_" + node.inst_name.upper()
             self.add_content(regMacro + " %s + %s%x" % (self.baseAddressName, self.hexPrefix, node.absolute_address))
 
-        for field in node.fields():
-            self.add_field(node, field)
-
     #---------------------------------------------------------------------------
     def add_field(self, parent, node):
         regFieldOffsetMacro = parent.inst_name.upper() + "_REG_" + node.inst_name.upper() + "_" + "OFFSET"
@@ -2,19 +2,25 @@ import os
 import re
 import json
 import math
-import shutil
 import hashlib
-import distutils.dir_util
+import threading
+import contextlib
 import xml.dom.minidom
 from collections import OrderedDict
 
 import jinja2 as jj
 import markdown
 
-from systemrdl.node import RootNode, AddressableNode, RegNode, RegfileNode, AddrmapNode, MemNode
+from systemrdl.node import RootNode, RegNode, RegfileNode, AddrmapNode, MemNode
+
+from ..common import OutputSink
+from ..common.regtable import RegisterTable, RegEntry, present
+from ..common.walker import TableWalker, ShardableListener, WalkerAction
+from ..common.nodecache import NodeCache, CachedNode
 
 class HTMLExporter:
-    def __init__(self, markdown_inst=None, user_template_dir=None, user_context={}):
+
+    def __init__(self, markdown_inst=None, user_template_dir=None, user_context={}, output_sink=None):
         """
         Constructor for the HTML exporter class
 
@@ -28,19 +34,19 @@ class HTMLExporter:
             Path to a directory where user-defined template overrides are stored.
         user_context: dict
             Additional context variables to load into the template namespace.
+        output_sink: ``ralbot.common.OutputSink``
+            Writes the output files, skipping the ones whose content did not
+            change. A new sink is used if not given.
         """
-        self.output_dir = None
-        self.RALIndex = []
-        self.current_id = -1
-        self.footer = None
-        self.title = None
-        self.home_url = None
         self.user_context = user_context
+        self.output_sink = output_sink or OutputSink()
 
         if markdown_inst is None:
             self.markdown_inst = markdown.Markdown()
         else:
             self.markdown_inst = markdown_inst
+        # Markdown instances keep state while converting
+        self.markdown_lock = threading.Lock()
 
         if user_template_dir:
             loader = jj.ChoiceLoader([
@@ -49,12 +55,10 @@ class HTMLExporter:
             ])
         else:
             loader = jj.FileSystemLoader(os.path.join(os.path.dirname(__file__), "templates"))
-
-        self.jj_env = jj.Environment(
-            loader=loader,
-            autoescape=jj.select_autoescape(['html']),
-            undefined=jj.StrictUndefined
-        )
+        self.loader = loader
+        # Every export loads the templates in an environment of its own, to
+        # record the ones it reads, but they are only compiled once
+        self.bytecode_cache = MemoryBytecodeCache()
 
     def export(self, node, output_dir, **kwargs):
         """
@@ -74,7 +78,54 @@ class HTMLExporter:
         home_url: str
             (optional) If a URL is specified, adds a home button to return to a
             parent home page.
+        profiler:
+            (optional) Object whose ``phase(name)`` context manager times the
+            export's sub-phases.
+        table: ``ralbot.common.RegisterTable``
+            (optional) Register table of `node`, shared with other exporters.
+            Built from `node` if not given.
         """
+        context = self.begin(node, output_dir, **kwargs)
+
+        # Traverse tree
+        with context.phase(context.walk_phase):
+            TableWalker().walk(context.table.top, context)
+
+        context.finish()
+
+    def begin(self, node, output_dir, **kwargs):
+        """
+        Prepare an export of `node` to `output_dir`, taking the same options
+        as export(), and return its HTMLContext. The pages are then written by
+        walking the context's register `table` with the context as listener,
+        and the index by its finish().
+
+        Every export has a context of its own: the exporter only holds the
+        options, so it can run any number of exports, in turn or concurrently.
+        """
+        return HTMLContext(self, node, output_dir, **kwargs)
+
+#===============================================================================
+class HTMLContext(ShardableListener):
+    """
+    State of one export of an HTMLExporter, and listener of its walk.
+
+    `dependencies` lists the templates, static assets and images it read.
+    """
+    walk_phase = "traversal"
+
+    def __init__(self, exporter, node, output_dir, **kwargs):
+        self.exporter = exporter
+        self.user_context = exporter.user_context
+        self.output_sink = exporter.output_sink
+        self.markdown_inst = exporter.markdown_inst
+        self.dependencies = []
+        self.jj_env = jj.Environment(
+            loader=DependencyLoader(exporter.loader, self.dependencies),
+            autoescape=jj.select_autoescape(['html']),
+            undefined=jj.StrictUndefined,
+            bytecode_cache=exporter.bytecode_cache
+        )
 
         # If it is the root node, skip to top addrmap
         if isinstance(node, RootNode):
@@ -83,6 +134,8 @@ class HTMLExporter:
         self.footer = kwargs.pop("footer", "Generated by RALBot HTML")
         self.title = kwargs.pop("title", "%s Reference" % node.get_property("name"))
         self.home_url = kwargs.pop("home_url", None)
+        self.profiler = kwargs.pop("profiler", None)
+        table = kwargs.pop("table", None)
 
         # Check for stray kwargs
         if kwargs:
@@ -91,54 +144,133 @@ class HTMLExporter:
         self.output_dir = output_dir
         self.RALIndex = []
         self.current_id = -1
+        self.stack = []
+        self.node_cache = NodeCache()
 
         # Copy static files
-        static_dir = os.path.join(os.path.dirname(__file__), "static")
-        distutils.dir_util.copy_tree(static_dir, self.output_dir, preserve_mode=0, preserve_times=0)
+        with self.phase("static copy"):
+            static_dir = os.path.join(os.path.dirname(__file__), "static")
+            self.dependencies.extend(self.output_sink.copy_tree(static_dir, self.output_dir))
 
         # Make sure output directory structure exists
-        os.makedirs(self.output_dir, exist_ok=True)
-        os.makedirs(os.path.join(self.output_dir, "content"), exist_ok=True)
+        self.output_sink.makedirs(self.output_dir)
+        self.output_sink.makedirs(os.path.join(self.output_dir, "content"))
 
-        # Traverse tree
-        self.visit_addressable_node(node)
+        if table is None:
+            table = RegisterTable(node)
+        self.table = table
 
+    def finish(self):
         # Write out RALIndex and other data to js file
-        self.write_ral_data()
+        with self.phase("data.js"):
+            self.write_ral_data()
 
         # Write main index.html
-        self.write_index_page()
-
-
-    def visit_addressable_node(self, node, parent_id=None):
+        with self.phase("index"):
+            self.write_index_page()
+
+    def phase(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+
+    #---------------------------------------------------------------------------
+    def shard_begin(self, parent, start, stop):
+        # Page ids are given in walk order: the shard's ids follow those of
+        # the children before it
+        parent_id = self.stack[-1][0]
+        self.current_id = parent_id + sum(page_count(child) for child in present(parent.children[:start]))
+        self.stack = [(parent_id, [], OrderedDict())]
+        self.RALIndex = []
+        self._shard_start = start
+        self._shard_dependency = len(self.dependencies)
+        # Load the templates again so that the shard reports them as
+        # dependencies in the order a single walk would
+        self.jj_env.cache.clear()
+
+    def shard_end(self):
+        _, child_ids, _ = self.stack[-1]
+        return (self._shard_start, child_ids, self.RALIndex,
+            self.dependencies[self._shard_dependency:], self.current_id)
+
+    def shard_merge(self, parent, fragment):
+        start, child_ids, ral_index, dependencies, current_id = fragment
+        _, parent_child_ids, parent_children = self.stack[-1]
+        children = iter(present(parent.children[start:]))
+        for child_id in child_ids:
+            parent_child_ids.append(child_id)
+            parent_children[child_id] = self.node_cache.wrap(next(children).node)
+        self.RALIndex.extend(ral_index)
+        self.dependencies.extend(dependencies)
+        self.current_id = current_id
+
+    #---------------------------------------------------------------------------
+    # Listener callbacks
+    #---------------------------------------------------------------------------
+    def enter_Addrmap(self, entry):
+        self.enter_addressable_node(entry)
+
+    def exit_Addrmap(self, entry):
+        self.exit_addressable_node(entry)
+
+    def enter_Regfile(self, entry):
+        self.enter_addressable_node(entry)
+
+    def exit_Regfile(self, entry):
+        self.exit_addressable_node(entry)
+
+    def enter_Mem(self, entry):
+        self.enter_addressable_node(entry)
+
+    def exit_Mem(self, entry):
+        self.exit_addressable_node(entry)
+
+    def enter_Reg(self, entry):
+        self.enter_addressable_node(entry)
+        # Fields are part of their register's entry
+        return WalkerAction.SkipDescendants
+
+    def exit_Reg(self, entry):
+        self.exit_addressable_node(entry)
+
+    #---------------------------------------------------------------------------
+    def enter_addressable_node(self, entry):
         self.current_id += 1
         this_id = self.current_id
         child_ids = []
+        children = OrderedDict()
+
+        if self.stack:
+            parent_id, parent_child_ids, parent_children = self.stack[-1]
+            parent_child_ids.append(this_id)
+            parent_children[this_id] = self.node_cache.wrap(entry.node)
+        else:
+            parent_id = None
 
         ral_entry = {
             'parent'    : parent_id,
             'children'  : child_ids,
-            'name'      : node.inst.inst_name,
-            'offset'    : BigInt(node.inst.addr_offset),
-            'size'      : BigInt(node.size),
+            'name'      : entry.inst_name,
+            'offset'    : BigInt(entry.raw_address_offset),
+            'size'      : BigInt(entry.size),
         }
-        if node.inst.is_array:
-            ral_entry['dims'] = node.inst.array_dimensions
-            ral_entry['stride'] = BigInt(node.inst.array_stride)
-            ral_entry['idxs'] = [0] * len(node.inst.array_dimensions)
+        if entry.is_array:
+            ral_entry['dims'] = entry.array_dimensions
+            ral_entry['stride'] = BigInt(entry.array_stride)
+            ral_entry['idxs'] = [0] * len(entry.array_dimensions)
 
-        if isinstance(node, RegNode):
+        if isinstance(entry, RegEntry):
             ral_fields = []
-            for field in node.fields():
+            for field in present(entry.fields):
                 ral_field = {
-                    'name' : field.inst.inst_name,
-                    'lsb'  : field.inst.lsb,
-                    'msb'  : field.inst.msb,
-                    'reset': BigInt(field.get_property("reset", default=0)),
+                    'name' : field.inst_name,
+                    'lsb'  : field.lsb,
+                    'msb'  : field.msb,
+                    'reset': BigInt(field.reset if field.reset is not None else 0),
                     'disp' : 'H'
                 }
 
-                field_enum = field.get_property("encode")
+                field_enum = field.encode
                 if field_enum is not None:
                     encode = OrderedDict()
                     for member in field_enum:
@@ -152,19 +284,18 @@ class HTMLExporter:
         # Insert entry now to ensure proper position in list
         self.RALIndex.append(ral_entry)
 
-        # Recurse to children
-        children = OrderedDict()
-        for child in node.children():
-            if not isinstance(child, AddressableNode):
-                continue
-            child_id = self.visit_addressable_node(child, this_id)
-            child_ids.append(child_id)
-            children[child_id] = child
+        # Children add themselves to this entry
+        self.stack.append((this_id, child_ids, children))
+
+    def exit_addressable_node(self, entry):
+        this_id, _, children = self.stack.pop()
 
         # Generate page for this node
-        self.write_page(this_id, node, children)
+        self.write_page(this_id, self.node_cache.wrap(entry.node), children)
 
-        return this_id
+        # The children were last seen on this page
+        for child in children.values():
+            self.node_cache.release(child)
 
 
     def write_ral_data(self):
@@ -172,7 +303,7 @@ class HTMLExporter:
             "title" : self.title
         }
         path = os.path.join(self.output_dir, "js/data.js")
-        with open(path, 'w') as fp:
+        with self.output_sink.open(path) as fp:
             fp.write("var RALIndex = ")
             fp.write(RALBotJSEncoder(separators=(',', ':')).encode(self.RALIndex))
             fp.write(";")
@@ -204,10 +335,9 @@ class HTMLExporter:
         }
         context.update(self.user_context)
 
-        template = self.jj_env.get_template(self._template_map[type(node)])
-        stream = template.stream(context)
-        output_path = os.path.join(self.output_dir, "content", "%d.html" % this_id)
-        stream.dump(output_path)
+        node_type = type(node.node) if isinstance(node, CachedNode) else type(node)
+        template = self.jj_env.get_template(self._template_map[node_type])
+        self.render_page(template, context, os.path.join(self.output_dir, "content", "%d.html" % this_id))
 
 
     def write_index_page(self):
@@ -219,9 +349,12 @@ class HTMLExporter:
         context.update(self.user_context)
 
         template = self.jj_env.get_template("index.html")
+        self.render_page(template, context, os.path.join(self.output_dir, "index.html"))
+
+    def render_page(self, template, context, output_path):
         stream = template.stream(context)
-        output_path = os.path.join(self.output_dir, "index.html")
-        stream.dump(output_path)
+        with self.output_sink.open(output_path) as fp:
+            stream.dump(fp)
 
     def get_child_addr_digits(self, node):
         return math.ceil(math.log2(node.size + 1) / 4)
@@ -237,7 +370,8 @@ class HTMLExporter:
         - Transform img paths that point to local files. Copy referenced image to output
         """
 
-        desc = node.get_html_desc(self.markdown_inst)
+        with self.exporter.markdown_lock:
+            desc = node.get_html_desc(self.markdown_inst)
         if desc is None:
             return desc
 
@@ -279,7 +413,8 @@ class HTMLExporter:
                         self.output_dir, "content",
                         "%s_%s" % (md5[0:8], os.path.basename(img_src))
                     )
-                    shutil.copyfile(img_src, new_path)
+                    self.output_sink.copy_file(img_src, new_path)
+                    self.dependencies.append(img_src)
                     dom.childNodes[0].attributes["src"].value = os.path.join(
                         "content",
                         "%s_%s" % (md5[0:8], os.path.basename(img_src))
@@ -292,7 +427,8 @@ class HTMLExporter:
         return desc
 
     def get_enum_html_desc(self, enum_member):
-        s = enum_member.get_html_desc(self.markdown_inst)
+        with self.exporter.markdown_lock:
+            s = enum_member.get_html_desc(self.markdown_inst)
         if s:
             return s
         else:
@@ -317,6 +453,36 @@ class HTMLExporter:
 
         return path
 
+class DependencyLoader(jj.BaseLoader):
+    """ Template loader that records the file of every template it loads """
+    def __init__(self, loader, files):
+        self.loader = loader
+        self.files = files
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = self.loader.get_source(environment, template)
+        self.files.append(filename)
+        return source, filename, uptodate
+
+class MemoryBytecodeCache(jj.BytecodeCache):
+    """ Compiled templates, kept in memory for every environment using the cache """
+    def __init__(self):
+        self.bytecodes = {}
+
+    def load_bytecode(self, bucket):
+        bytecode = self.bytecodes.get(bucket.key)
+        if bytecode is not None:
+            bucket.bytecode_from_string(bytecode)
+
+    def dump_bytecode(self, bucket):
+        self.bytecodes[bucket.key] = bucket.bytecode_to_string()
+
+def page_count(entry):
+    """ Number of pages written for `entry` and its present descendants """
+    if isinstance(entry, RegEntry):
+        return 1
+    return 1 + sum(page_count(child) for child in present(entry.children))
+
 def has_description(node):
     """
     Test if node has a description defined
@@ -1,11 +1,16 @@
+import io
 import enum
 
 from xml.dom import minidom
 from systemrdl.node import AddressableNode, RootNode
 from systemrdl.node import AddrmapNode, MemNode
-from systemrdl.node import RegNode, RegfileNode, FieldNode
+from systemrdl.node import RegNode, FieldNode
 
 from . import typemaps
+from ..common import OutputSink
+from ..common.regtable import RegisterTable, MemEntry
+from ..common.regtable import is_exploded, address_blocks
+from ..common.walker import TableWalker, ShardableListener, WalkerAction
 
 class Standard(enum.IntEnum):
     SPIRIT_1_0 = 1.0
@@ -18,17 +23,15 @@ class Standard(enum.IntEnum):
 
 #===============================================================================
 class IPXACTExporter:
-    def __init__(self, **kwargs):
-        self.msg = None
 
+    def __init__(self, **kwargs):
         self.vendor = kwargs.pop("vendor", "example.org")
         self.library = kwargs.pop("library", "mylibrary")
         self.version = kwargs.pop("version", "1.0")
         self.standard = kwargs.pop("standard", Standard.IEEE_1685_2014)
         self.xml_indent = kwargs.pop("xml_indent", "  ")
         self.xml_newline = kwargs.pop("xml_newline", "\n")
-        self.doc = None
-        self._max_width = None
+        self.output_sink = kwargs.pop("output_sink", None) or OutputSink()
 
         # Check for stray kwargs
         if kwargs:
@@ -38,8 +41,56 @@ class IPXACTExporter:
             raise ValueError("Other IP-XACT standards are not supported yet")
 
     #---------------------------------------------------------------------------
-    def export(self, node, path):
+    def export(self, node, path, table=None):
+        context = self.begin(node, path, table)
+        TableWalker().walk(context.table.top, context)
+        context.finish()
+
+    def begin(self, node, path, table=None):
+        """
+        Prepare an export of `node` to `path` and return its IPXACTContext.
+        The DOM is then built by walking the context's register `table` with
+        the context as listener, and written out by its finish().
+
+        Every export has a context of its own: the exporter only holds the
+        options, so it can run any number of exports, in turn or concurrently.
+        """
+        return IPXACTContext(self, node, path, table)
+
+    #---------------------------------------------------------------------------
+    # Vendor extension hooks
+    #
+    # Called with the element's ipxact:vendorExtensions element, which is only
+    # added to the document if given children. Create them with
+    # ``parent.ownerDocument``.
+    #---------------------------------------------------------------------------
+    def addressBlock_vendorExtensions(self, parent:minidom.Element, node:AddressableNode):
+        pass
+
+    def registerFile_vendorExtensions(self, parent:minidom.Element, node:AddressableNode):
+        pass
+
+    def register_vendorExtensions(self, parent:minidom.Element, node:RegNode):
+        pass
+
+    def field_vendorExtensions(self, parent:minidom.Element, node:FieldNode):
+        pass
+
+#===============================================================================
+class IPXACTContext(ShardableListener):
+    """ State of one export of an IPXACTExporter, and listener of its walk """
+    # IP-XACT marks the nodes that are not present instead of leaving them out
+    skip_not_present = False
+
+    def __init__(self, exporter, node, path, table=None):
+        self.exporter = exporter
+        self.xml_indent = exporter.xml_indent
+        self.xml_newline = exporter.xml_newline
+        self.output_sink = exporter.output_sink
         self.msg = node.env.msg
+        self.path = path
+        self.width_el = None
+        self._max_width = None
 
         # If it is the root node, skip to top addrmap
         if isinstance(node, RootNode):
@@ -48,6 +99,11 @@ class IPXACTExporter:
         if not isinstance(node, (AddrmapNode, MemNode)):
             raise TypeError("'node' argument expects type AddrmapNode or MemNode. Got '%s'" % type(node).__name__)
 
+        if table is None:
+            table = RegisterTable(node)
+        top = table.top
+        self.top = top
+
         # Initialize XML DOM
         self.doc = minidom.getDOMImplementation().createDocument(None, None, None)
 
@@ -62,18 +118,16 @@ class IPXACTExporter:
         self.doc.appendChild(comp)
 
         # versionedIdentifier Block
-        self.add_value(comp, "ipxact:vendor", self.vendor)
-        self.add_value(comp, "ipxact:library", self.library)
+        self.add_value(comp, "ipxact:vendor", exporter.vendor)
+        self.add_value(comp, "ipxact:library", exporter.library)
         self.add_value(comp, "ipxact:name", node.inst_name)
-        self.add_value(comp, "ipxact:version", self.version)
+        self.add_value(comp, "ipxact:version", exporter.version)
 
         mmaps = self.doc.createElement("ipxact:memoryMaps")
         comp.appendChild(mmaps)
 
         # Determine if top-level node should be exploded across multiple
         # addressBlock groups
-        explode = False
-
         # If top node is an addrmap, and it contains 1 or more children that
         # are:
         # - exclusively addrmap or mem
@@ -84,52 +138,30 @@ class IPXACTExporter:
         #
         # Otherwise, do not "explode" the top-level node
         # (explode --> False)
-        if isinstance(node, AddrmapNode):
-            addrblockable_children = 0
-            non_addrblockable_children = 0
-
-            for child in node.children(skip_not_present=False):
-                if not isinstance(child, AddressableNode):
-                    continue
-
-                if isinstance(child, (AddrmapNode, MemNode)) and not child.is_array:
-                    addrblockable_children += 1
-                else:
-                    non_addrblockable_children += 1
-
-            if (non_addrblockable_children == 0) and (addrblockable_children >= 1):
-                explode = True
-
-        # Do the export!
-        if explode:
+        if is_exploded(top, skip_not_present=False):
             # top-node becomes the memoryMap
             mmap = self.doc.createElement("ipxact:memoryMap")
-            self.add_nameGroup(mmap,
-                node.inst_name,
-                node.get_property("name", default=None),
-                node.get_property("desc")
-            )
+            self.add_nameGroup(mmap, top.inst_name, top.name, top.desc)
             mmaps.appendChild(mmap)
-
-            # Top-node's children become their own addressBlocks
-            for child in node.children(skip_not_present=False):
-                if not isinstance(child, AddressableNode):
-                    continue
-
-                self.add_addressBlock(mmap, child)
         else:
             # Not exploding apart the top-level node
 
             # Wrap it in a dummy memoryMap that bears it's name
             mmap = self.doc.createElement("ipxact:memoryMap")
-            self.add_nameGroup(mmap, "%s_mmap" % node.inst_name)
+            self.add_nameGroup(mmap, "%s_mmap" % top.inst_name)
             mmaps.appendChild(mmap)
 
-            # Export top-level node as a single addressBlock
-            self.add_addressBlock(mmap, node)
+        # Top-node's children become their own addressBlocks, or top-level
+        # node is exported as a single addressBlock
+        self.addressBlocks = set(address_blocks(top, skip_not_present=False))
+
+        # Element that the next entry's element is added to
+        self.elements = [mmap]
+        self.table = table
 
+    def finish(self):
         # Write out XML dom
-        with open(path, "w") as f:
+        with self.output_sink.open(self.path) as f:
             self.doc.writexml(
                 f,
                 addindent=self.xml_indent,
@@ -137,6 +169,85 @@ class IPXACTExporter:
                 encoding="UTF-8"
             )
 
+    #---------------------------------------------------------------------------
+    def shard_begin(self, parent, start, stop):
+        self._shard_first = len(self.elements[-1].childNodes)
+        self._max_width = None
+        # The width is reset by the first addressBlock of the shard, if any
+        self._width_reset = any(child in self.addressBlocks for child in parent.children[start:stop])
+
+    def shard_end(self):
+        # Elements are serialized here, at the depth they have in the document,
+        # since DOM nodes cannot leave the process
+        parent = self.elements[-1]
+        depth = 0
+        node = parent
+        while node.nodeType == minidom.Node.ELEMENT_NODE:
+            depth += 1
+            node = node.parentNode
+        xml = []
+        for el in parent.childNodes[self._shard_first:]:
+            f = io.StringIO()
+            el.writexml(f, self.xml_indent * depth, self.xml_indent, self.xml_newline)
+            xml.append(f.getvalue())
+        for el in parent.childNodes[self._shard_first:]:
+            parent.removeChild(el).unlink()
+        return xml, self._max_width, self._width_reset
+
+    def shard_merge(self, parent, fragment):
+        xml, max_width, width_reset = fragment
+        for text in xml:
+            self.elements[-1].appendChild(SerializedElement(text))
+        if width_reset or self._max_width is None:
+            self._max_width = max_width
+        elif max_width is not None:
+            self._max_width = max(max_width, self._max_width)
+
+    #---------------------------------------------------------------------------
+    # Listener callbacks
+    #---------------------------------------------------------------------------
+    def enter_Addrmap(self, entry):
+        if entry in self.addressBlocks:
+            self.add_addressBlock(self.elements[-1], entry)
+        elif entry is not self.top:
+            self.add_registerFile(self.elements[-1], entry)
+
+    def exit_Addrmap(self, entry):
+        if entry in self.addressBlocks:
+            self.end_addressBlock(entry)
+        elif entry is not self.top:
+            self.end_registerFile(entry)
+
+    def enter_Regfile(self, entry):
+        self.add_registerFile(self.elements[-1], entry)
+
+    def exit_Regfile(self, entry):
+        self.end_registerFile(entry)
+
+    def enter_Mem(self, entry):
+        if entry in self.addressBlocks:
+            self.add_addressBlock(self.elements[-1], entry)
+        else:
+            self.msg.warning(
+                "IP-XACT does not support 'mem' nodes that are nested in hierarchy. Discarding '%s'"
+                % entry.node.get_path(),
+                entry.node.inst.inst_src_ref
+            )
+            return WalkerAction.SkipDescendants
+
+    def exit_Mem(self, entry):
+        if entry in self.addressBlocks:
+            self.end_addressBlock(entry)
+
+    def enter_Reg(self, entry):
+        self.add_register(self.elements[-1], entry)
+
+    def exit_Reg(self, entry):
+        self.end_register(entry)
+
+    def enter_Field(self, entry):
+        self.add_field(self.elements[-1], entry)
+
     #---------------------------------------------------------------------------
     def add_value(self, parent, tag, value):
         el = self.doc.createElement(tag)
@@ -159,13 +270,9 @@ class IPXACTExporter:
         addressBlock = self.doc.createElement("ipxact:addressBlock")
         parent.appendChild(addressBlock)
 
-        self.add_nameGroup(addressBlock,
-            node.inst_name,
-            node.get_property("name", default=None),
-            node.get_property("desc")
-        )
+        self.add_nameGroup(addressBlock, node.inst_name, node.name, node.desc)
 
-        if not node.get_property("ispresent"):
+        if not node.is_present:
             self.add_value(addressBlock, "ipxact:isPresent", "0")
 
         self.add_value(addressBlock, "ipxact:baseAddress", "'h%x" % node.absolute_address)
@@ -179,42 +286,36 @@ class IPXACTExporter:
         # Insert the with element for now, but leave contents blank until it is
         # determined later.
         # Exporter has no choice but to enforce a constant width throughout
-        width_el = self.doc.createElement("ipxact:width")
-        addressBlock.appendChild(width_el)
+        self.width_el = self.doc.createElement("ipxact:width")
+        addressBlock.appendChild(self.width_el)
 
-        if isinstance(node, MemNode):
+        if isinstance(node, MemEntry):
             self.add_value(addressBlock, "ipxact:usage", "memory")
-            access = typemaps.access_from_sw(node.get_property("sw"))
+            access = typemaps.access_from_sw(node.sw)
             self.add_value(addressBlock, "ipxact:access", access)
 
         # DNE: <ipxact:volatile>
         # DNE: <ipxact:access>
         # DNE: <ipxact:parameters>
 
-        for child in node.children(skip_not_present=False):
-            if isinstance(child, RegNode):
-                self.add_register(addressBlock, child)
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
-                self.add_registerFile(addressBlock, child)
-            elif isinstance(child, MemNode):
-                self.msg.warning(
-                    "IP-XACT does not support 'mem' nodes that are nested in hierarchy. Discarding '%s'"
-                    % child.get_path(),
-                    child.inst.inst_src_ref
-                )
+        self.elements.append(addressBlock)
+
+    def end_addressBlock(self, node):
+        self.elements.pop()
+        parent = self.elements[-1]
 
         # Width should be known by now
         # If mem, and width isn't known, check memwidth
-        if isinstance(node, MemNode) and (self._max_width is None):
-            self._max_width = node.get_property("memwidth")
+        if isinstance(node, MemEntry) and (self._max_width is None):
+            self._max_width = node.memwidth
 
         if self._max_width is not None:
-            width_el.appendChild(self.doc.createTextNode("%d" % self._max_width))
+            self.width_el.appendChild(self.doc.createTextNode("%d" % self._max_width))
         else:
-            width_el.appendChild(self.doc.createTextNode("32"))
+            self.width_el.appendChild(self.doc.createTextNode("32"))
 
         vendorExtensions = self.doc.createElement("ipxact:vendorExtensions")
-        self.addressBlock_vendorExtensions(vendorExtensions, node)
+        self.exporter.addressBlock_vendorExtensions(vendorExtensions, node.node)
         if vendorExtensions.hasChildNodes():
             parent.appendChild(vendorExtensions)
 
@@ -223,13 +324,9 @@ class IPXACTExporter:
         registerFile = self.doc.createElement("ipxact:registerFile")
         parent.appendChild(registerFile)
 
-        self.add_nameGroup(registerFile,
-            node.inst_name,
-            node.get_property("name", default=None),
-            node.get_property("desc")
-        )
+        self.add_nameGroup(registerFile, node.inst_name, node.name, node.desc)
 
-        if not node.get_property("ispresent"):
+        if not node.is_present:
             self.add_value(registerFile, "ipxact:isPresent", "0")
 
         if node.is_array:
@@ -247,22 +344,16 @@ class IPXACTExporter:
         else:
             self.add_value(registerFile, "ipxact:range", "'h%x" % node.size)
 
-        for child in node.children(skip_not_present=False):
-            if isinstance(child, RegNode):
-                self.add_register(registerFile, child)
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
-                self.add_registerFile(registerFile, child)
-            elif isinstance(child, MemNode):
-                self.msg.warning(
-                    "IP-XACT does not support 'mem' nodes that are nested in hierarchy. Discarding '%s'"
-                    % child.get_path(),
-                    child.inst.inst_src_ref
-                )
+        self.elements.append(registerFile)
+
+    def end_registerFile(self, node):
+        self.elements.pop()
+        parent = self.elements[-1]
 
         # DNE: <ipxact:parameters>
 
         vendorExtensions = self.doc.createElement("ipxact:vendorExtensions")
-        self.registerFile_vendorExtensions(vendorExtensions, node)
+        self.exporter.registerFile_vendorExtensions(vendorExtensions, node.node)
         if vendorExtensions.hasChildNodes():
             parent.appendChild(vendorExtensions)
 
@@ -271,20 +362,16 @@ class IPXACTExporter:
         register = self.doc.createElement("ipxact:register")
         parent.appendChild(register)
 
-        self.add_nameGroup(register,
-            node.inst_name,
-            node.get_property("name", default=None),
-            node.get_property("desc")
-        )
+        self.add_nameGroup(register, node.inst_name, node.name, node.desc)
 
-        if not node.get_property("ispresent"):
+        if not node.is_present:
             self.add_value(register, "ipxact:isPresent", "0")
 
         if node.is_array:
-            if node.array_stride != (node.get_property("regwidth") / 8):
+            if node.array_stride != (node.regwidth / 8):
                 self.msg.fatal(
                     "IP-XACT does not support register arrays whose stride is larger then the register's size",
-                    node.inst.inst_src_ref
+                    node.node.inst.inst_src_ref
                 )
             for dim in node.array_dimensions:
                 self.add_value(register, "ipxact:dim", "%d" % dim)
@@ -293,24 +380,27 @@ class IPXACTExporter:
 
         # DNE: <ipxact:typeIdentifier>
 
-        self.add_value(register, "ipxact:size", "%d" % node.get_property("regwidth"))
+        self.add_value(register, "ipxact:size", "%d" % node.regwidth)
 
         if self._max_width is None:
-            self._max_width = max(node.get_property("accesswidth"), node.get_property("regwidth"))
+            self._max_width = max(node.accesswidth, node.regwidth)
         else:
-            self._max_width = max(node.get_property("accesswidth"), node.get_property("regwidth"), self._max_width)
+            self._max_width = max(node.accesswidth, node.regwidth, self._max_width)
 
         # DNE: <ipxact:volatile>
         # DNE: <ipxact:access>
 
-        for field in node.fields(skip_not_present=False):
-            self.add_field(register, field)
+        self.elements.append(register)
+
+    def end_register(self, node):
+        self.elements.pop()
+        parent = self.elements[-1]
 
         # DNE <ipxact:alternateRegister> [...]
         # DNE: <ipxact:parameters>
 
         vendorExtensions = self.doc.createElement("ipxact:vendorExtensions")
-        self.register_vendorExtensions(vendorExtensions, node)
+        self.exporter.register_vendorExtensions(vendorExtensions, node.node)
         if vendorExtensions.hasChildNodes():
             parent.appendChild(vendorExtensions)
 
@@ -319,18 +409,14 @@ class IPXACTExporter:
         field = self.doc.createElement("ipxact:field")
         parent.appendChild(field)
 
-        self.add_nameGroup(field,
-            node.inst_name,
-            node.get_property("name", default=None),
-            node.get_property("desc")
-        )
+        self.add_nameGroup(field, node.inst_name, node.name, node.desc)
 
-        if not node.get_property("ispresent"):
+        if not node.is_present:
             self.add_value(field, "ipxact:isPresent", "0")
 
         self.add_value(field, "ipxact:bitOffset", "%d" % node.low)
 
-        reset = node.get_property("reset")
+        reset = node.reset
         if reset is not None:
             resets_el = self.doc.createElement("ipxact:resets")
             field.appendChild(resets_el)
@@ -345,14 +431,14 @@ class IPXACTExporter:
         if node.is_volatile:
             self.add_value(field, "ipxact:volatile", "true")
 
-        sw = node.get_property("sw")
+        sw = node.sw
         self.add_value(
             field,
             "ipxact:access",
             typemaps.access_from_sw(sw)
         )
 
-        encode = node.get_property("encode")
+        encode = node.encode
         if encode is not None:
             enum_values_el = self.doc.createElement("ipxact:enumeratedValues")
             field.appendChild(enum_values_el)
@@ -367,7 +453,7 @@ class IPXACTExporter:
                 self.add_value(enum_value_el, "ipxact:value", "'h%x" % enum_value.value)
                 # DNE <ipxact:vendorExtensions>
 
-        onwrite = node.get_property("onwrite")
+        onwrite = node.onwrite
         if onwrite:
             self.add_value(
                 field,
@@ -377,7 +463,7 @@ class IPXACTExporter:
 
         # DNE: <ipxact:writeValueConstraint>
 
-        onread = node.get_property("onread")
+        onread = node.onread
         if onread:
             self.add_value(
                 field,
@@ -385,7 +471,7 @@ class IPXACTExporter:
                 typemaps.readaction_from_onread(onread)
             )
 
-        if node.get_property("donttest"):
+        if node.donttest:
             self.add_value(field, "ipxact:testable", "false")
 
         # DNE: <ipxact:reserved>
@@ -393,19 +479,16 @@ class IPXACTExporter:
         # DNE: <ipxact:parameters>
 
         vendorExtensions = self.doc.createElement("ipxact:vendorExtensions")
-        self.field_vendorExtensions(vendorExtensions, node)
+        self.exporter.field_vendorExtensions(vendorExtensions, node.node)
         if vendorExtensions.hasChildNodes():
             parent.appendChild(vendorExtensions)
 
-    #---------------------------------------------------------------------------
-    def addressBlock_vendorExtensions(self, parent:minidom.Element, node:AddressableNode):
-        pass
-
-    def registerFile_vendorExtensions(self, parent:minidom.Element, node:AddressableNode):
-        pass
-
-    def register_vendorExtensions(self, parent:minidom.Element, node:RegNode):
-        pass
-
-    def field_vendorExtensions(self, parent:minidom.Element, node:FieldNode):
-        pass
+#===============================================================================
+class SerializedElement(minidom.Element):
+    """ Element whose XML text was already written out by a shard worker """
+    def __init__(self, xml):
+        super().__init__("ipxact:serialized")
+        self.xml = xml
+
+    def writexml(self, writer, indent="", addindent="", newl=""):
+        writer.write(self.xml)
@@ -1,22 +1,83 @@
+import io
 import os
-from systemrdl.node import AddressableNode, RootNode
-from systemrdl.node import AddrmapNode, MemNode
-from systemrdl.node import RegNode, RegfileNode, FieldNode
+import re
+import contextlib
+from systemrdl.node import RootNode, AddrmapNode
 from . import typemaps
+from ..common import OutputSink
+from ..common.outputsink import spool, copy_spool, read_spool, spool_digest
+from ..common.regtable import RegisterTable, AddrmapEntry, RegfileEntry, MemEntry, RegEntry
+from ..common.regtable import present, address_blocks
+from ..common.walker import TableWalker, ShardableListener, WalkerAction
+
+# Stands for the name of a class while its definition is compared to the
+# others (see uvmGenContext.class_definition). Never part of an RDL identifier.
+CLASS_PLACEHOLDER = "\0class\0"
 #===============================================================================
 class uvmGenExporter:
+
     def __init__(self, **kwargs):
         self.indent = kwargs.pop("indentLvl", "   ")
-        self.uvmRegContent = list()
-        self.uvmMemContent = list()
-        self.uvmRegBlockContent = list()
-        self._max_width = None
+        self.output_sink = kwargs.pop("output_sink", None) or OutputSink()
+        self.reuse_classes = kwargs.pop("reuse_classes", False)
+        self.split_blocks = kwargs.pop("split_blocks", False)
 
         # Check for stray kwargs
         if kwargs:
             raise TypeError("got an unexpected keyword argument '%s'" % list(kwargs.keys())[0])
 
-        self.filename = ""
+    #---------------------------------------------------------------------------
+    def export(self, node, path, table=None):
+        context = self.begin(node, path, table)
+        try:
+            TableWalker().walk(context.table.top, context)
+            context.finish()
+        except BaseException:
+            context.abort()
+            raise
+
+    def begin(self, node, path, table=None):
+        """
+        Prepare an export of `node` to `path` and return its uvmGenContext.
+        The register model is then emitted by walking the context's register
+        `table` with the context as listener, and written out by its finish().
+
+        Every export has a context of its own: the exporter only holds the
+        options, so it can run any number of exports, in turn or concurrently.
+        """
+        return uvmGenContext(self, node, path, table)
+
+#===============================================================================
+class uvmGenContext(ShardableListener):
+    """
+    State of one export of a uvmGenExporter, and listener of its walk.
+
+    Registers are written to the output as they are emitted. Memories and
+    register blocks, which follow all of them in the file, are held in
+    spools that move to temporary files as they grow, so the model is never
+    held in memory whole.
+
+    With the exporter's `reuse_classes`, every register, memory and block
+    gets the class of the first one whose definition is identical to its
+    own, instead of a class of its own. Instances of the same RDL type then
+    share one class, named after the type. Such exports are not shardable.
+
+    With the exporter's `split_blocks`, every register block is written to a
+    file of its own along with the register and memory classes it defines,
+    in place of the single model file. A package file includes them, children
+    first, and a filelist compiles the package. Block files are only
+    rewritten when their content changes. With reuse_classes as well, the
+    shared register and memory classes go to a common file included first.
+    Blocks whose classes are named alike share the file of the first one.
+    """
+
+    def __init__(self, exporter, node, path, table=None):
+        self.exporter = exporter
+        self.msg = node.env.msg
+        self.indent = exporter.indent
+        self.output_sink = exporter.output_sink
+        self._outputFiles = None
+        self._max_width = None
         self.dirname = "."
         self.isSwReadable = True
         self.isSwWriteable = True
@@ -25,17 +86,15 @@ class uvmGenExporter:
         self.isWoset = False
         self.isWoclr = False
 
-    #---------------------------------------------------------------------------
-    def export(self, node, path):
         # Make sure output directory structure exists
         if os.path.dirname(path):
-            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.output_sink.makedirs(os.path.dirname(path))
             self.dirname = os.path.split(path)[0]
         filename = os.path.basename(path)
         filename = os.path.splitext(filename)[0]
         self.filename = filename + "_uvmreg.sv"
-        filename = self.filename.upper().replace('.', '_')
-        self.genDefineMacro(filename)
+        self.basename = filename + "_uvmreg"
+        tag = self.filename.upper().replace('.', '_')
 
         # If it is the root node, skip to top addrmap
         if isinstance(node, RootNode):
@@ -44,145 +103,298 @@ class uvmGenExporter:
         if not isinstance(node, AddrmapNode):
             raise TypeError("'node' argument expects type AddrmapNode. Got '%s'" % type(node).__name__)
 
-        # Determine if top-level node should be exploded across multiple
-        # addressBlock groups
-        explode = False
-
-        if isinstance(node, AddrmapNode):
-            addrblockable_children = 0
-            non_addrblockable_children = 0
-
-            for child in node.children():
-                if not isinstance(child, AddressableNode):
-                    continue
-
-                if isinstance(child, (AddrmapNode, MemNode)) and not child.is_array:
-                    addrblockable_children += 1
-                else:
-                    non_addrblockable_children += 1
-
-            if (non_addrblockable_children == 0) and (addrblockable_children >= 1):
-                explode = True
-
-        # Do the export!
-        if explode:
-            # top-node becomes the memoryMap
-            # Top-node's children become their own addressBlocks
-            for child in node.children():
-                if not isinstance(child, AddressableNode):
-                    continue
-                self.add_addressBlock(child)
+        if table is None:
+            table = RegisterTable(node)
+
+        self.split_blocks = exporter.split_blocks
+        self._blockStack = []
+        self._shardBlockFiles = None
+        if self.split_blocks:
+            # Blocks are written to files of their own in this directory
+            self.blockFiles = []
+            # Hash of the file of each block class written
+            self.blockDigests = {}
+            self.output_sink.makedirs(os.path.join(self.dirname, self.basename))
+            self.outputFile = None
+            self.uvmRegFile = spool()
         else:
-            # Not exploding apart the top-level node
-            # Wrap it in a dummy memoryMap that bears it's name
-            # Export top-level node as a single addressBlock
-            self.add_addressBlock(node)
-
+            self.outputFile = self.output_sink.create(os.path.join(self.dirname, self.filename))
+            self.uvmRegFile = self.outputFile
+            self.genDefineMacro(tag)
+        self.uvmMemFile = spool()
+        self.uvmRegBlockFile = spool()
+
+        # If the top-level node is exploded, its children are the address
+        # blocks. Otherwise the top-level node is exported as a single one.
+        self.top = table.top
+        self.addressBlocks = set(address_blocks(table.top))
+        self.table = table
+
+        self.reuse_classes = exporter.reuse_classes
+        if self.reuse_classes:
+            # Which class comes first depends on the whole walk
+            self.shardable = False
+        self.classBodies = {}
+        self.classOf = {}
+        self.usedClassNames = {block.inst_name for block in self.addressBlocks}
+        self.commonClasses = None
+        if self.split_blocks and self.reuse_classes:
+            # A shared register or memory class can be used by blocks whose
+            # files are written before the file of the block defining it
+            self.commonClasses = spool()
+
+    def finish(self):
+        if self.split_blocks:
+            # Everything was written to the block files
+            for section in (self.uvmRegFile, self.uvmMemFile, self.uvmRegBlockFile):
+                section.close()
+            self.write_package()
+            self.outputFile = self.uvmRegFile = self.uvmMemFile = self.uvmRegBlockFile = None
+            return
         # Write out UVM RegModel file
-        self.uvmRegBlockContent.append("`endif")
-        with open(os.path.join(self.dirname, self.filename), "w") as f:
-            f.write('\n'.join(self.uvmRegContent + self.uvmMemContent +  self.uvmRegBlockContent))
+        copy_spool(self.uvmMemFile, self.outputFile)
+        copy_spool(self.uvmRegBlockFile, self.outputFile)
+        self.outputFile.write("`endif")
+        self.outputFile.commit()
+        self.outputFile = self.uvmRegFile = self.uvmMemFile = self.uvmRegBlockFile = None
+
+    def abort(self):
+        """ Drop the output of an export that will not be finished """
+        if self.outputFile is not None:
+            self.outputFile.discard()
+        self.outputFile = self.uvmRegFile = self.uvmMemFile = self.uvmRegBlockFile = None
+    #---------------------------------------------------------------------------
+    def shard_begin(self, parent, start, stop):
+        self._outputFiles = (self.uvmRegFile, self.uvmMemFile, self.uvmRegBlockFile, self._blockStack)
+        self._blockStack = []
+        self._shardBlockFiles = []
+        self.uvmRegFile = spool()
+        self.uvmMemFile = spool()
+        self.uvmRegBlockFile = spool()
+        self._max_width = None
+        # The width is reset by the first block of the shard, if any
+        self._width_reset = any(
+            isinstance(child, (AddrmapEntry, RegfileEntry)) or child in self.addressBlocks
+            for child in present(parent.children[start:stop])
+        )
+
+    def shard_end(self):
+        fragment = (read_spool(self.uvmRegFile), read_spool(self.uvmMemFile), read_spool(self.uvmRegBlockFile),
+            self._max_width, self._width_reset, self._shardBlockFiles)
+        self.uvmRegFile, self.uvmMemFile, self.uvmRegBlockFile, self._blockStack = self._outputFiles
+        self._shardBlockFiles = None
+        return fragment
+
+    def shard_merge(self, parent, fragment):
+        regContent, memContent, regBlockContent, max_width, width_reset, blockFiles = fragment
+        for className, content in blockFiles:
+            self.write_block_file(className, [io.StringIO(content)])
+        self.uvmRegFile.write(regContent)
+        self.uvmMemFile.write(memContent)
+        self.uvmRegBlockFile.write(regBlockContent)
+        if width_reset or self._max_width is None:
+            self._max_width = max_width
+        elif max_width is not None:
+            self._max_width = max(max_width, self._max_width)
+
     #---------------------------------------------------------------------------
     def genDefineMacro(self, tag): 
-        self.uvmRegContent.append("`ifndef __%s__" % tag)
-        self.uvmRegContent.append("`define __%s__" % tag)
+        self.add_uvm_reg_content(content="`ifndef __%s__" % tag)
+        self.add_uvm_reg_content(content="`define __%s__" % tag)
+    #---------------------------------------------------------------------------
+    def begin_block(self):
+        self._max_width = None
+        if self.split_blocks:
+            # The classes of the block go to its file, not to its parent's
+            self._blockStack.append((self.uvmRegFile, self.uvmMemFile, self.uvmRegBlockFile))
+            self.uvmRegFile = spool()
+            self.uvmMemFile = spool()
+            self.uvmRegBlockFile = spool()
+
+    def end_block(self, node):
+        if not self.split_blocks:
+            return
+        sections = [self.uvmRegFile, self.uvmMemFile, self.uvmRegBlockFile]
+        self.uvmRegFile, self.uvmMemFile, self.uvmRegBlockFile = self._blockStack.pop()
+        if not any(section.tell() for section in sections):
+            # A block sharing the classes of another one (see reuse_classes)
+            for section in sections:
+                section.close()
+            return
+        if node in self.addressBlocks:
+            className = node.inst_name
+        else:
+            className = self.get_class_name(node.parent, node)
+        self.write_block_file(className, sections)
+
+    def write_block_file(self, className, sections):
+        """
+        Write the classes of a block, held in `sections`, to the block's file,
+        unless a block of the same class name was written already
+        """
+        if self._shardBlockFiles is not None:
+            # Written by the walk the shard is merged into
+            self._shardBlockFiles.append((className, "".join(read_spool(section) for section in sections)))
+            return
+        digest = spool_digest(sections)
+        if className in self.blockDigests:
+            # Blocks of the same name in parents of the same name, e.g. in
+            # two instances of one addrmap
+            if self.blockDigests[className] != digest:
+                self.msg.warning(
+                    "Blocks with different definitions share the UVM class name '%s'. "
+                    "Only the first one is included in the package" % className
+                )
+            for section in sections:
+                section.close()
+            return
+        self.blockDigests[className] = digest
+        self.blockFiles.append(self.write_class_file(className, sections))
+
+    def write_class_file(self, name, sections):
+        """ Write the classes held in `sections` to <basename>/<name>.svh. Returns its path in the package """
+        fileName = os.path.join(self.basename, name + ".svh")
+        tag = re.sub(r"\W", "_", self.basename + "_" + name + "_svh").upper()
+        classFile = self.output_sink.create(os.path.join(self.dirname, fileName))
+        classFile.write("`ifndef __%s__\n`define __%s__\n" % (tag, tag))
+        for section in sections:
+            copy_spool(section, classFile)
+        classFile.write("`endif\n")
+        classFile.commit()
+        return fileName
+
+    def write_package(self):
+        """ Write the package including the block files, and the filelist compiling it """
+        includes = self.blockFiles
+        if self.commonClasses is not None:
+            if self.commonClasses.tell():
+                includes = [self.write_class_file(self.basename + "_common", [self.commonClasses])] + includes
+            else:
+                self.commonClasses.close()
+            self.commonClasses = None
+        packageName = re.sub(r"\W", "_", self.basename) + "_pkg"
+        tag = (packageName + "_sv").upper()
+        packageFile = self.output_sink.create(os.path.join(self.dirname, self.basename + "_pkg.sv"))
+        packageFile.write("`ifndef __%s__\n`define __%s__\n" % (tag, tag))
+        packageFile.write("package %s;\n" % packageName)
+        packageFile.write(self.indent + "import uvm_pkg::*;\n")
+        packageFile.write(self.indent + "`include \"uvm_macros.svh\"\n\n")
+        for fileName in includes:
+            packageFile.write(self.indent + "`include \"%s\"\n" % fileName.replace(os.sep, "/"))
+        packageFile.write("endpackage\n`endif\n")
+        packageFile.commit()
+
+        # Drop the files of blocks an earlier export had and this one has not
+        self.output_sink.remove_stale(os.path.join(self.dirname, self.basename),
+            [os.path.join(self.dirname, fileName) for fileName in includes], ".svh")
+
+        # Paths are relative to the filelist, as read by -F
+        fileList = self.output_sink.create(os.path.join(self.dirname, self.basename + ".f"))
+        fileList.write("+incdir+.\n%s_pkg.sv\n" % self.basename)
+        fileList.commit()
     #---------------------------------------------------------------------------
     def add_uvm_block_content(self, indentLvl="", content=""):
-        self.uvmRegBlockContent.append(indentLvl + content)    
+        self.uvmRegBlockFile.write(indentLvl + content + "\n")    
     #---------------------------------------------------------------------------
     def add_uvm_reg_content(self, indentLvl="", content=""):
-        self.uvmRegContent.append(indentLvl + content)
+        self.uvmRegFile.write(indentLvl + content + "\n")
     #---------------------------------------------------------------------------
     def add_uvm_mem_content(self, indentLvl="", content=""):
-        self.uvmMemContent.append(indentLvl + content)
+        self.uvmMemFile.write(indentLvl + content + "\n")
     #---------------------------------------------------------------------------
-    def add_addressBlock(self, node):
-        self._max_width = None
-        regNode = list()
-        regBlockNode = list()
-        memNode = list()
-        
-        for child in node.children():
-            if isinstance(child, RegNode):
-                self.add_register(node, child)
-                regNode.append(child);
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
-                self.add_registerFile(node, child)
-                regBlockNode.append(child)
-            elif isinstance(child, MemNode):
-                self.add_memFile(node, child)
-                memNode.append(child)
+    # Listener callbacks
+    #---------------------------------------------------------------------------
+    def enter_Addrmap(self, entry):
+        if self.isBlock(entry):
+            self.begin_block()
 
+    def exit_Addrmap(self, entry):
+        if self.isBlock(entry):
+            self.add_registerBlock(entry)
+
+    def enter_Regfile(self, entry):
+        self.begin_block()
+
+    def exit_Regfile(self, entry):
+        self.add_registerBlock(entry)
+
+    def enter_Mem(self, entry):
+        if entry in self.addressBlocks:
+            self.begin_block()
+        else:
+            self.add_memFile(entry.parent, entry)
+            return WalkerAction.SkipDescendants
+
+    def exit_Mem(self, entry):
+        if entry in self.addressBlocks:
+            self.add_registerBlock(entry)
+
+    def enter_Reg(self, entry):
+        self.add_register(entry.parent, entry)
+        # Fields are emitted with their register
+        return WalkerAction.SkipDescendants
+
+    def isBlock(self, entry):
+        """ False for an exploded top-level node, whose children are the address blocks """
+        return entry is not self.top or entry in self.addressBlocks
+
+    #---------------------------------------------------------------------------
+    def add_registerBlock(self, node):
         # Width should be known by now
         # If mem, and width isn't known, check memwidth
-        if isinstance(node, MemNode) and (self._max_width is None):
-            self._max_width = node.get_property("memwidth")
+        if isinstance(node, MemEntry) and (self._max_width is None):
+            self._max_width = node.memwidth
 
+        children = present(node.children)
+        regNode = [child for child in children if isinstance(child, RegEntry)]
+        regBlockNode = [child for child in children if isinstance(child, (AddrmapEntry, RegfileEntry))]
+        memNode = [child for child in children if isinstance(child, MemEntry)]
         allNodes = regNode + regBlockNode + memNode
-        self.add_uvm_block_content(content="class %s extends uvm_reg_block;" % node.inst_name)
-        self.add_variable_declare_func(node, allNodes)  
-        self.add_uvm_block_content('''
-   `uvm_object_utils("%s")
-   function new(string name = "%s");
-      super.new(name, UVM_NO_COVERAGE);
-   endfunction ''' %(node.inst_name, node.inst_name))
-        self.add_build_func(node, allNodes)
-    #---------------------------------------------------------------------------
-    def add_registerFile(self, parent, node):
-        self._max_width = None
-        regNode = list()
-        regBlockNode = list()
-        memNode = list()        
-        for child in node.children():
-            if isinstance(child, RegNode):
-                self.add_register(node, child)
-                regNode.append(child);
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
-                self.add_registerFile(node, child)
-                regBlockNode.append(child)
-            elif isinstance(child, MemNode):
-                self.add_memFile(node, child)
-                memNode.append(child)
 
-        allNodes = regNode + regBlockNode + memNode
-        self.add_uvm_block_content(content="class %s extends uvm_reg_block;" % self.get_class_name(parent, node))
-        self.add_variable_declare_func(node, allNodes)  
-        self.add_uvm_block_content('''
+        with self.class_definition("uvmRegBlockFile", node.parent, node) as className:
+            self.add_uvm_block_content(content="class %s extends uvm_reg_block;" % className)
+            self.add_variable_declare_func(node, allNodes)  
+            self.add_uvm_block_content('''
    `uvm_object_utils("%s")
    function new(string name = "%s");
       super.new(name, UVM_NO_COVERAGE);
-   endfunction ''' %(self.get_class_name(parent, node), self.get_class_name(parent, node)))
-        self.add_build_func(node, allNodes)
+   endfunction ''' %(className, className))
+            self.add_build_func(node, allNodes)
+        for child in allNodes:
+            self.classOf.pop(child, None)
+        self.end_block(node)
 
     #---------------------------------------------------------------------------
     def add_register(self, parent, node):
         if self._max_width is None:
-            self._max_width = max(node.get_property("accesswidth"), node.get_property("regwidth"))
+            self._max_width = max(node.accesswidth, node.regwidth)
         else:
-            self._max_width = max(node.get_property("accesswidth"), node.get_property("regwidth"), self._max_width)
-
-        self.add_uvm_reg_content(content = "class %s extends uvm_reg;" % self.get_class_name(parent, node))
-
-        for field in node.fields():
-            self.add_uvm_reg_content(self.indent, "rand uvm_reg_field %s;" % field.inst_name);
-
-        self.add_uvm_reg_content(self.indent, "")
-        self.add_uvm_reg_content(self.indent, "virtual function void build();")
-        for field in node.fields():
-            isRand = "1" if field.is_sw_writable else "0"
-            isVolatile = "1" if field.is_volatile else "0"
-            self.setSwRdWrProperty(field)
-            self.add_uvm_reg_content(self.indent*2, "%s = uvm_reg_field::type_id::create(\"%s\", null, get_full_name());" % (field.inst_name, field.inst_name))
-            self.add_uvm_reg_content(self.indent*2, "%s.configure(this, %0d, %0d, \"%s\", %s, %s, %s, %s);" %(field.inst_name, field.width, field.low, self.getFieldAccessType(field), isVolatile, self.resetStr(field), isRand, self.isOnlyField(node)))
-        self.add_uvm_reg_content(self.indent, "endfunction")
-
-        self.add_uvm_reg_content('''
+            self._max_width = max(node.accesswidth, node.regwidth, self._max_width)
+
+        with self.class_definition("uvmRegFile", parent, node) as className:
+            self.add_uvm_reg_content(content = "class %s extends uvm_reg;" % className)
+
+            fields = present(node.fields)
+            for field in fields:
+                self.add_uvm_reg_content(self.indent, "rand uvm_reg_field %s;" % field.inst_name);
+
+            self.add_uvm_reg_content(self.indent, "")
+            self.add_uvm_reg_content(self.indent, "virtual function void build();")
+            for field in fields:
+                isRand = "1" if field.is_sw_writable else "0"
+                isVolatile = "1" if field.is_volatile else "0"
+                self.setSwRdWrProperty(field)
+                self.add_uvm_reg_content(self.indent*2, "%s = uvm_reg_field::type_id::create(\"%s\", null, get_full_name());" % (field.inst_name, field.inst_name))
+                self.add_uvm_reg_content(self.indent*2, "%s.configure(this, %0d, %0d, \"%s\", %s, %s, %s, %s);" %(field.inst_name, field.width, field.low, self.getFieldAccessType(field), isVolatile, self.resetStr(field), isRand, self.isOnlyField(node)))
+            self.add_uvm_reg_content(self.indent, "endfunction")
+
+            self.add_uvm_reg_content('''
    function new(string name = "%s");
       super.new(name, %0d, UVM_NO_COVERAGE);
    endfunction
 
    `uvm_object_utils("%s")
-endclass\n''' %(self.get_class_name(parent, node), node.get_property("regwidth"), self.get_class_name(parent, node)))
+endclass\n''' %(className, node.regwidth, className))
     #---------------------------------------------------------------------------
     # generate uvm reg model content function
     #---------------------------------------------------------------------------
@@ -199,11 +411,11 @@ endclass\n''' %(self.get_class_name(parent, node), node.get_property("regwidth")
         self.add_uvm_block_content(self.indent, "virtual function void build();")        
         self.add_uvm_block_content(self.indent*2, "default_map = create_map(\"default_map\", `UVM_REG_ADDR_WIDTH'h0, %0d, UVM_LITTLE_ENDIAN, 1);" % (self._max_width/8))
         for child in allNodes:
-            if isinstance(child, RegNode):
+            if isinstance(child, RegEntry):
                 self.add_build_reg_content(parentNode, child)
-            elif isinstance(child, (AddrmapNode, RegfileNode)):
+            elif isinstance(child, (AddrmapEntry, RegfileEntry)):
                 self.add_build_block_content(parentNode, child)
-            elif isinstance(child, MemNode):
+            elif isinstance(child, MemEntry):
                 self.add_build_mem_content(parentNode, child)
                         
         self.add_uvm_block_content(self.indent, "endfunction")
@@ -221,7 +433,7 @@ endclass\n''' %(self.get_class_name(parent, node), node.get_property("regwidth")
             self.add_uvm_block_content(self.indent*2, "%s = %s::type_id::create(\"%s\");" % (child.inst_name, self.get_class_name(parentNode, child), child.inst_name))
             self.add_uvm_block_content(self.indent*2, "%s.configure(this, null, \"%s\");" % (child.inst_name, child.inst_name))
             self.add_uvm_block_content(self.indent*2, "%s.build();" %(child.inst_name))
-            self.add_uvm_block_content(self.indent*2, "default_map.add_reg(%s, `UVM_REG_ADDR_WIDTH'h%x, \"%s\", 0);" % (child.inst_name, child.address_offset, self.getRegAccessType(child)))
+            self.add_uvm_block_content(self.indent*2, "default_map.add_reg(%s, `UVM_REG_ADDR_WIDTH'h%x, \"%s\", 0);" % (child.inst_name, child.raw_address_offset, self.getRegAccessType(child)))
 
     def add_build_block_content(self, parentNode, child):
         if child.is_array:
@@ -235,22 +447,23 @@ endclass\n''' %(self.get_class_name(parent, node), node.get_property("regwidth")
             self.add_uvm_block_content(self.indent*2,  "%s = %s::type_id::create(\"%s\",,get_full_name());" %(child.inst_name, self.get_class_name(parentNode, child), child.inst_name))
             self.add_uvm_block_content(self.indent*2, "%s.configure(this, \"\");" %(child.inst_name))
             self.add_uvm_block_content(self.indent*2, "%s.build();" %(child.inst_name))
-            self.add_uvm_block_content(self.indent*2, "default_map.add_submap(%s.default_map, `UVM_REG_ADDR_WIDTH'h%x);" % (child.inst_name, child.address_offset))
+            self.add_uvm_block_content(self.indent*2, "default_map.add_submap(%s.default_map, `UVM_REG_ADDR_WIDTH'h%x);" % (child.inst_name, child.raw_address_offset))
 
     def add_build_mem_content(self, parentNode, child):
         self.add_uvm_block_content(self.indent*2, "%s = %s::type_id::create(\"%s\",,get_full_name());" % (child.inst_name, self.get_class_name(parentNode, child), child.inst_name))
         self.add_uvm_block_content(self.indent*2, "%s.configure(this, \"%s\");" %(child.inst_name, child.inst_name))
-        self.add_uvm_block_content(self.indent*2, "default_map.add_mem(%s.default_map, `UVM_REG_ADDR_WIDTH'h%x, \"%s\");" % (child.inst_name, child.address_offset, typemaps.access_from_sw(child.get_property("sw"))))
+        self.add_uvm_block_content(self.indent*2, "default_map.add_mem(%s.default_map, `UVM_REG_ADDR_WIDTH'h%x, \"%s\");" % (child.inst_name, child.raw_address_offset, typemaps.access_from_sw(child.sw)))
 
     def add_memFile(self, parent, node):
-        self.add_uvm_mem_content(content = "class %s extends uvm_reg;" % self.get_class_name(parent, node))
-        self.add_uvm_mem_content('''
+        with self.class_definition("uvmMemFile", parent, node) as className:
+            self.add_uvm_mem_content(content = "class %s extends uvm_reg;" % className)
+            self.add_uvm_mem_content('''
    function new(string name = \"%s\");
       super.new(name, 'h%x, %0d, "%s", UVM_NO_COVERAGE);
    endfunction
    
    `uvm_object_utils(%s)
-endclass\n''' % (self.get_class_name(parent, node), node.get_property("mementries"), node.get_property("memwidth"), typemaps.access_from_sw(node.get_property("sw")), self.get_class_name(parent, node)))
+endclass\n''' % (className, node.mementries, node.memwidth, typemaps.access_from_sw(node.sw), className))
 
 
     #---------------------------------------------------------------------------
@@ -258,29 +471,77 @@ endclass\n''' % (self.get_class_name(parent, node), node.get_property("mementrie
     #---------------------------------------------------------------------------
     #---------------------------------------------------------------------------
     def get_class_name(self, parent, node):
+        className = self.classOf.get(node)
+        if className is not None:
+            return className
         regBlockName = parent.inst_name
         regName = node.inst_name
+        return self.get_class_prefix(node) + regBlockName.lower() + "_" + regName.lower()
+
+    def get_class_prefix(self, node):
         prefixString = "reg_"
-        if isinstance(node, RegNode):
+        if isinstance(node, RegEntry):
             prefixString = "reg_"
-        elif isinstance(node, (AddrmapNode, RegfileNode)):
+        elif isinstance(node, (AddrmapEntry, RegfileEntry)):
             prefixString = "block_"
-        elif isinstance(node, MemNode):
+        elif isinstance(node, MemEntry):
             prefixString = "mem_"
-        return prefixString + regBlockName.lower() + "_" + regName.lower()
+        return prefixString
+
+    def get_type_class_name(self, node):
+        """ Unused class name for `node`'s RDL type, or its instance name if anonymous """
+        typeName = node.node.type_name or node.inst_name
+        baseName = self.get_class_prefix(node) + typeName.lower()
+        className = baseName
+        index = 1
+        while className in self.usedClassNames:
+            index += 1
+            className = "%s_%d" % (baseName, index)
+        self.usedClassNames.add(className)
+        return className
+
+    @contextlib.contextmanager
+    def class_definition(self, section, parent, node):
+        """
+        Yields the class name to write the class of `node` with, to the
+        `section` output (uvmRegFile, uvmMemFile or uvmRegBlockFile).
+
+        With reuse_classes, the class is written with CLASS_PLACEHOLDER to a
+        buffer in place of the section, and only copied to it under a new
+        name if no class written so far has the same definition. `node` then
+        gets the name of the class it shares from get_class_name().
+        """
+        if node in self.addressBlocks:
+            yield node.inst_name
+            return
+        if not self.reuse_classes:
+            yield self.get_class_name(parent, node)
+            return
+        output = getattr(self, section)
+        setattr(self, section, io.StringIO())
+        try:
+            yield CLASS_PLACEHOLDER
+            body = getattr(self, section).getvalue()
+        finally:
+            setattr(self, section, output)
+        className = self.classBodies.get(body)
+        if className is None:
+            className = self.get_type_class_name(node)
+            self.classBodies[body] = className
+            if self.commonClasses is not None and section != "uvmRegBlockFile":
+                output = self.commonClasses
+            output.write(body.replace(CLASS_PLACEHOLDER, className))
+        self.classOf[node] = className
 
     def resetStr(self, node):
-        reset = node.get_property("reset")
+        reset = node.reset
         if reset is not None:
             return  "'h%x, " % reset + "1" 
         else:
             return "0, 0"
 
     def isOnlyField(self, node):
-        i = 0;
-        for field in node.fields():
-            i += 1;
-        return "1" if (i == 1) else "0"
+        return "1" if (len(present(node.fields)) == 1) else "0"
 
     #set other sw read/write properties (these override sw= setting)    
     def setSwRdWrProperty(self, node):
@@ -288,16 +549,16 @@ endclass\n''' % (self.get_class_name(parent, node), node.get_property("mementrie
         self.isRset = False
         self.isWoclr = False
         self.isWoset = False
-        if node.get_property("rclr"):
+        if node.rclr:
             self.isSwReadable = True
             self.isRclr = True
-        elif node.get_property("rset"):
+        elif node.rset:
             self.isSwReadable = True
             self.isRset = True
-        elif node.get_property("woclr"):
+        elif node.woclr:
             self.isSwWriteable = True
             self.isWoclr = True
-        elif node.get_property("woset"):
+        elif node.woset:
             self.isSwWriteable = True
             self.isWoset = True
 
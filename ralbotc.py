@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import socket
+
+# Keep this module light: it is started for every job and must not pay for
+# the systemrdl/jinja2 imports unless it has to run the job itself.
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, "ralbotgen-%d.sock" % os.getuid())
+
+def send_message(conn, msg):
+    conn.sendall((json.dumps(msg) + "\n").encode())
+
+def run_remote(argv, socket_path):
+    """
+    Submit a job to a running ralbotd daemon and relay its output.
+    Returns the job's exit code, or None if no daemon is listening.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        conn.close()
+        return None
+
+    with conn:
+        send_message(conn, {"argv": argv, "cwd": os.getcwd()})
+        for line in conn.makefile('r'):
+            msg = json.loads(line)
+            if "stdout" in msg:
+                sys.stdout.write(msg["stdout"])
+            elif "stderr" in msg:
+                sys.stderr.write(msg["stderr"])
+            elif "artifact" in msg:
+                print(msg["artifact"])
+            elif "exit" in msg:
+                return msg["exit"]
+    # Daemon went away in the middle of the job
+    return 1
+
+def run_local(argv):
+    from ralbotgen import ralbotGenerator, RDLMessagePrinter
+
+    generator = ralbotGenerator(RDLMessagePrinter())
+    try:
+        generator.export(argv)
+        rc = 0
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else 1
+    for path in generator.artifacts:
+        print(path)
+    return rc
+
+def main(argv):
+    socket_path = os.environ.get("RALBOTGEN_SOCKET") or default_socket_path()
+    rc = run_remote(argv, socket_path)
+    if rc is None:
+        rc = run_local(argv)
+    return rc
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
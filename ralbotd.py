@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import signal
+import socket
+import argparse
+
+from ralbotc import default_socket_path, send_message
+from ralbotgen import ralbotGenerator, RDLMessagePrinter, RDLArgumentError, preload_exporters
+
+class JobStream:
+    """ File-like object that forwards a job's stdout/stderr to its client """
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+
+    def write(self, text):
+        if text:
+            send_message(self.conn, {self.name: text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+#===============================================================================
+class ralbotDaemon:
+    """
+    Generation daemon.
+
+    Listens on a UNIX domain socket. A job is one JSON line
+    ``{"argv": [...], "cwd": "..."}`` holding the same arguments as
+    ralbotgen.py. Every job runs in a process forked from the daemon, so it
+    starts with all exporters imported, and the elaborated model is shared
+    with other jobs through the on-disk model cache. The job's output is
+    streamed back as JSON lines, followed by the artifact paths and the exit
+    code.
+    """
+    def __init__(self, socket_path, workers):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.active = set()
+
+    def reap(self, block=False):
+        while self.active:
+            pid, _ = os.waitpid(-1, 0 if block else os.WNOHANG)
+            if pid == 0:
+                return
+            self.active.discard(pid)
+            if block:
+                return
+
+    def runJob(self, conn):
+        request = json.loads(conn.makefile('r').readline())
+        os.chdir(request["cwd"])
+        sys.stdout = JobStream(conn, "stdout")
+        sys.stderr = JobStream(conn, "stderr")
+
+        generator = ralbotGenerator(RDLMessagePrinter())
+        try:
+            if "--watch" in request["argv"]:
+                raise RDLArgumentError("--watch is not supported for daemon jobs")
+            generator.export(request["argv"])
+            rc = 0
+        except RDLArgumentError as e:
+            sys.stderr.write("error: %s\n" % e)
+            rc = 1
+        except SystemExit as e:
+            rc = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            sys.stderr.write("error: %s: %s\n" % (type(e).__name__, e))
+            rc = 1
+
+        for path in generator.artifacts:
+            send_message(conn, {"artifact": os.path.abspath(path)})
+        send_message(conn, {"exit": rc})
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            # Left behind by a daemon that did not shut down cleanly
+            os.remove(self.socket_path)
+
+        # Shut down cleanly, removing the socket, on `kill`
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(self.workers * 4)
+        print("ralbotd: listening on %s with %d workers" % (self.socket_path, self.workers))
+
+        try:
+            while True:
+                conn, _ = server.accept()
+                self.reap()
+                if len(self.active) >= self.workers:
+                    self.reap(block=True)
+
+                pid = os.fork()
+                if pid == 0:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    server.close()
+                    rc = 0
+                    try:
+                        self.runJob(conn)
+                    except BaseException:
+                        rc = 1
+                    finally:
+                        conn.close()
+                        os._exit(rc)
+                self.active.add(pid)
+                conn.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            os.remove(self.socket_path)
+
+def main():
+    ap = argparse.ArgumentParser(description="ralbotgen generation daemon")
+    ap.add_argument(
+        '--socket',
+        metavar='<path>',
+        type=str,
+        default=os.environ.get("RALBOTGEN_SOCKET") or default_socket_path(),
+        dest='socket_path',
+        help="UNIX domain socket to listen on (default %(default)s)."
+    )
+    ap.add_argument(
+        '-w', '--workers',
+        metavar='<N>',
+        type=int,
+        default=os.cpu_count() or 1,
+        dest='workers',
+        help="Maximum number of jobs run at the same time (default %(default)s)."
+    )
+    cfg = ap.parse_args()
+    # Jobs are forked from this process, so import everything once here
+    preload_exporters()
+    ralbotDaemon(cfg.socket_path, cfg.workers).serve()
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,43 @@
 import os
+import gc
 import sys
+import time
 import argparse
+import hashlib
 import collections
+import importlib
+import importlib.util
+import multiprocessing
 from systemrdl.messages import MessagePrinter
 from systemrdl.messages import RDLCompileError
 from systemrdl.messages import Severity
 import systemrdl.warnings as warnings
 
-from rdlcompiler import RdlCompiler
-from ralbot.uvmgen import uvmGenExporter
-from ralbot.headergen import headerGenExporter
-from ralbot.html import HTMLExporter
-from ralbot.ipxact import IPXACTExporter
-
-import markdown
+from rdlcompiler import RdlCompiler, default_cache_dir, gc_paused
+from artifactmanifest import ArtifactManifest, hash_tree
+from phaseprofiler import PhaseProfiler
+from ralbot.common import OutputSink, RegisterTable, TableWalker, TableListener, ShardedWalk, Tracer
+from ralbot.common.walker import CALLBACKS
+import batchgen
+
+# Exporter class of each exporter package. Exporters are imported only when
+# their flag is selected, so e.g. a header-only run never loads jinja2,
+# markdown or minidom.
+EXPORTERS = collections.OrderedDict([
+    ("ralbot.headergen", "headerGenExporter"),
+    ("ralbot.uvmgen", "uvmGenExporter"),
+    ("ralbot.html", "HTMLExporter"),
+    ("ralbot.ipxact", "IPXACTExporter"),
+])
+
+def load_exporter(package):
+    return getattr(importlib.import_module(package), EXPORTERS[package])
+
+def preload_exporters():
+    """ Import every exporter up front, for long-running processes """
+    for package in EXPORTERS:
+        load_exporter(package)
+    importlib.import_module("markdown")
 
 class RDLArgumentError(RDLCompileError):
     """ Command line argument error """
@@ -29,6 +53,24 @@ class RDLMessagePrinter(MessagePrinter):
 
     def __init__(self):
         self.severity_desc = {"fatal" : Severity.FATAL, "error" : Severity.ERROR, "warning" : Severity.WARNING, "info" : Severity.INFO, "debug" : Severity.DEBUG}
+        self.captured = None
+        self.outer_captures = []
+
+    def startCapture(self):
+        """ Buffer emitted lines instead of writing them out. Captures nest. """
+        self.outer_captures.append(self.captured)
+        self.captured = []
+
+    def stopCapture(self):
+        """ Stop buffering and return the lines captured since startCapture() """
+        lines, self.captured = self.captured, self.outer_captures.pop()
+        return lines
+
+    def emit_message(self, lines):
+        if self.captured is not None:
+            self.captured.extend(lines)
+        else:
+            super().emit_message(lines)
 
     def enable(self, severity):
         self.severity_desc[severity] = True
@@ -38,6 +80,10 @@ class RDLMessagePrinter(MessagePrinter):
 
     def print_message(self, severity, text, src_ref=None):
 
+        if isinstance(severity, Severity):
+            # Messages from the compiler itself use the Severity enum
+            severity = severity.name.lower()
+
         if severity in self.severity_desc :
             if (severity == "warning" or severity == "error" or severity == "fatal"):
                 # use built in support for these severities
@@ -48,10 +94,57 @@ class RDLMessagePrinter(MessagePrinter):
                 self.emit_message([str.format("{0}: {1}", severity, text)])
 
 
+# One exporter run, writing `outputs` using the code and templates of the
+# `package` exporter package. `func(rdl_root, table, cfg)` begins the export
+# and returns its context: walking `table`, the RegisterTable of `rdl_root`,
+# with the context as listener and calling its finish() completes the export.
+ExportTask = collections.namedtuple("ExportTask", ["name", "description", "func", "package", "outputs"])
+
+# Outcome of one exporter task. `written` and `skipped` count the output files
+# the task wrote and left unchanged, `dependencies` lists the files other than
+# the RDL sources that it read, and `events` are its --trace events.
+TaskResult = collections.namedtuple(
+    "TaskResult", ["name", "lines", "rc", "records", "written", "skipped", "dependencies", "events"]
+)
+
+def make_escape(path):
+    """ Quote a path for a make-style dependency file """
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+ShardResult = collections.namedtuple(
+    "ShardResult", ["lines", "records", "written", "skipped", "fragments", "events"]
+)
+
+# Shards cut per --shard worker, so that the workers drawing small subtrees
+# pick up more of them
+SHARDS_PER_JOB = 4
+
+# Generator state shared with forked export workers (see runExportTasks)
+_forkState = None
+
+def _runForkedTask(index):
+    generator, rdl_root, table, cfg, tasks = _forkState
+    return generator.runTask(rdl_root, table, cfg, tasks[index], capture=True)
+
+# Sharded walk shared with forked shard workers (see walkSharded)
+_shardState = None
+
+def _walkForkedShard(index):
+    generator, sharded = _shardState
+    return generator.walkShard(sharded, index)
+
+
 class ralbotGenerator:
 
     def __init__(self, printer):
         self.printer = printer
+        self.package_hashes = {}
+        self.artifacts = []
+        self.profiler = PhaseProfiler()
+        self.tracer = Tracer()
+        self.walkAccounts = []
+        self.output_sink = OutputSink()
+        self.dependencies = []
 
     def createArgumentParser(self):
         ap = argparse.ArgumentParser()
@@ -67,22 +160,25 @@ class ralbotGenerator:
             '-t', '--top',
             metavar='<addrmap>',
             type=str,
-            dest='top_def_name',
+            action='append',
+            dest='top_def_names',
             help="Explicitly choose which addrmap in the root namespace will be the top-level component. "
-            "If unset, the last addrmap defined will be chosen"
+            "If unset, the last addrmap defined will be chosen. "
+            "Several tops may be given (-t a -t b, or -t a,b): the sources are then parsed once, "
+            "each top is elaborated and exported in parallel, and -o is the directory receiving "
+            "<output>/<top>/<top>.*"
         )
         ap.add_argument(
             '-o', '--output',
             metavar='<file>',
             type=str,
-            required=True,
             dest='output',
             help="Compile output artifact."
         )
         ap.add_argument(
             'src_files',
             metavar='src',
-            nargs='+',
+            nargs='*',
             type=str,
             help="List of input files"
         )
@@ -99,6 +195,21 @@ class ralbotGenerator:
             dest='gen_uvm',
             help="generate UVM reg model."
         )
+        ap.add_argument(
+            '--uvm-reuse-classes',
+            action='store_true',
+            dest='uvm_reuse_classes',
+            help="Emit one UVM class per distinct register, memory and block definition, shared by "
+            "all their instances and named after their RDL type, instead of one class per instance."
+        )
+        ap.add_argument(
+            '--uvm-split',
+            action='store_true',
+            dest='uvm_split',
+            help="Write the UVM reg model as one file per register block, in <output>_uvmreg/, included "
+            "by the package <output>_uvmreg_pkg.sv, itself listed in the filelist <output>_uvmreg.f, "
+            "instead of a single <output>_uvmreg.sv. Unchanged block files are not rewritten."
+        )
         ap.add_argument(
             '-doc', 
             action='store_true',
@@ -117,6 +228,20 @@ class ralbotGenerator:
             dest='gen_xml',
             help="generate IP-XACT xml file."
         )
+        ap.add_argument(
+            '-MD',
+            action='store_true',
+            dest='gen_depfile',
+            help="Also write a make-style dependency file listing every RDL source and include, "
+            "template and static asset the outputs were generated from."
+        )
+        ap.add_argument(
+            '-MF',
+            metavar='<file>',
+            type=str,
+            dest='depfile',
+            help="Dependency file to write (implies -MD, default <output>.d)."
+        )
         ap.add_argument(
             '-s', '--skip-not-present',
             action='store_true',
@@ -143,6 +268,101 @@ class ralbotGenerator:
             dest='debug_mode',
             help="Enable compiler debug mode (with yet more compiler status print out)."
         )
+        ap.add_argument(
+            '-j', '--jobs',
+            metavar='<N>',
+            type=int,
+            dest='jobs',
+            help="Run the selected exporters in N worker processes sharing one elaborated model "
+            "(default 1, or one per top when several -t are given)."
+        )
+        ap.add_argument(
+            '--shard',
+            action='store_true',
+            dest='shard',
+            help="With -j, split the top addrmap's children across the N workers, each running every "
+            "selected exporter on its share, instead of running one exporter per worker. "
+            "The outputs are the same as those of a serial run."
+        )
+        ap.add_argument(
+            '--cache-dir',
+            metavar='<dir>',
+            type=str,
+            default=default_cache_dir(),
+            dest='cache_dir',
+            help="Directory holding cached elaborated models (default %(default)s)."
+        )
+        ap.add_argument(
+            '--no-cache',
+            action='store_true',
+            dest='no_cache',
+            help="Always parse and elaborate the sources, bypassing the model cache."
+        )
+        ap.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            help="Regenerate every selected artifact, even if its inputs are unchanged."
+        )
+        ap.add_argument(
+            '--watch',
+            action='store_true',
+            dest='watch',
+            help="Stay resident and regenerate the outputs whenever a source or include file changes."
+        )
+        ap.add_argument(
+            '--watch-interval',
+            metavar='<seconds>',
+            type=float,
+            default=0.5,
+            dest='watch_interval',
+            help="Polling interval of --watch (default %(default)s)."
+        )
+        ap.add_argument(
+            '--manifest',
+            metavar='<blocks.json>',
+            type=str,
+            dest='batch_manifest',
+            help="Generate every block listed in a batch manifest instead of a single design. "
+            "Blocks run -j at a time and share the parsing of the manifest's common sources."
+        )
+        ap.add_argument(
+            '--batch-report',
+            metavar='<file>',
+            type=str,
+            default='ralbot_batch_report.json',
+            dest='batch_report',
+            help="Status and timing report of a --manifest run (default %(default)s)."
+        )
+        ap.add_argument(
+            '--profile',
+            metavar='<report.json>',
+            type=str,
+            dest='profile',
+            help="Write the wall and CPU time of every generation phase to a JSON report."
+        )
+        ap.add_argument(
+            '--profile-dir',
+            metavar='<dir>',
+            type=str,
+            dest='profile_dir',
+            help="With --profile, also dump cProfile stats of each top-level phase to <dir>/<phase>.prof."
+        )
+        ap.add_argument(
+            '--trace',
+            metavar='<trace.json>',
+            type=str,
+            dest='trace',
+            help="Write a Chrome trace of the generation phases, of every addrmap, regfile, mem and register walked, "
+            "and of the exporter methods emitting them. Open it in chrome://tracing or Perfetto."
+        )
+        ap.add_argument(
+            '--mem-report',
+            action='store_true',
+            dest='mem_report',
+            help="Track peak memory and the largest allocators of every phase with tracemalloc, and print a summary. "
+            "Slows generation down noticeably."
+        )
         return ap
 
     def getWarningMask(self, warning_flags):
@@ -198,12 +418,451 @@ class ralbotGenerator:
                 suppressed[flagName] = isNo
         return suppressed
 
-    def export(self):
+    def formatCompileError(self, e):
+        message = str(e)
+        if hasattr(e, '__cause__') and e.__cause__:
+            message = "%s Details: %s" % (message, e.__cause__)
+        return message
+
+    def getExportTasks(self, cfg):
+        """ Ordered list of exporter tasks selected by the command line """
+        base = os.path.splitext(cfg.output)[0]
+        tasks = []
+        if cfg.gen_header in ("all", "c"):
+            tasks.append(ExportTask("header-c", "C header", self.exportCHeader, "ralbot.headergen", [base + ".h"]))
+        if cfg.gen_header in ("all", "verilog"):
+            tasks.append(ExportTask("header-verilog", "verilog header", self.exportVerilogHeader, "ralbot.headergen", [base + ".svh"]))
+        if cfg.gen_uvm and cfg.uvm_split:
+            tasks.append(ExportTask("uvmregs", "uvm regmodel", self.exportUvmRegs, "ralbot.uvmgen",
+                [base + "_uvmreg_pkg.sv", base + "_uvmreg.f", base + "_uvmreg"]))
+        elif cfg.gen_uvm:
+            tasks.append(ExportTask("uvmregs", "uvm regmodel", self.exportUvmRegs, "ralbot.uvmgen", [base + "_uvmreg.sv"]))
+        if cfg.gen_docs:
+            tasks.append(ExportTask("doc", "reg html documents", self.exportDocs, "ralbot.html", [os.path.join(cfg.output, "docs")]))
+        if cfg.gen_xml:
+            tasks.append(ExportTask("xml", "IP-XACT xml file", self.exportXml, "ralbot.ipxact", [cfg.output + ".xml"]))
+        return tasks
+
+    def getTaskFingerprint(self, task, cfg, model_fingerprint):
+        """ Hash of the model, options and exporter code/templates a task depends on """
+        if task.package not in self.package_hashes:
+            package_dir = importlib.util.find_spec(task.package).submodule_search_locations[0]
+            self.package_hashes[task.package] = hash_tree(package_dir)
+        h = hashlib.sha256()
+        h.update(repr((model_fingerprint, task.name, cfg.output, self.getTaskOptions(task, cfg))).encode())
+        h.update(self.package_hashes[task.package].encode())
+        return h.hexdigest()
+
+    def getTaskOptions(self, task, cfg):
+        """ Options changing the outputs of a task, besides the model and output path """
+        if task.name == "uvmregs":
+            return (cfg.uvm_reuse_classes, cfg.uvm_split)
+        return ()
+
+    def getManifestKey(self, task, cfg):
+        return "%s:%s" % (os.path.basename(cfg.output), task.name)
+
+    def exportCHeader(self, rdl_root, table, cfg):
+        headerGen = load_exporter("ralbot.headergen")(languages="cpp", output_sink=self.output_sink)
+        return headerGen.begin(rdl_root, cfg.output, table=table)
+
+    def exportVerilogHeader(self, rdl_root, table, cfg):
+        headerGen = load_exporter("ralbot.headergen")(languages="verilog", output_sink=self.output_sink)
+        return headerGen.begin(rdl_root, cfg.output, table=table)
+
+    def exportUvmRegs(self, rdl_root, table, cfg):
+        uvmGen= load_exporter("ralbot.uvmgen")(output_sink=self.output_sink,
+            reuse_classes=cfg.uvm_reuse_classes, split_blocks=cfg.uvm_split)
+        return uvmGen.begin(rdl_root, cfg.output, table=table)
+
+    def exportDocs(self, rdl_root, table, cfg):
+        import markdown
+        md = markdown.Markdown(
+            extensions=['admonition']
+        )
+
+        html = load_exporter("ralbot.html")(markdown_inst=md, output_sink=self.output_sink)
+        return html.begin(
+            rdl_root,
+            os.path.join(cfg.output, "./docs"),
+            home_url="https://github.com/SystemRDL/RALBot-html",
+            profiler=self.profiler,
+            table=table
+        )
+
+    def exportXml(self, rdl_root, table, cfg):
+        exporter = load_exporter("ralbot.ipxact")(output_sink=self.output_sink)
+        return exporter.begin(rdl_root, cfg.output + ".xml", table=table)
+
+    def finishTask(self, task, exporter):
+        """ Write out the outputs of an exporter whose walk is complete """
+        exporter.finish()
+        self.dependencies.extend(getattr(exporter, "dependencies", ()))
+        self.profiler.sample()
+        self.printer.print_message("info", "Generating %s done..." % task.description)
+
+    def abortTask(self, exporter):
+        """ Drop the partial outputs of an exporter that failed before finishing """
+        abort = getattr(exporter, "abort", None)
+        if abort is not None:
+            abort()
+
+    def runTask(self, rdl_root, table, cfg, task, capture=False):
+        """
+        Run one exporter task, with a walk of its own, and return its TaskResult.
+        Messages, profile records and trace events are only captured when
+        `capture` is set, otherwise they go straight to the printer, profiler
+        and tracer.
+        """
+        name = task.name
+        if capture:
+            self.printer.startCapture()
+        first_record = len(self.profiler.records)
+        first_event = len(self.tracer.events)
+        written, skipped = self.output_sink.written, self.output_sink.skipped
+        first_dependency = len(self.dependencies)
+        rc = 0
+        exporter = None
+        try:
+            with self.profiler.phase(name):
+                self.printer.print_message("info", "Generating %s..." % task.description)
+                exporter = self.tracer.instrument(task.func(rdl_root, table, cfg))
+                with self.profiler.phase(exporter.walk_phase):
+                    TableWalker(tracer=self.tracer).walk(table.top, exporter)
+                self.finishTask(task, exporter)
+        except RDLCompileError as e:
+            self.abortTask(exporter)
+            self.printer.print_message("error", "%s: %s" % (name, self.formatCompileError(e)), None)
+            rc = 1
+        except BaseException:
+            self.abortTask(exporter)
+            raise
+        lines = self.printer.stopCapture() if capture else []
+        records = self.profiler.records[first_record:] if capture else []
+        events = self.tracer.events[first_event:] if capture else []
+        return TaskResult(
+            name, lines, rc, records,
+            self.output_sink.written - written, self.output_sink.skipped - skipped,
+            self.dependencies[first_dependency:], events
+        )
+
+    def walkShard(self, sharded, index):
+        """ Walk one shard of a ShardedWalk in a forked worker and return its ShardResult """
+        self.printer.startCapture()
+        first_record = len(self.profiler.records)
+        first_event = len(self.tracer.events)
+        written, skipped = self.output_sink.written, self.output_sink.skipped
+        # Only count what this shard's callbacks take
+        for account in self.walkAccounts:
+            account.reset()
+        with self.profiler.phase("shard %d" % index):
+            fragments = sharded.walk_shard(index)
+        for account in self.walkAccounts:
+            account.close()
+        return ShardResult(
+            self.printer.stopCapture(), self.profiler.records[first_record:],
+            self.output_sink.written - written, self.output_sink.skipped - skipped,
+            fragments, self.tracer.events[first_event:]
+        )
+
+    def walkSharded(self, table, exporters, jobs):
+        """
+        Walk the register table for `exporters` with the children of the top
+        entry split across `jobs` forked workers, and merge the shards back in
+        order. Returns {exporter: exception} as TableWalker.walk() does.
+        """
+        sharded = ShardedWalk(table.top, exporters, jobs * SHARDS_PER_JOB, catch=RDLCompileError, tracer=self.tracer)
+        if len(sharded.shards) < 2:
+            # Too small to split, or some exporter cannot be sharded
+            return sharded.walk()
+
+        sharded.enter()
+        global _shardState
+        _shardState = (self, sharded)
+        try:
+            with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                results = pool.map(_walkForkedShard, range(len(sharded.shards)), chunksize=1)
+        finally:
+            _shardState = None
+
+        for result in results:
+            if result.lines:
+                self.printer.emit_message(result.lines)
+            self.profiler.merge(result.records)
+            self.tracer.merge(result.events)
+            self.output_sink.written += result.written
+            self.output_sink.skipped += result.skipped
+        sharded.merge([result.fragments for result in results])
+        return sharded.exit()
+
+    def instrumentCallbacks(self, exporter, account):
+        """ Count the walk callbacks `exporter` implements in the PhaseAccount `account` """
+        callbacks = [
+            name for name in CALLBACKS
+            if getattr(type(exporter), name, None) is not getattr(TableListener, name, None)
+        ]
+        return account.instrument(exporter, callbacks)
+
+    def runTasksTogether(self, rdl_root, table, cfg, tasks, jobs=1):
+        """
+        Run the exporter tasks with a single walk of the register table that
+        drives all of their exporters, and return their TaskResults. With
+        several `jobs`, the walk is sharded across that many workers.
+        An exporter that fails leaves the walk and writes nothing, the others
+        still complete.
+        """
+        errors = {}
+        exporters = []
+        try:
+            # Each task is profiled as one phase, made of its begin(), its
+            # callbacks during the walk and its finish()
+            accounts = [self.profiler.account(task.name, snapshots=True) for task in tasks]
+            for task, account in zip(tasks, accounts):
+                with account.piece():
+                    self.printer.print_message("info", "Generating %s..." % task.description)
+                    try:
+                        exporter = self.tracer.instrument(task.func(rdl_root, table, cfg))
+                    except RDLCompileError as e:
+                        errors[task.name] = e
+                        continue
+                walk_account = self.profiler.account(exporter.walk_phase, account)
+                self.walkAccounts.append(walk_account)
+                exporters.append(self.instrumentCallbacks(exporter, walk_account))
+
+            try:
+                if jobs > 1:
+                    walk_errors = self.walkSharded(table, exporters, jobs)
+                else:
+                    walker = TableWalker(catch=RDLCompileError, tracer=self.tracer)
+                    walk_errors = walker.walk(table.top, *exporters)
+            finally:
+                walk_accounts, self.walkAccounts = self.walkAccounts, []
+
+            results = []
+            pending = iter(exporters)
+            walk_accounts = iter(walk_accounts)
+            for task, account in zip(tasks, accounts):
+                written, skipped = self.output_sink.written, self.output_sink.skipped
+                first_dependency = len(self.dependencies)
+                rc = 0
+                if task.name not in errors:
+                    exporter = next(pending)
+                    if exporter in walk_errors:
+                        errors[task.name] = walk_errors[exporter]
+                        self.abortTask(exporter)
+                    else:
+                        with account.piece():
+                            self.finishTask(task, exporter)
+                    next(walk_accounts).close()
+                account.close()
+                if task.name in errors:
+                    self.printer.print_message("error", "%s: %s" % (task.name, self.formatCompileError(errors[task.name])), None)
+                    rc = 1
+                results.append(TaskResult(
+                    task.name, [], rc, [],
+                    self.output_sink.written - written, self.output_sink.skipped - skipped,
+                    self.dependencies[first_dependency:], []
+                ))
+        except BaseException:
+            # Leave no partial outputs behind, whatever went wrong. Finished
+            # exporters have nothing left to drop.
+            for exporter in exporters:
+                self.abortTask(exporter)
+            raise
+        return results
+
+    def runExportTasks(self, rdl_root, cfg, tasks):
+        """
+        Run the exporter tasks, either in this process with one shared walk or
+        in a pool of forked workers that share the elaborated tree copy-on-write.
+        The workers run one task each or, with --shard, walk a share of the
+        top-level children for every task. Messages are replayed in task or
+        shard order, so the output does not depend on which worker finishes
+        first. Returns the TaskResult of every task.
+        """
+        shard = cfg.shard
+        jobs = cfg.jobs if shard else min(cfg.jobs, len(tasks))
+        if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            self.printer.print_message("warning", "--jobs needs the 'fork' start method, running exporters serially", None)
+            jobs = 1
+
+        # Read the model once into the table every exporter walks. Workers
+        # inherit it, so it is also built only once when running in parallel.
+        with self.profiler.phase("register table"), gc_paused():
+            table = RegisterTable(rdl_root)
+
+        # The tree and the table live until the end of the run: keep the
+        # collector from rescanning them during every export and, when
+        # forking, from touching the inherited pages so they stay shared
+        gc.freeze()
+        try:
+            if jobs <= 1 or shard:
+                results = self.runTasksTogether(rdl_root, table, cfg, tasks, jobs)
+            else:
+                global _forkState
+                _forkState = (self, rdl_root, table, cfg, tasks)
+                try:
+                    with multiprocessing.get_context("fork").Pool(jobs) as pool:
+                        results = pool.map(_runForkedTask, range(len(tasks)), chunksize=1)
+                finally:
+                    _forkState = None
+        finally:
+            gc.unfreeze()
+
+        if jobs > 1 and not shard:
+            for result in results:
+                if result.lines:
+                    self.printer.emit_message(result.lines)
+                self.profiler.merge(result.records)
+                self.tracer.merge(result.events)
+                self.output_sink.written += result.written
+                self.output_sink.skipped += result.skipped
+                self.dependencies.extend(result.dependencies)
+
+        return results
+
+    def createCompiler(self, cfg):
+        return RdlCompiler(
+            printer=self.printer,
+            incl_search_paths=cfg.incl_search_paths,
+            top_def_name=cfg.top_def_name,
+            skip_not_present=cfg.skip_not_present,
+            warning_flags=cfg.warning_flags,
+            src_files=cfg.src_files,
+            cache_dir=None if cfg.no_cache else cfg.cache_dir,
+            profiler=self.profiler
+        )
+
+    def generate(self, rdl_compiler, cfg):
+        """
+        Compile the sources and run every stale exporter.
+        Returns the names of the exporters that failed.
+        """
+        self.printer.print_message("info", "Start code generation...")
+
+        # Skip every artifact whose inputs did not change since it was written
+        with self.profiler.phase("fingerprint"):
+            manifest = ArtifactManifest(os.path.dirname(cfg.output))
+            # Read the sources once for the fingerprints and the model cache
+            file_keys = rdl_compiler.getFileKeys()
+            model_fingerprint = rdl_compiler.fingerprint(file_keys)
+            fingerprints = {}
+            inputs = {}
+            all_tasks = self.getExportTasks(cfg)
+            tasks = []
+            for task in all_tasks:
+                self.artifacts.extend(task.outputs)
+                key = self.getManifestKey(task, cfg)
+                fingerprints[task.name] = self.getTaskFingerprint(task, cfg, model_fingerprint)
+                if not cfg.force and manifest.isFresh(key, fingerprints[task.name]):
+                    self.printer.print_message("info", "%s is up to date" % task.name)
+                    inputs[task.name] = manifest.getInputs(key)
+                    continue
+                tasks.append(task)
+
+        failed = []
+        if tasks:
+            rdl_root = rdl_compiler.compile(file_keys)
+            written, skipped = self.output_sink.written, self.output_sink.skipped
+            results = self.runExportTasks(rdl_root, cfg, tasks)
+            self.printer.print_message("info", "%d output files written, %d unchanged" % (
+                self.output_sink.written - written, self.output_sink.skipped - skipped
+            ))
+
+            with self.profiler.phase("manifest"):
+                for task, result in zip(tasks, results):
+                    key = self.getManifestKey(task, cfg)
+                    if result.rc != 0:
+                        failed.append(task.name)
+                        manifest.discard(key)
+                    else:
+                        inputs[task.name] = result.dependencies
+                        manifest.record(key, fingerprints[task.name], task.outputs, result.dependencies)
+                manifest.save()
+
+        if (cfg.gen_depfile or cfg.depfile) and not failed:
+            dependencies = rdl_compiler.getSourceFiles()
+            for task in all_tasks:
+                dependencies.extend(inputs[task.name])
+            self.writeDepfile(cfg.depfile or cfg.output + ".d", all_tasks, dependencies)
+
+        return failed
+
+    def writeDepfile(self, path, tasks, dependencies):
+        """
+        Write a make-style dependency file making every output of `tasks`
+        depend on `dependencies`. Output directories are represented by their
+        index.html, or by the other outputs of their task if they have none.
+        """
+        targets = []
+        for task in tasks:
+            for output in task.outputs:
+                if os.path.isdir(output):
+                    output = os.path.join(output, "index.html")
+                    if not os.path.isfile(output):
+                        continue
+                targets.append(make_escape(output))
+        lines = [" ".join(targets) + ":"]
+        for dependency in collections.OrderedDict.fromkeys(dependencies):
+            lines.append(" " + make_escape(dependency))
+        self.output_sink.write_file(path, " \\\n".join(lines) + "\n")
+
+    def getFileStamps(self, files):
+        stamps = {}
+        for path in files:
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def watch(self, rdl_compiler, cfg):
+        """
+        Stay resident and regenerate whenever a source or include changes.
+        Files are polled with os.stat; the include list is only rescanned after
+        a change, so an idle poll costs one stat per file.
+        """
+        files = list(cfg.src_files)
+        stamps = None
+        try:
+            while True:
+                new_stamps = self.getFileStamps(files)
+                if new_stamps != stamps:
+                    try:
+                        self.generate(rdl_compiler, cfg)
+                        files = rdl_compiler.getSourceFiles()
+                    except RDLCompileError as e:
+                        self.printer.print_message("error", self.formatCompileError(e), None)
+                    except OSError as e:
+                        # A file is missing while an editor saves it by renaming a new one
+                        self.printer.print_message("error", str(e), None)
+                    stamps = self.getFileStamps(files)
+                    self.printer.print_message("info", "Watching %d files for changes..." % len(files))
+                time.sleep(cfg.watch_interval)
+        except KeyboardInterrupt:
+            pass
+
+    def writeReports(self, cfg):
+        """ Write the --profile and --trace reports and print the --mem-report summary """
+        if cfg.profile:
+            self.profiler.write(cfg.profile)
+        if cfg.trace:
+            self.tracer.add_phases(self.profiler.records)
+            self.tracer.write(cfg.trace)
+        if cfg.mem_report:
+            self.printer.emit_message(self.profiler.getMemorySummary())
+
+    def export(self, argv=None):
 
         try:
             parser = self.createArgumentParser()
-            cfg = parser.parse_args()
+            cfg = parser.parse_args(argv)
             cfg.warning_flags = self.getWarningFlags(cfg.warning_spec)
+            tops = [top for spec in cfg.top_def_names or [] for top in spec.split(",") if top]
+            cfg.top_def_name = tops[0] if len(tops) == 1 else None
+            if cfg.jobs is None:
+                cfg.jobs = min(len(tops), os.cpu_count() or 1) if len(tops) > 1 else 1
 
             if cfg.debug_mode:
                 self.printer.enable('info')
@@ -211,17 +870,20 @@ class ralbotGenerator:
             elif cfg.verbose_mode:
                 self.printer.enable('info')
 
-            rdl_compiler = RdlCompiler(
-                printer=self.printer,
-                incl_search_paths=cfg.incl_search_paths,
-                top_def_name=cfg.top_def_name,
-                skip_not_present=cfg.skip_not_present,
-                warning_flags=cfg.warning_flags,
-                src_files=cfg.src_files
-            )
+            if cfg.profile or cfg.mem_report or cfg.trace:
+                self.profiler = PhaseProfiler(enabled=True, prof_dir=cfg.profile_dir, track_memory=cfg.mem_report)
+            if cfg.trace:
+                self.tracer = Tracer(enabled=True, t0=self.profiler.t0)
+
+            if cfg.batch_manifest:
+                failed = batchgen.run_batch(self, cfg)
+                self.writeReports(cfg)
+                if failed:
+                    sys.exit(1)
+                return
 
-            self.printer.print_message("info", "Start code generation...")
-            rdl_root = rdl_compiler.compile()
+            if not cfg.output or not cfg.src_files:
+                parser.error("the following arguments are required: -o/--output, src")
 
             if not (cfg.gen_header or cfg.gen_uvm or cfg.gen_docs or cfg.gen_verilog or cfg.gen_xml):
                 self.printer.print_message("error", "At least one type(-header, -uvmregs, -doc, -verilog, -xml) generate")
@@ -230,55 +892,27 @@ class ralbotGenerator:
                 self.printer.print_message("warning", "Not yet implemented, Coming soon!!!", None)
                 sys.exit(1)
 
-            if cfg.gen_header == "all":
-                self.printer.print_message("info", "Generating header...")
-                headerGen = headerGenExporter(languages="cpp")
-                headerGen.export(rdl_root, cfg.output)
-                headerGen = headerGenExporter(languages="verilog")
-                headerGen.export(rdl_root, cfg.output)
-                self.printer.print_message("info", "Generating header done...")
-            elif cfg.gen_header == "verilog":
-                headerGen = headerGenExporter(languages="verilog")
-                headerGen.export(rdl_root, cfg.output)
-            elif cfg.gen_header == "c":
-                headerGen = headerGenExporter(languages="cpp")
-                headerGen.export(rdl_root, cfg.output)
-
-            if cfg.gen_uvm:
-                self.printer.print_message("info", "Generating uvm regmodel...")
-                uvmGen= uvmGenExporter()
-                uvmGen.export(rdl_root, cfg.output)
-                self.printer.print_message("info", "Generating uvm regmodel done...")
-
-            if cfg.gen_docs:
-                self.printer.print_message("info", "Generating reg html documents...")
-                md = markdown.Markdown(
-                    extensions=['admonition']
-                )
-                
-                html = HTMLExporter(markdown_inst=md)
-                html.export(
-                    rdl_root,
-                    os.path.join(cfg.output, "./docs"),
-                    home_url="https://github.com/SystemRDL/RALBot-html"
-                )
-                self.printer.print_message("info", "Generating reg html documents done...")
-
-            if cfg.gen_verilog:
-                self.printer.print_message("info", "Generating reg verilog module...")
-                sys.exit(1)
+            if len(tops) > 1:
+                if cfg.watch:
+                    parser.error("--watch takes a single -t")
+                report = batchgen.run_blocks(self, cfg, cfg.src_files, batchgen.get_top_blocks(cfg, tops))
+                self.writeReports(cfg)
+                if report["failed"]:
+                    sys.exit(1)
+                return
 
-            if cfg.gen_xml:
-                self.printer.print_message("info", "Generating IP-XACT xml file...")
-                exporter = IPXACTExporter()
-                exporter.export(rdl_root, cfg.output + ".xml")                
-                self.printer.print_message("info", "Generating IP-XACT xml file done...")
+            rdl_compiler = self.createCompiler(cfg)
+
+            if cfg.watch:
+                self.watch(rdl_compiler, cfg)
+            else:
+                failed = self.generate(rdl_compiler, cfg)
+                self.writeReports(cfg)
+                if failed:
+                    sys.exit(1)
 
         except RDLCompileError as e:
-            message = str(e)
-            if hasattr(e, '__cause__') and e.__cause__:
-                message = "%s Details: %s" % (message, e.__cause__)
-            self.printer.print_message("error", message, None)
+            self.printer.print_message("error", self.formatCompileError(e), None)
 
 if __name__ == "__main__":
     ralbotGenerator(RDLMessagePrinter()).export()
@@ -1,9 +1,121 @@
 from systemrdl import RDLCompiler, RDLListener, RDLWalker, RDLCompileError
+from systemrdl import rdltypes
 from systemrdl.node import FieldNode
 from systemrdl.messages import MessagePrinter, Severity
+from systemrdl.preprocessor.preprocessor import FilePreprocessor
+from systemrdl.preprocessor.segment_map import IncludeRef
+from systemrdl.__about__ import __version__ as systemrdl_version
 import systemrdl.warnings as warnings
 
+import os
+import gc
 import sys
+import enum
+import time
+import pickle
+import copyreg
+import contextlib
+import hashlib
+import tempfile
+import collections
+
+# Bump when the layout of cached models changes
+CACHE_FORMAT = 3
+
+# A parsed state is cached once the parsing it saves took this many times as
+# long as caching the previous state, which bounds the overhead to about 25%
+PARSE_CACHE_RATIO = 4
+
+# Parsed states kept in the cache, least recently used ones are dropped first
+PARSE_CACHE_ENTRIES = 64
+
+# Elaborated models kept in the cache, pruned like the parsed states
+MODEL_CACHE_ENTRIES = 64
+
+def default_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "ralbot")
+
+@contextlib.contextmanager
+def gc_paused():
+    """
+    Pause the cycle collector. (Un)pickling a model creates or visits millions
+    of long-lived objects, and collections triggered along the way would scan
+    all of them again and again.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _rebuild_user_enum(name, entries, parent_scope):
+    enum_type = rdltypes.UserEnum(name, entries) #pylint: disable=no-value-for-parameter
+    enum_type._set_parent_scope(parent_scope)
+    return enum_type
+
+def _rebuild_user_struct(base, name, members, is_abstract, parent_scope):
+    own_members = collections.OrderedDict(
+        (k, v) for k, v in members.items() if k not in base._members
+    )
+    struct_type = base.define_new(name, own_members, is_abstract)
+    struct_type._set_parent_scope(parent_scope)
+    return struct_type
+
+def _reduce_enum_class(cls):
+    if issubclass(cls, rdltypes.UserEnum) and cls is not rdltypes.UserEnum:
+        entries = collections.OrderedDict(
+            (m.name, (m.value, m.rdl_name, m.rdl_desc)) for m in cls
+        )
+        return _rebuild_user_enum, (cls.__name__, entries, cls.get_parent_scope())
+    # Any other enum can be imported back
+    return cls.__qualname__
+
+class ModelPickler(pickle.Pickler):
+    """
+    Pickler for elaborated models and parsed compiler states.
+    User enums are classes created on the fly by the compiler, so they are
+    pickled by value and rebuilt on load. They are caught by the dispatch
+    table, which costs no Python call per pickled object.
+    """
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[enum.EnumMeta] = _reduce_enum_class
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+
+class StructModelPickler(ModelPickler):
+    """
+    Slower ModelPickler for models using user structs. Their classes cannot be
+    caught by the dispatch table, so every pickled object is checked.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and issubclass(obj, rdltypes.UserStruct) and obj is not rdltypes.UserStruct:
+            return _rebuild_user_struct, (
+                obj.__bases__[0], obj.__name__, obj._members,
+                obj._is_abstract, obj.get_parent_scope()
+            )
+        return NotImplemented
+
+class MessageRecorder:
+    """
+    Printer of a compiler's messages that passes them on to `printer` and
+    keeps them, so they are cached with the compiler state or model and
+    printed again when it is restored.
+    """
+    def __init__(self, printer, messages=()):
+        self.printer = printer
+        self.messages = list(messages)
+
+    def print_message(self, severity, text, src_ref=None):
+        self.messages.append((severity, text, src_ref))
+        self.printer.print_message(severity, text, src_ref)
+
+    def replay(self, messages):
+        for message in messages:
+            self.print_message(*message)
 
 class RdlCompiler:
 
@@ -16,6 +128,11 @@ class RdlCompiler:
         self.skip_not_present = kwargs.pop('skip_not_present', False)
         self.warning_flags = kwargs.pop('warning_flags', [])
         self.src_files = kwargs.pop('src_files', [])
+        self.cache_dir = kwargs.pop('cache_dir', None)
+        # (RDLCompiler, files) with `files` already compiled into it. Used to
+        # parse sources shared by several compiles only once.
+        self.preloaded = kwargs.pop('preloaded', None)
+        self.profiler = kwargs.pop('profiler', None)
 
     def print_message(self, severity, text, src_ref=None):
         """ Wrapper to printer.print_message allowing default `src_ref` """
@@ -42,21 +159,251 @@ class RdlCompiler:
                 mask |= bits
         return mask
 
-    def compile(self):
+    def phase(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+
+    def getIncludeFiles(self, env, path, incl_ref=None):
+        """ Files `include-d by `path`, resolved the same way the preprocessor does """
+        fpp = FilePreprocessor(env, path, self.incl_search_paths or [], incl_ref)
+        includes = []
+        for typ, start, _ in fpp.tokenize():
+            if typ != "incl":
+                continue
+            end, incl_path = fpp.parse_include(start)
+            includes.append(incl_path)
+            child_ref = IncludeRef(start, end, path, incl_ref)
+            includes.extend(self.getIncludeFiles(env, incl_path, child_ref))
+        return includes
 
+    def getSourceFiles(self):
+        """ Every file read by compile(): the sources followed by their includes """
+        env = RDLCompiler(message_printer=self.printer).env
+        files = []
+        for input_file in self.src_files:
+            files.append(input_file)
+            files.extend(self.getIncludeFiles(env, input_file))
+        return list(collections.OrderedDict.fromkeys(files))
+
+    def getFileKeys(self, warning_mask=None):
+        """
+        Cache key of the parsed state after each source file. The key of a
+        file hashes the absolute path and content of the file and of its
+        includes, chained with the key of the previous file, since a file can
+        use the types defined by the ones before it.
+
+        This reads every source, so a compile computes the keys once and
+        passes them to the methods taking `keys`.
+        """
+        if warning_mask is None:
+            warning_mask = self.getWarningMask(self.warning_flags)
+        env = RDLCompiler(message_printer=self.printer).env
+        h = hashlib.sha256()
+        h.update(repr((
+            CACHE_FORMAT, systemrdl_version, sys.version_info[:2],
+            [os.path.abspath(path) for path in self.incl_search_paths or []], warning_mask
+        )).encode())
+        keys = []
+        for input_file in self.src_files:
+            for path in [input_file] + self.getIncludeFiles(env, input_file):
+                with open(path, 'rb') as f:
+                    h.update(os.path.abspath(path).encode())
+                    h.update(hashlib.sha256(f.read()).digest())
+            keys.append(h.hexdigest())
+        return keys
+
+    def fingerprint(self, keys=None):
+        """ Hash of everything that affects the elaborated model, given the getFileKeys() """
+        if keys is None:
+            keys = self.getFileKeys()
+        h = hashlib.sha256()
+        h.update(repr((self.top_def_name, keys[-1] if keys else None)).encode())
+        return h.hexdigest()
+
+    def getCachePath(self, keys=None):
+        """ Model cache file of the current sources, None if caching is off """
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, self.fingerprint(keys) + ".pickle")
+
+    def getParseCachePath(self, key):
+        return os.path.join(self.cache_dir, "parsed", key + ".pickle")
+
+    def parseSources(self, warning_mask=None, recorder=None, keys=None):
+        """
+        Returns an RDLCompiler with every source compiled into it.
+
+        With a cache directory, the compiler's state is cached after source
+        files. The longest run of leading files that did not change is
+        restored from the cache, and only the files after it are parsed again.
+        Each state holds everything parsed before it, so states are cached
+        less often as they grow (see PARSE_CACHE_RATIO). The state after the
+        last file is always cached.
+
+        The compiler's messages go through `recorder`, a MessageRecorder, and
+        are cached with the states. Those of a restored state are printed again.
+        `keys` are the getFileKeys() of the sources, if already computed.
+        """
+        if warning_mask is None:
+            warning_mask = self.getWarningMask(self.warning_flags)
+        if recorder is None:
+            recorder = MessageRecorder(self.printer)
+
+        if not self.cache_dir:
+            keys = []
+        elif keys is None:
+            keys = self.getFileKeys(warning_mask)
+        rdlc = None
+        start = 0
+        # Caching the next state costs at least as much as loading this one
+        store_time = 0.0
+        with self.phase("parse-cache-load"):
+            for i in reversed(range(len(keys))):
+                cache_path = self.getParseCachePath(keys[i])
+                if not os.path.exists(cache_path):
+                    continue
+                t = time.perf_counter()
+                cached = self.loadCachedModel(cache_path)
+                store_time = time.perf_counter() - t
+                if cached is not None:
+                    rdlc, messages = cached
+                    # Keep recently used states from being pruned
+                    os.utime(cache_path)
+                    start = i + 1
+                    self.print_message(Severity.INFO, "Restored %d of %d parsed sources from cache" % (start, len(keys)))
+                    rdlc.env.msg.printer = recorder
+                    recorder.replay(messages)
+                    break
+
+        if rdlc is None:
+            rdlc = RDLCompiler(message_printer=recorder,
+                               warning_flags=warning_mask)
+
+        parse_time = 0.0
+        # Keep the collector from rescanning the restored state while parsing
+        gc.freeze()
+        try:
+            with self.phase("compile"):
+                for i in range(start, len(self.src_files)):
+                    self.print_message(
+                        Severity.NONE, str.format("Compiling {0} ...", self.src_files[i]))
+                    t = time.perf_counter()
+                    rdlc.compile_file(self.src_files[i], self.incl_search_paths)
+                    parse_time += time.perf_counter() - t
+                    if keys and (parse_time >= PARSE_CACHE_RATIO * store_time or i == len(keys) - 1):
+                        t = time.perf_counter()
+                        self.storeCachedModel(self.getParseCachePath(keys[i]), rdlc, recorder.messages)
+                        store_time = time.perf_counter() - t
+                        parse_time = 0.0
+        finally:
+            gc.unfreeze()
+        if start < len(keys):
+            self.pruneCache(os.path.dirname(self.getParseCachePath("")), PARSE_CACHE_ENTRIES)
+        return rdlc
+
+    def pruneCache(self, dirname, entries):
+        """ Remove the least recently used cache files of `dirname` beyond the first `entries` """
+        try:
+            paths = [os.path.join(dirname, name) for name in os.listdir(dirname) if name.endswith(".pickle")]
+            paths.sort(key=os.path.getmtime, reverse=True)
+            for path in paths[entries:]:
+                os.remove(path)
+        except OSError:
+            # Raced with another ralbotgen run pruning the same cache
+            pass
+
+    def loadCachedModel(self, cache_path):
+        """
+        Load an elaborated model or parsed compiler state, printing through our
+        printer. Returns it with the messages printed while it was built.
+        """
+        try:
+            with open(cache_path, 'rb') as f, gc_paused():
+                obj, messages = pickle.load(f)
+            obj.env.msg.printer = self.printer
+            return obj, messages
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # Truncated or stale entry. Drop it and compile from scratch
+            self.print_message(Severity.WARNING, "discarding unreadable model cache %s (%s)" % (cache_path, e))
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+            return None
+
+    def storeCachedModel(self, cache_path, obj, messages):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+        # The printer is left out, the loading compiler plugs in its own
+        msg = obj.env.msg
+        printer, msg.printer = msg.printer, None
+        try:
+            with os.fdopen(fd, 'wb') as f, gc_paused():
+                try:
+                    ModelPickler(f).dump((obj, messages))
+                except pickle.PicklingError:
+                    f.seek(0)
+                    f.truncate()
+                    StructModelPickler(f).dump((obj, messages))
+            os.replace(tmp_path, cache_path)
+        except (pickle.PicklingError, TypeError, RecursionError, OSError) as e:
+            self.print_message(Severity.WARNING, "could not write model cache %s (%s)" % (cache_path, e))
+            os.remove(tmp_path)
+        finally:
+            msg.printer = printer
+
+    def compile(self, keys=None):
+        """
+        Returns the elaborated model of the sources, from the cache if it
+        holds it. `keys` are the getFileKeys() of the sources, if already
+        computed.
+        """
         warning_mask = self.getWarningMask(self.warning_flags)
         self.print_message(Severity.NONE, str.format(
             "warning_mask: {0}", warning_mask), None)
 
-        rdlc = RDLCompiler(message_printer=self.printer,
-                           warning_flags=warning_mask)
+        if keys is None and self.cache_dir:
+            keys = self.getFileKeys(warning_mask)
+        cache_path = self.getCachePath(keys)
+        if cache_path:
+            with self.phase("cache-load"):
+                cached = self.loadCachedModel(cache_path)
+            if cached is not None:
+                root, messages = cached
+                # Keep recently used models from being pruned
+                os.utime(cache_path)
+                self.print_message(Severity.INFO, "Using cached model %s" % cache_path)
+                for message in messages:
+                    self.printer.print_message(*message)
+                return root
 
-        for input_file in self.src_files:
-            self.print_message(
-                Severity.NONE, str.format("Compiling {0} ...", input_file))
-            rdlc.compile_file(input_file, self.incl_search_paths)
+        recorder = MessageRecorder(self.printer)
+        if self.preloaded is not None:
+            rdlc, precompiled = self.preloaded
+            rdlc.env.msg.printer = recorder
+            # Errors of an earlier compile sharing it must not fail this one
+            rdlc.env.msg.had_error = False
+            with self.phase("compile"):
+                for input_file in self.src_files:
+                    if input_file in precompiled:
+                        continue
+                    self.print_message(
+                        Severity.NONE, str.format("Compiling {0} ...", input_file))
+                    rdlc.compile_file(input_file, self.incl_search_paths)
+        else:
+            rdlc = self.parseSources(warning_mask, recorder, keys)
 
         self.print_message(Severity.NONE, "Elaborating ...")
-        root = rdlc.elaborate(top_def_name=self.top_def_name)
+        with self.phase("elaborate"):
+            root = rdlc.elaborate(top_def_name=self.top_def_name)
+
+        if cache_path:
+            with self.phase("cache-store"):
+                self.storeCachedModel(cache_path, root, recorder.messages)
+                self.pruneCache(self.cache_dir, MODEL_CACHE_ENTRIES)
+        root.env.msg.printer = self.printer
 
         return root
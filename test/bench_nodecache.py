@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Node cache benchmark.
+#
+# Exports a generated design to HTML, whose templates read the systemrdl nodes
+# through a NodeCache, and reports per method how many calls the templates
+# made and how many of them reached systemrdl.
+#
+# Usage: python test/bench_nodecache.py [blocks] [regs] [fields]
+
+import sys
+import time
+import tempfile
+
+from testlib import compile_source
+from ralbot.common import RegisterTable, TableWalker
+from ralbot.html import HTMLExporter
+from rdlgen import generate_rdl
+
+def run_benchmark(blocks, regs, fields):
+    top = compile_source(generate_rdl(blocks, regs, fields))
+    table = RegisterTable(top)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        context = HTMLExporter().begin(top, tmp_dir, table=table)
+        TableWalker().walk(table.top, context)
+        context.finish()
+        elapsed = time.perf_counter() - start
+
+    cache = context.node_cache
+    return {
+        "registers": len(table.registers),
+        "requests": dict(cache.requests),
+        "forwarded": dict(cache.forwarded),
+        "saved": cache.saved,
+        "time": elapsed,
+    }
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]] or [16, 256, 4]
+    result = run_benchmark(*args)
+    print("%d registers, html export %.3f s" % (result["registers"], result["time"]))
+    print("%-16s %10s %10s %10s" % ("method", "requests", "forwarded", "saved"))
+    for method, requests in sorted(result["requests"].items()):
+        forwarded = result["forwarded"].get(method, 0)
+        print("%-16s %10d %10d %10d" % (method, requests, forwarded, requests - forwarded))
+    print("%d calls saved" % result["saved"])
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Register table benchmark.
+#
+# Compares the node traversal each exporter used to do on its own (one walk
+# of the systemrdl tree per exporter, reading properties through the Node API)
+# with building one RegisterTable and walking its entries once per exporter.
+# Reports time and peak traced memory of both, and the resident size of the
+# table.
+#
+# Usage: python test/bench_regtable.py [blocks] [regs] [fields]
+
+import sys
+import time
+import tracemalloc
+
+from testlib import compile_source
+from systemrdl.node import AddrmapNode, RegfileNode, MemNode, RegNode
+from ralbot.common import RegisterTable
+from rdlgen import generate_rdl
+
+# headergen, uvmgen, html and ipxact
+EXPORTER_WALKS = 4
+
+FIELD_PROPERTIES = [
+    "name", "desc", "ispresent", "reset", "sw", "rclr", "rset", "woclr",
+    "woset", "onread", "onwrite", "encode", "donttest",
+]
+
+def walk_nodes(node):
+    """ One exporter walk over the systemrdl tree. Returns the number of fields read """
+    count = 0
+    for prop in ("name", "desc", "ispresent"):
+        node.get_property(prop)
+    node.inst.addr_offset, node.size
+    for child in node.children(skip_not_present=False):
+        if isinstance(child, RegNode):
+            child.get_property("regwidth"), child.get_property("accesswidth")
+            child.inst.addr_offset, child.size
+            for field in child.fields(skip_not_present=False):
+                for prop in FIELD_PROPERTIES:
+                    field.get_property(prop)
+                field.low, field.width, field.is_sw_writable, field.is_volatile
+                count += 1
+        elif isinstance(child, (AddrmapNode, RegfileNode, MemNode)):
+            count += walk_nodes(child)
+    return count
+
+def walk_table(entry):
+    """ Same walk over the register table """
+    count = 0
+    entry.name, entry.desc, entry.is_present
+    entry.raw_address_offset, entry.size
+    for child in entry.children:
+        if hasattr(child, "fields"):
+            child.regwidth, child.accesswidth
+            child.raw_address_offset, child.size
+            for field in child.fields:
+                field.name, field.desc, field.is_present, field.reset, field.sw
+                field.rclr, field.rset, field.woclr, field.woset
+                field.onread, field.onwrite, field.encode, field.donttest
+                field.low, field.width, field.is_sw_writable, field.is_volatile
+                count += 1
+        else:
+            count += walk_table(child)
+    return count
+
+def measure(func):
+    """ Returns (result, seconds, peak traced bytes) of func() """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def node_traversals(top):
+    return [walk_nodes(top) for _ in range(EXPORTER_WALKS)]
+
+def table_traversals(top):
+    table = RegisterTable(top)
+    return table, [walk_table(table.top) for _ in range(EXPORTER_WALKS)]
+
+def run_benchmark(blocks, regs, fields):
+    top = compile_source(generate_rdl(blocks, regs, fields))
+
+    node_counts, node_time, node_peak = measure(lambda: node_traversals(top))
+    (table, table_counts), table_time, table_peak = measure(lambda: table_traversals(top))
+
+    # Resident size of the table, measured apart from the walks
+    tracemalloc.start()
+    table = RegisterTable(top)
+    table_size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        "registers": len(table.registers),
+        "fields": len(table.fields),
+        "node_counts": node_counts,
+        "table_counts": table_counts,
+        "node_time": node_time,
+        "node_peak": node_peak,
+        "table_time": table_time,
+        "table_peak": table_peak,
+        "table_size": table_size,
+    }
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]] or [16, 256, 4]
+    result = run_benchmark(*args)
+    print("%d registers, %d fields, %d exporter walks" % (
+        result["registers"], result["fields"], EXPORTER_WALKS
+    ))
+    print("node traversals : %8.3f s  peak %8.1f MiB" % (result["node_time"], result["node_peak"] / 2**20))
+    print("register table  : %8.3f s  peak %8.1f MiB  (table %.1f MiB)" % (
+        result["table_time"], result["table_peak"] / 2**20, result["table_size"] / 2**20
+    ))
+    print("speedup %.2fx" % (result["node_time"] / result["table_time"]))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# Exporter benchmark suite.
+#
+# Generates designs of several sizes with rdlgen.py and measures, for each of
+# them, the time and peak traced memory of the RDL compile, of building the
+# register table, and of every exporter. Results are written to a JSON file
+# that later runs can be compared against to catch performance regressions.
+#
+# Time and memory are measured in separate runs of each phase, since tracing
+# allocations slows Python down several times.
+#
+# Usage: python test/bench_suite.py [-s 1000,10000,100000] [-o results.json]
+#                                   [-b baseline.json] [design options]
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+from testlib import EXPORTERS, compile_design
+import systemrdl
+from ralbot.common import RegisterTable
+from rdlgen import generate_rdl, parse_dims
+
+FORMAT_VERSION = 1
+
+# Differences below these are noise, whatever the ratio
+MIN_TIME = 0.05
+MIN_PEAK = 256 * 1024
+
+#===============================================================================
+def measure_time(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def measure_peak(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench_design(registers, design, work_dir, memory=True):
+    """
+    Benchmarks one design of about `registers` registers.
+    Returns {phase: {"time": seconds, "peak": bytes}}.
+    """
+    regs = design["regs"]
+    blocks = max(math.ceil(registers / regs), 1)
+    rdl_path = os.path.join(work_dir, "bench.rdl")
+    with open(rdl_path, "w") as f:
+        f.write(generate_rdl(
+            blocks, regs, design["fields"], dims=design["dims"],
+            desc_length=design["desc_length"], enums=design["enums"]
+        ))
+
+    def run(phase, func):
+        result, elapsed = measure_time(func)
+        results[phase] = {"time": elapsed}
+        if memory:
+            result, results[phase]["peak"] = measure_peak(func)
+        return result
+
+    results = {}
+    top = run("compile", lambda: compile_design(rdl_path))
+    table = run("register table", lambda: RegisterTable(top))
+
+    for name, create, path in EXPORTERS:
+        out_dir = os.path.join(work_dir, "out")
+        def export():
+            shutil.rmtree(out_dir, ignore_errors=True)
+            create().export(top, os.path.join(out_dir, path), table=table)
+        run(name, export)
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {"registers": len(table.registers), "phases": results}
+
+def run_suite(sizes, design, memory=True):
+    """ Returns the JSON-ready results of the suite """
+    runs = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for registers in sizes:
+            runs[str(registers)] = bench_design(registers, design, work_dir, memory)
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "systemrdl": systemrdl.__version__,
+        "design": dict(design, dims=list(design["dims"])),
+        "runs": runs,
+    }
+
+#===============================================================================
+def compare(results, baseline, tolerance):
+    """
+    Compares results against a baseline of the same design.
+    Returns a list of (size, phase, metric, baseline value, value) for the
+    metrics that grew by more than `tolerance` (a fraction).
+    """
+    if baseline.get("version") != FORMAT_VERSION:
+        raise ValueError("baseline format version %r is not %d" % (baseline.get("version"), FORMAT_VERSION))
+    if baseline["design"] != results["design"]:
+        raise ValueError("baseline was measured on a different design")
+
+    regressions = []
+    for size, run in results["runs"].items():
+        base_run = baseline["runs"].get(size)
+        if base_run is None:
+            continue
+        for phase, metrics in run["phases"].items():
+            base_metrics = base_run["phases"].get(phase, {})
+            for metric, floor in (("time", MIN_TIME), ("peak", MIN_PEAK)):
+                if metric not in metrics or metric not in base_metrics:
+                    continue
+                value = metrics[metric]
+                base_value = base_metrics[metric]
+                if value > base_value * (1 + tolerance) and value - base_value > floor:
+                    regressions.append((size, phase, metric, base_value, value))
+    return regressions
+
+def format_metric(metric, value):
+    if metric == "time":
+        return "%.3f s" % value
+    return "%.1f MiB" % (value / 2**20)
+
+def print_results(results, baseline=None):
+    print("%10s %-16s %12s %12s" % ("registers", "phase", "time (s)", "peak (MiB)"))
+    for size, run in results["runs"].items():
+        base_run = (baseline or {}).get("runs", {}).get(size, {}).get("phases", {})
+        for phase, metrics in run["phases"].items():
+            line = "%10d %-16s %12.3f" % (run["registers"], phase, metrics["time"])
+            if "peak" in metrics:
+                line += " %12.1f" % (metrics["peak"] / 2**20)
+            if phase in base_run:
+                line += "   (%.2fx time vs baseline)" % (metrics["time"] / max(base_run[phase]["time"], 1e-9))
+            print(line)
+
+#===============================================================================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark the RDL compile and every exporter")
+    ap.add_argument("-s", "--sizes", default="1000,10000,100000",
+        help="comma separated register counts (default: %(default)s)")
+    ap.add_argument("--regs", type=int, default=256, help="registers per block (default: %(default)s)")
+    ap.add_argument("--fields", type=int, default=4, help="fields per register (default: %(default)s)")
+    ap.add_argument("--dims", type=parse_dims, default=(), help="register array dimensions, e.g. 4,2")
+    ap.add_argument("--desc-length", type=int, default=None, help="field description length")
+    ap.add_argument("--enums", type=int, default=0, help="enum members encoding the first field")
+    ap.add_argument("--no-memory", action="store_true", help="only measure time")
+    ap.add_argument("-o", "--output", help="write the results to this JSON file")
+    ap.add_argument("-b", "--baseline", help="compare against the results in this JSON file")
+    ap.add_argument("--tolerance", type=float, default=0.2,
+        help="allowed growth over the baseline, as a fraction (default: %(default)s)")
+    options = ap.parse_args()
+
+    design = {
+        "regs": options.regs,
+        "fields": options.fields,
+        "dims": options.dims,
+        "desc_length": options.desc_length,
+        "enums": options.enums,
+    }
+    sizes = [int(size) for size in options.sizes.split(",")]
+    results = run_suite(sizes, design, memory=not options.no_memory)
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, options.tolerance)
+        for size, phase, metric, base_value, value in regressions:
+            print("regression: %s registers, %s %s %s -> %s" % (
+                size, phase, metric, format_metric(metric, base_value), format_metric(metric, value)
+            ))
+        if regressions:
+            sys.exit(1)
+        print("no regression against %s" % options.baseline)
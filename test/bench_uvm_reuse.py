@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Benchmark of the UVM exporter's reuse_classes mode on a replicated-IP design.
+#
+# Generates an addrmap `soc` of `subsystems` address blocks, each holding `ips`
+# instances of one IP type of `regs` registers, and exports its UVM register
+# model with a class per instance and with one class per distinct definition.
+# For both it reports the generation time, the size of the model and the
+# number of classes in it. test_uvm_reuse.py checks the classes of both.
+#
+# With --sim, the simulator command is run on both models and timed too, for
+# the compile and elaboration cost. `{file}` in the command is replaced with
+# the path of the model, e.g.:
+#
+#   --sim "xrun -uvm -elaborate {file}"
+#   --sim "vcs -sverilog -ntb_opts uvm {file}"
+#
+# Usage: python test/bench_uvm_reuse.py [--subsystems 4] [--ips 64] [--regs 32]
+#                                       [--fields 4] [--sim "<command> {file}"]
+
+import os
+import re
+import sys
+import time
+import shlex
+import argparse
+import tempfile
+import subprocess
+
+from testlib import compile_design
+from ralbot.common import MemorySink, RegisterTable
+from ralbot.uvmgen import uvmGenExporter
+from rdlgen import generate_rdl
+
+CLASS_RE = re.compile(r"^class (\w+) extends", re.MULTILINE)
+USED_CLASS_RE = re.compile(r"^\s*rand (\w+) \w+", re.MULTILINE)
+
+def generate_soc(subsystems=4, ips=64, regs=32, fields=4):
+    """ Returns the RDL source of `subsystems` subsystems of `ips` identical IPs """
+    lines = [generate_rdl(ips, regs, fields, top="subsys_t")]
+    lines.append("addrmap soc {")
+    size = 1 << max(ips * regs * 4 * 2 - 1, 1).bit_length()
+    for i in range(subsystems):
+        lines.append("    subsys_t sub%d @ 0x%x;" % (i, i * size))
+    lines.append("};")
+    return "\n".join(lines) + "\n"
+
+def export_model(top, table, reuse_classes):
+    """ Returns the UVM model of `top` and the time taken to generate it """
+    sink = MemorySink()
+    start = time.perf_counter()
+    uvmGenExporter(output_sink=sink, reuse_classes=reuse_classes).export(top, "soc", table=table)
+    return sink.getvalue().decode(), time.perf_counter() - start
+
+def undefined_classes(model):
+    """ Returns the classes the model declares members of without defining them, UVM's aside """
+    used = {name for name in USED_CLASS_RE.findall(model) if not name.startswith("uvm_")}
+    return used - set(CLASS_RE.findall(model))
+
+def run_simulator(command, path):
+    """ Returns the wall time and exit status of the simulator `command` on `path` """
+    args = [arg.replace("{file}", path) for arg in shlex.split(command)]
+    start = time.perf_counter()
+    result = subprocess.run(args, cwd=os.path.dirname(path),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start, result.returncode
+
+def bench_reuse(rdl_path, work_dir, sim=None):
+    """ Returns {mode: {"time", "bytes", "lines", "classes"[, "sim time", "sim status"]}} """
+    top = compile_design(rdl_path)
+    table = RegisterTable(top)
+    results = {}
+    for mode, reuse_classes in (("per instance", False), ("reuse classes", True)):
+        model, elapsed = export_model(top, table, reuse_classes)
+        results[mode] = {
+            "time": elapsed,
+            "bytes": len(model.encode()),
+            "lines": model.count("\n"),
+            "classes": len(CLASS_RE.findall(model)),
+            "undefined": sorted(undefined_classes(model)),
+        }
+        if sim:
+            path = os.path.join(work_dir, mode.replace(" ", "_"), "soc_uvmreg.sv")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(model)
+            results[mode]["sim time"], results[mode]["sim status"] = run_simulator(sim, path)
+    return results
+
+def print_results(results):
+    print("%-14s %10s %12s %10s %8s %12s" % ("mode", "time (s)", "size (KiB)", "lines", "classes", "sim (s)"))
+    for mode, metrics in results.items():
+        sim = "-"
+        if "sim time" in metrics:
+            sim = "%.2f" % metrics["sim time"]
+            if metrics["sim status"]:
+                sim += " (exit %d)" % metrics["sim status"]
+        print("%-14s %10.3f %12.1f %10d %8d %12s" % (
+            mode, metrics["time"], metrics["bytes"] / 1024, metrics["lines"], metrics["classes"], sim
+        ))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark the UVM exporter's reuse_classes mode")
+    ap.add_argument("--subsystems", type=int, default=4, help="address blocks (default: %(default)s)")
+    ap.add_argument("--ips", type=int, default=64, help="IP instances per subsystem (default: %(default)s)")
+    ap.add_argument("--regs", type=int, default=32, help="registers per IP (default: %(default)s)")
+    ap.add_argument("--fields", type=int, default=4, help="fields per register (default: %(default)s)")
+    ap.add_argument("--sim", help="simulator compile and elaboration command, {file} being the model")
+    options = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "soc.rdl")
+        with open(rdl_path, "w") as f:
+            f.write(generate_soc(options.subsystems, options.ips, options.regs, options.fields))
+        results = bench_reuse(rdl_path, work_dir, options.sim)
+    print_results(results)
+    for mode, metrics in results.items():
+        if metrics["undefined"]:
+            print("%s: undefined classes %s" % (mode, ", ".join(metrics["undefined"])))
+            sys.exit(1)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Synthetic SystemRDL generator for benchmarks.
+#
+# Writes an addrmap `top` holding `blocks` addrmaps of `regs` registers with
+# `fields` fields each. Registers can be arrays of dimensions `dims`, fields
+# can carry descriptions of `desc_length` characters, and the first field of
+# every register can be encoded with an enum of `enums` members.
+#
+# Usage: python test/rdlgen.py [blocks] [regs] [fields] [dims] [desc_length] [enums] > bench.rdl
+#        dims is a comma separated list, e.g. 4,2
+
+import sys
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua. "
+)
+
+def description(index, length):
+    """ Returns the description of field `index`, `length` characters long """
+    text = "Field %d" % index
+    if length is None:
+        return text
+    text = (text + ". " + LOREM * (length // len(LOREM) + 1))[:length]
+    return text.rstrip()
+
+def generate_rdl(blocks=4, regs=64, fields=4, top="bench", dims=(), desc_length=None, enums=0):
+    """ Returns the RDL source text of the generated design """
+    width = 32 // fields
+    if enums > 2**width:
+        raise ValueError("%d enum members do not fit in %d bit fields" % (enums, width))
+    elements = 1
+    for dim in dims:
+        elements *= dim
+    lines = []
+    if enums:
+        lines.append("enum bench_enum_t {")
+        for i in range(enums):
+            lines.append("    V%d = %d { desc = \"Value %d\"; };" % (i, i, i))
+        lines.append("};")
+        lines.append("")
+    lines.append("reg bench_reg_t {")
+    for i in range(fields):
+        sw = "rw" if i % 2 == 0 else "r"
+        encode = " encode=bench_enum_t;" if enums and i == 0 else ""
+        lines.append("    field { sw=%s; hw=r; desc=\"%s\";%s } f%d[%d:%d] = %d;" % (
+            sw, description(i, desc_length), encode, i, (i + 1) * width - 1, i * width, i % 2**width
+        ))
+    lines.append("};")
+    lines.append("")
+    lines.append("addrmap bench_block_t {")
+    suffix = "".join("[%d]" % dim for dim in dims)
+    for i in range(regs):
+        lines.append("    bench_reg_t r%d%s @ 0x%x;" % (i, suffix, i * 4 * elements))
+    lines.append("};")
+    lines.append("")
+    lines.append("addrmap %s {" % top)
+    block_size = 1 << max(regs * 4 * elements - 1, 1).bit_length()
+    for i in range(blocks):
+        lines.append("    bench_block_t b%d @ 0x%x;" % (i, i * block_size))
+    lines.append("};")
+    return "\n".join(lines) + "\n"
+
+def parse_dims(text):
+    """ Parses a comma separated list of array dimensions """
+    return tuple(int(dim) for dim in text.split(",") if dim)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    kwargs = {}
+    for name, arg in zip(("blocks", "regs", "fields"), args[:3]):
+        kwargs[name] = int(arg)
+    if len(args) > 3:
+        kwargs["dims"] = parse_dims(args[3])
+    if len(args) > 4:
+        kwargs["desc_length"] = int(args[4])
+    if len(args) > 5:
+        kwargs["enums"] = int(args[5])
+    sys.stdout.write(generate_rdl(**kwargs))
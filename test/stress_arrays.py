@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Array stress test.
+#
+# Arrays are exported symbolically: one register table entry with its
+# dimensions and stride, never one entry per element. Compiles the same design
+# with growing array sizes and runs every exporter on it. Time, peak traced
+# memory and output size must stay flat as the arrays grow, which
+# test_large_arrays.py checks.
+#
+# Usage: python test/stress_arrays.py [elements ...]
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+from testlib import EXPORTERS, compile_design
+from ralbot.common import RegisterTable
+
+def generate_rdl(elements):
+    """ Returns a design whose register, regfile, 2-D and mem arrays have `elements` elements """
+    return """
+reg stress_reg_t { field { sw=rw; hw=r; } f[31:0] = 0; };
+regfile stress_rf_t { stress_reg_t a; stress_reg_t b; };
+addrmap stress_block_t {
+    stress_reg_t regs[%(n)d];
+    stress_rf_t files[%(n)d];
+    stress_reg_t grid[4][%(n)d];
+};
+addrmap stress {
+    stress_block_t blk;
+    stress_block_t blks[2];
+    external mem { mementries = %(n)d; memwidth = 32; } ram;
+};
+""" % {"n": elements}
+
+def measure(func):
+    """ Returns (result, seconds, peak traced bytes) of func() """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def output_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(dir_path, name))
+        for dir_path, _, names in os.walk(path) for name in names
+    )
+
+def run_stress(elements):
+    """
+    Returns {phase: (seconds, peak bytes, size)} for one array size. The size
+    is the output bytes of an exporter and the register entries of the table.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rdl_path = os.path.join(tmp_dir, "stress.rdl")
+        with open(rdl_path, "w") as f:
+            f.write(generate_rdl(elements))
+
+        top, elapsed, peak = measure(lambda: compile_design(rdl_path))
+        results["compile"] = (elapsed, peak, 0)
+
+        table, elapsed, peak = measure(lambda: RegisterTable(top))
+        results["register table"] = (elapsed, peak, len(table.registers))
+
+        for name, create, path in EXPORTERS:
+            out_path = os.path.join(tmp_dir, name.replace(" ", "_"), path)
+            _, elapsed, peak = measure(lambda: create().export(top, out_path, table=table))
+            results[name] = (elapsed, peak, output_size(os.path.dirname(out_path)))
+    return results
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [2**10, 2**16, 2**20]
+    runs = [(elements, run_stress(elements)) for elements in sizes]
+    print("%-16s %10s %10s %10s %12s" % ("phase", "elements", "time (s)", "peak (KiB)", "size"))
+    for phase in runs[0][1]:
+        for elements, results in runs:
+            elapsed, peak, size = results[phase]
+            print("%-16s %10d %10.3f %10.1f %12d" % (phase, elements, elapsed, peak / 2**10, size))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Streaming stress test.
+#
+# The header and UVM exporters write their output as the register table is
+# walked, through spools for the sections written out of order, instead of
+# building it in memory. Exports generated designs of growing size: the peak
+# traced memory of the exports must stay flat while the output grows, which
+# test_streaming.py checks.
+#
+# Usage: python test/stress_streaming.py [registers ...]
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+from testlib import EXPORTERS, compile_design
+from ralbot.common import RegisterTable
+from rdlgen import generate_rdl
+
+REGS_PER_BLOCK = 256
+
+# Exporters writing a single file, and its name
+STREAMED = {"C header": "regs.h", "verilog header": "regs.svh", "uvm regmodel": "regs_uvmreg.sv"}
+
+def run_stress(registers):
+    """ Returns {exporter: (seconds, peak bytes, output bytes)} for one design size """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rdl_path = os.path.join(tmp_dir, "stress.rdl")
+        with open(rdl_path, "w") as f:
+            f.write(generate_rdl(max(registers // REGS_PER_BLOCK, 1), REGS_PER_BLOCK, 4))
+        top = compile_design(rdl_path)
+        table = RegisterTable(top)
+
+        for name, create, path in EXPORTERS:
+            if name not in STREAMED:
+                continue
+            out_dir = os.path.join(tmp_dir, name.replace(" ", "_"))
+            tracemalloc.start()
+            start = time.perf_counter()
+            create().export(top, os.path.join(out_dir, path), table=table)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = (elapsed, peak, os.path.getsize(os.path.join(out_dir, STREAMED[name])))
+    return results
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1024, 10240, 40960]
+    runs = [(registers, run_stress(registers)) for registers in sizes]
+    print("%-16s %10s %10s %10s %12s" % ("exporter", "registers", "time (s)", "peak (KiB)", "size"))
+    for name in STREAMED:
+        for registers, results in runs:
+            elapsed, peak, size = results[name]
+            print("%-16s %10d %10.3f %10.1f %12d" % (name, registers, elapsed, peak / 2**10, size))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# Batch manifests.
+#
+# The shared sources of a manifest are parsed once, searching the manifest's
+# top-level include_dirs like the blocks do. When they do not compile, every
+# block fails, the report is still written and the run exits nonzero. Every
+# block is profiled as a phase of its own, whether it runs forked or not.
+# A block that fails, or defines types of its own, must not affect the
+# blocks generated after it.
+#
+# Usage: python test/test_batch.py
+
+import os
+import re
+import sys
+import json
+import subprocess
+import tempfile
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+SHARED_RDL = """\
+`include "fields.rdl"
+reg status_t { flag_t busy; flag_t done; };
+"""
+
+FIELDS_RDL = """\
+field flag_t { sw=r; hw=w; };
+"""
+
+BLOCK_RDL = """\
+addrmap %s { status_t status; };
+"""
+
+# Tops of one source, the first failing to elaborate
+TOPS_RDL = """\
+addrmap spi { reg { field { sw=rw; hw=r; } f[3:0] = 0x100; } ctrl; };
+addrmap uart { reg { field { sw=rw; hw=r; } f[7:0] = 0; } ctrl; };
+"""
+
+# Runs ralbotgen.py as on a platform without the 'fork' start method
+NO_FORK_RUN = """
+import sys, runpy, multiprocessing
+multiprocessing.get_all_start_methods = lambda: ["spawn"]
+sys.path.insert(0, %r)
+sys.argv[0] = %r
+runpy.run_path(sys.argv[0], run_name="__main__")
+""" % (os.path.join(this_dir, ".."), os.path.join(this_dir, "../ralbotgen.py"))
+
+def write_batch(work_dir, shared_rdl=SHARED_RDL):
+    """ Writes a manifest of two blocks sharing a source that includes a file. Returns its path """
+    files = {
+        "common/regs.rdl": shared_rdl,
+        "inc/fields.rdl": FIELDS_RDL,
+        "uart/uart.rdl": BLOCK_RDL % "uart",
+        "spi/spi.rdl": BLOCK_RDL % "spi",
+    }
+    for path, content in files.items():
+        path = os.path.join(work_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+    manifest = {
+        "shared": ["common/regs.rdl"],
+        "include_dirs": ["inc"],
+        "blocks": [
+            {"sources": [name + "/" + name + ".rdl"], "top": name, "output": "out/" + name + "/" + name,
+             "exporters": ["header-c"]}
+            for name in ("uart", "spi")
+        ],
+    }
+    path = os.path.join(work_dir, "blocks.json")
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+    return path
+
+def run_generator(work_dir, args, fork=True):
+    """
+    Runs ralbotgen.py with `args`, without the 'fork' start method unless
+    `fork` is set. Returns the exit status, the output and the batch report.
+    """
+    report_path = os.path.join(work_dir, "report.json")
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    script = [os.path.join(this_dir, "../ralbotgen.py")] if fork else ["-c", NO_FORK_RUN]
+    proc = subprocess.run(
+        [sys.executable] + script + ["--no-cache", "--force", "--batch-report", report_path, "-j2"] + args,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, cwd=work_dir
+    )
+    report = None
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+    return proc.returncode, proc.stdout, report
+
+def run_batch(work_dir, manifest, *options, fork=True):
+    """ Runs the batch. Returns the exit status, the output and the report """
+    return run_generator(work_dir, ["--manifest", manifest] + list(options), fork)
+
+def test_shared_include_dirs():
+    with tempfile.TemporaryDirectory() as work_dir:
+        status, output, report = run_batch(work_dir, write_batch(work_dir))
+        assert status == 0, output
+        assert [entry["status"] for entry in report["blocks"]] == ["ok", "ok"]
+        assert os.path.exists(os.path.join(work_dir, "out", "spi", "spi.h"))
+
+def test_shared_sources_failure():
+    with tempfile.TemporaryDirectory() as work_dir:
+        manifest = write_batch(work_dir, SHARED_RDL + "reg broken_t {\n")
+        status, output, report = run_batch(work_dir, manifest)
+        assert status != 0
+        assert "error" in output
+        assert report["failed"] == 2
+        assert [entry["status"] for entry in report["blocks"]] == ["failed", "failed"]
+
+def test_batch_profile():
+    with tempfile.TemporaryDirectory() as work_dir:
+        manifest = write_batch(work_dir)
+        profile_path = os.path.join(work_dir, "profile.json")
+        for jobs in ("-j1", "-j2"):
+            status, output, report = run_batch(work_dir, manifest, jobs, "--profile", profile_path)
+            assert status == 0, output
+            with open(profile_path) as f:
+                phases = [phase["phase"] for phase in json.load(f)["phases"]]
+            for name in ("uart", "spi"):
+                assert name in phases
+                assert name + "/header-c" in phases
+                assert name + "/header-c/walk" in phases
+
+def test_failed_block_isolated():
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, "tops.rdl"), "w") as f:
+            f.write(TOPS_RDL)
+        for jobs in ("-j1", "-j2"):
+            for fork in (True, False):
+                status, output, _ = run_generator(
+                    work_dir, ["-t", "spi,uart", "-o", "out", "-header", "c", jobs, "tops.rdl"], fork
+                )
+                assert status != 0
+                # Status lines of the blocks
+                assert re.findall(r"^(spi|uart) +(\w+)", output, re.MULTILINE) == [("spi", "failed"), ("uart", "ok")], output
+
+def test_block_types_isolated():
+    # Blocks defining the same type are compiled apart, even by one worker
+    with tempfile.TemporaryDirectory() as work_dir:
+        manifest = write_batch(work_dir)
+        for name in ("uart", "spi"):
+            with open(os.path.join(work_dir, name, name + ".rdl"), "w") as f:
+                f.write("reg ctrl_t { flag_t %s_en; };\n" % name + BLOCK_RDL % name)
+        for jobs in ("-j1", "-j2"):
+            status, output, report = run_batch(work_dir, manifest, jobs)
+            assert status == 0, output
+            assert [entry["status"] for entry in report["blocks"]] == ["ok", "ok"]
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as work_dir:
+        status, output, report = run_batch(work_dir, write_batch(work_dir))
+    print(output, end="")
+    sys.exit(status)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+# Benchmark suite.
+#
+# bench_suite.py must measure every phase of a run, and its comparison must
+# flag a metric that grew beyond the tolerance over the baseline.
+#
+# Usage: python -m pytest test/test_bench_suite.py
+
+import json
+
+from testlib import EXPORTERS
+from bench_suite import run_suite, compare
+
+def test_suite_and_compare():
+    design = {"regs": 16, "fields": 4, "dims": (2,), "desc_length": 100, "enums": 4}
+    results = json.loads(json.dumps(run_suite([32], design)))
+    run = results["runs"]["32"]
+    assert run["registers"] == 32
+    assert set(run["phases"]) == {"compile", "register table"} | {name for name, _, _ in EXPORTERS}
+    assert compare(results, results, 0.0) == []
+
+    slower = json.loads(json.dumps(results))
+    slower["runs"]["32"]["phases"]["html"]["time"] += 1.0
+    assert compare(slower, results, 0.2) == [("32", "html", "time", results["runs"]["32"]["phases"]["html"]["time"], slower["runs"]["32"]["phases"]["html"]["time"])]
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+# Exports of very large arrays.
+#
+# Arrays are exported symbolically, so the peak traced memory and the output
+# size of every exporter must stay flat as the arrays grow. stress_arrays.py
+# reports them, and the times, for any array sizes.
+#
+# Usage: python -m pytest test/test_large_arrays.py
+
+from stress_arrays import run_stress
+
+def test_flat_in_array_size():
+    small = run_stress(2**4)
+    large = run_stress(2**20)
+    for phase, (_, small_peak, small_size) in small.items():
+        _, large_peak, large_size = large[phase]
+        # Only the printed dimensions and addresses grow
+        assert abs(large_size - small_size) <= small_size // 20, phase
+        assert large_peak < small_peak * 1.5 + 2**20, phase
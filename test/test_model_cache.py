@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Model cache.
+#
+# A model restored from the cache must print the compiler's messages again,
+# as compiling it did, and the cache must keep the most recently used models
+# only. A compile reads the sources once to key the cache, and keys them on
+# their absolute paths.
+#
+# Usage: python test/test_model_cache.py
+
+import os
+import tempfile
+
+# Makes the repo's modules importable
+import testlib
+import rdlcompiler
+from rdlcompiler import RdlCompiler
+
+RDL = """\
+addrmap %s {
+    reg { field { sw=rw; hw=r; } f[7:0]; } r0;
+};
+"""
+
+class ListPrinter:
+    """ Keeps the text of the compiler's warnings """
+    def __init__(self):
+        self.warnings = []
+
+    def print_message(self, severity, text, src_ref=None):
+        if getattr(severity, "name", severity).lower() == "warning":
+            self.warnings.append(text)
+
+def compile_cached(rdl_path, cache_dir):
+    """ Compiles `rdl_path` with the missing-reset warning. Returns the warnings printed """
+    printer = ListPrinter()
+    RdlCompiler(printer, src_files=[rdl_path], cache_dir=cache_dir,
+                warning_flags={"missing-reset": False}).compile()
+    return printer.warnings
+
+def test_cached_model_warnings():
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "design.rdl")
+        with open(rdl_path, "w") as f:
+            f.write(RDL % "design")
+        cache_dir = os.path.join(work_dir, "cache")
+        warnings = compile_cached(rdl_path, cache_dir)
+        assert len(warnings) == 1 and "reset" in warnings[0]
+        assert compile_cached(rdl_path, cache_dir) == warnings
+
+def test_model_cache_pruned(monkeypatch):
+    monkeypatch.setattr(rdlcompiler, "MODEL_CACHE_ENTRIES", 2)
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "design.rdl")
+        cache_dir = os.path.join(work_dir, "cache")
+        models = []
+        for name in ("first", "second", "third"):
+            with open(rdl_path, "w") as f:
+                f.write(RDL % name)
+            compile_cached(rdl_path, cache_dir)
+            models.append(RdlCompiler(src_files=[rdl_path], cache_dir=cache_dir,
+                                      warning_flags={"missing-reset": False}).getCachePath())
+        assert [os.path.exists(path) for path in models] == [False, True, True]
+
+def test_file_keys_read_once(monkeypatch):
+    calls = []
+    get_file_keys = RdlCompiler.getFileKeys
+    def count_file_keys(self, *args):
+        calls.append(args)
+        return get_file_keys(self, *args)
+    monkeypatch.setattr(RdlCompiler, "getFileKeys", count_file_keys)
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "design.rdl")
+        with open(rdl_path, "w") as f:
+            f.write(RDL % "design")
+        cache_dir = os.path.join(work_dir, "cache")
+        # Missing the model cache, then restoring from it
+        for _ in range(2):
+            calls.clear()
+            compile_cached(rdl_path, cache_dir)
+            assert len(calls) == 1
+
+def test_cache_keyed_on_absolute_paths(monkeypatch):
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, "design.rdl"), "w") as f:
+            f.write(RDL % "design")
+        cache_dir = os.path.join(work_dir, "cache")
+        monkeypatch.chdir(work_dir)
+        paths = [RdlCompiler(src_files=[path], cache_dir=cache_dir,
+                             warning_flags={"missing-reset": False}).getCachePath()
+                 for path in ("design.rdl", "./design.rdl", os.path.join(work_dir, "design.rdl"))]
+        assert len(set(paths)) == 1
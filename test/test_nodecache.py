@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# Node cache of the HTML exporter.
+#
+# The templates read the systemrdl nodes through a NodeCache, which must only
+# forward a query to systemrdl the first time it is made, and must let go of
+# the nodes of the pages already written. bench_nodecache.py reports the
+# calls saved on larger designs.
+#
+# Usage: python -m pytest test/test_nodecache.py
+
+import tempfile
+
+from testlib import compile_source
+from ralbot.common import RegisterTable, TableWalker
+from ralbot.html import HTMLExporter
+from rdlgen import generate_rdl
+
+def test_calls_saved():
+    top = compile_source(generate_rdl(blocks=2, regs=8, fields=4))
+    table = RegisterTable(top)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        context = HTMLExporter().begin(top, tmp_dir, table=table)
+        TableWalker().walk(table.top, context)
+        context.finish()
+
+    cache = context.node_cache
+    # Every register has the same field descriptions
+    assert cache.forwarded["get_html_desc"] == 4
+    # Each register page lists its fields twice
+    assert cache.forwarded["fields"] == cache.requests["fields"] // 2
+    assert cache.saved > 0
+    # Only the top node is still wrapped once all pages are written
+    assert len(cache.nodes) == 1
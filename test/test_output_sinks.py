@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+# Exporting to a MemorySink or a StreamSink must give the same content as
+# exporting to files, without touching the disk.
+#
+# Usage: python test/test_output_sinks.py [file.rdl]
+
+import io
+import os
+import sys
+import tempfile
+
+from testlib import create_exporters, compile_root, design_path
+from ralbot.common import OutputSink, MemorySink, StreamSink
+from ralbot.html import HTMLExporter
+
+def file_exporters(output_sink=None):
+    """ Returns the exporters writing a single file """
+    return [exporter for name, exporter, _ in create_exporters(output_sink) if name != "html"]
+
+def read_tree(path):
+    """ Returns {path relative to `path`: content} of every file below `path` """
+    files = {}
+    for dir_path, _, names in os.walk(path):
+        for name in names:
+            with open(os.path.join(dir_path, name), 'rb') as f:
+                files[os.path.relpath(os.path.join(dir_path, name), path)] = f.read()
+    return files
+
+def check_sinks(rdl_file):
+    """ Returns the outputs that differ between files and sinks """
+    root = compile_root(rdl_file)
+    different = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            for index, exporter in enumerate(file_exporters()):
+                exporter.export(root, os.path.join("files", "%d" % index, "regs"))
+                files = list(read_tree(os.path.join("files", "%d" % index)).values())
+
+                sink = MemorySink()
+                file_exporters(sink)[index].export(root, "regs")
+                if files != [sink.getvalue()]:
+                    different.append("MemorySink %s" % type(exporter).__name__)
+
+                for stream in (io.StringIO(), io.BytesIO()):
+                    file_exporters(StreamSink(stream))[index].export(root, "regs")
+                    value = stream.getvalue()
+                    if isinstance(value, str):
+                        value = value.encode("utf-8")
+                    if files != [value]:
+                        different.append("StreamSink(%s) %s" % (type(stream).__name__, type(exporter).__name__))
+
+            HTMLExporter().export(root, "html")
+            sink = MemorySink()
+            HTMLExporter(output_sink=sink).export(root, "memory")
+            memory_files = {os.path.relpath(path, "memory"): content for path, content in sink.files.items()}
+            if read_tree("html") != memory_files:
+                different.append("MemorySink HTMLExporter")
+
+            # Only the file exports wrote anything
+            if sorted(os.listdir(tmp_dir)) != ["files", "html"]:
+                different.append("disk")
+        finally:
+            os.chdir(cwd)
+    return different
+
+def test_sinks():
+    for rdl_file in ("test_write_enable.rdl", "hwa_wrapper.rdl"):
+        assert check_sinks(design_path(rdl_file)) == []
+
+def test_pending_file():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "out", "regs.h")
+        sink = OutputSink()
+        f = sink.create(path)
+        f.write("// first\n")
+        f.discard()
+        assert not os.path.exists(path)
+
+        for _ in range(2):
+            f = sink.create(path)
+            for i in range(10000):
+                f.write("#define R%d %d\n" % (i, i))
+            f.commit()
+        assert (sink.written, sink.skipped) == (1, 1)
+        assert os.listdir(os.path.dirname(path)) == ["regs.h"]
+        with open(path) as f:
+            assert f.read().count("\n") == 10000
+
+if __name__ == "__main__":
+    rdl_file = sys.argv[1] if len(sys.argv) > 1 else design_path("test_write_enable.rdl")
+    different = check_sinks(rdl_file)
+    if different:
+        print("outputs differ: %s" % ", ".join(different))
+        sys.exit(1)
+    print("outputs identical")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Profiling of exports.
+#
+# Exporters sharing a walk must still be profiled one by one: a phase per
+# task, holding their setup and finish, and a sub-phase for their callbacks
+# during the walk, with or without --shard.
+#
+# Usage: python test/test_profile.py
+
+import os
+import sys
+import json
+import subprocess
+import tempfile
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+TASKS = ("header-c", "uvmregs", "xml", "doc")
+
+def run_profile(work_dir, *options):
+    """ Exports hwa_wrapper.rdl with every exporter under --profile. Returns the report's phases """
+    report_path = os.path.join(work_dir, "profile.json")
+    proc = subprocess.run(
+        [sys.executable, os.path.join(this_dir, "../ralbotgen.py"), "--no-cache", "--force",
+         "-o", os.path.join(work_dir, "out", "regs"), "-header", "c", "-uvmregs", "-xml", "-doc",
+         "--profile", report_path] + list(options) + [os.path.join(this_dir, "hwa_wrapper.rdl")],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+    )
+    assert proc.returncode == 0, proc.stdout
+    with open(report_path) as f:
+        return json.load(f)["phases"]
+
+def check_phases(phases):
+    names = [phase["phase"] for phase in phases]
+    for task in TASKS:
+        assert names.count(task) == 1, names
+    for walk in ("header-c/walk", "uvmregs/walk", "xml/walk", "doc/traversal"):
+        assert names.count(walk) == 1, names
+    for phase in phases:
+        assert phase["depth"] == phase["phase"].count("/")
+        if "/" in phase["phase"] and phase["phase"].split("/")[0] in TASKS:
+            task = phases[names.index(phase["phase"].split("/")[0])]
+            assert phase["wall"] <= task["wall"]
+
+def test_profile_tasks():
+    with tempfile.TemporaryDirectory() as work_dir:
+        check_phases(run_profile(work_dir))
+
+def test_profile_sharded_tasks():
+    with tempfile.TemporaryDirectory() as work_dir:
+        check_phases(run_profile(work_dir, "-j2", "--shard"))
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as work_dir:
+        for phase in run_profile(work_dir, *sys.argv[1:]):
+            print("%-24s %8.4f" % ("  " * phase["depth"] + phase["phase"], phase["wall"]))
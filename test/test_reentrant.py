@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Exporters keep the state of an export in the context begin() returns, not
+# on themselves. One exporter instance must give the same outputs as fresh
+# ones when it exports again, and when it runs several exports at once from
+# a thread pool.
+#
+# Usage: python test/test_reentrant.py [threads]
+
+import os
+import sys
+import tempfile
+import concurrent.futures
+
+from testlib import EXPORTERS, create_exporters, compile_root, design_path
+from ralbot.common import MemorySink
+from rdlgen import generate_rdl
+
+def compile_designs(tmp_dir):
+    """ Returns the elaborated roots of the repo's designs and of two generated ones """
+    rdl_files = [design_path(name) for name in ("test_write_enable.rdl", "hwa_wrapper.rdl")]
+    for blocks in (3, 6):
+        rdl_files.append(os.path.join(tmp_dir, "gen%d.rdl" % blocks))
+        with open(rdl_files[-1], "w") as f:
+            f.write(generate_rdl(blocks=blocks, regs=8, fields=3, dims=(2,), desc_length=30, enums=2))
+    return [compile_root(rdl_file) for rdl_file in rdl_files]
+
+def export_all(exporters, roots, threads=1, repeat=1):
+    """ Exports every root with every exporter. Returns {path: content} """
+    jobs = [
+        (exporter, root, "%d/%s/%d/%s" % (i, name, n, path))
+        for n in range(repeat)
+        for i, root in enumerate(roots)
+        for name, exporter, path in exporters
+    ]
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda job: job[0].export(job[1], job[2]), jobs))
+
+def check_reentrant(threads=4):
+    """ Returns the outputs of shared exporters that differ from fresh ones' """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        roots = compile_designs(tmp_dir)
+
+    # A fresh exporter for every export
+    fresh = MemorySink()
+    for i, root in enumerate(roots):
+        for n in range(2):
+            for name, create, path in EXPORTERS:
+                create(fresh).export(root, "%d/%s/%d/%s" % (i, name, n, path))
+
+    # One exporter of each kind for all of them, exporting from several threads
+    shared = MemorySink()
+    export_all(create_exporters(shared), roots, threads, repeat=2)
+
+    different = [path for path in fresh.files if shared.files.get(path) != fresh.files[path]]
+    if set(shared.files) != set(fresh.files):
+        different.append("file list")
+    return different
+
+def test_reentrant():
+    assert check_reentrant() == []
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    different = check_reentrant(threads)
+    if different:
+        print("outputs differ: %s" % ", ".join(different))
+        sys.exit(1)
+    print("outputs identical")
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+
+# Register table.
+#
+# The flattened RegisterTable must hold every register and field of the
+# design, and walking it must reach the same fields as walking the systemrdl
+# tree. bench_regtable.py times both walks.
+#
+# Usage: python -m pytest test/test_regtable.py
+
+from testlib import compile_source
+from ralbot.common import RegisterTable
+from rdlgen import generate_rdl
+from bench_regtable import walk_nodes, walk_table
+
+def test_table_matches_tree():
+    top = compile_source(generate_rdl(blocks=2, regs=8, fields=4))
+    table = RegisterTable(top)
+    assert len(table.registers) == 2 * 8
+    assert len(table.fields) == 2 * 8 * 4
+    assert walk_table(table.top) == walk_nodes(top)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Cold-startup budget of a header-only ralbotgen.py run.
+#
+# Runs the CLI under `python -X importtime`, adds up the import time of the
+# top-level imports and fails when it exceeds the budget (milliseconds, can be
+# overridden with RALBOT_STARTUP_BUDGET_MS). Exporters that the run does not
+# select must not be imported at all.
+#
+# Usage: python test/test_startup_time.py [file.rdl]
+
+import os
+import sys
+import subprocess
+import tempfile
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+BUDGET_MS = float(os.environ.get("RALBOT_STARTUP_BUDGET_MS", 500))
+
+# Only needed by the uvm, doc and xml exporters
+UNWANTED_MODULES = [
+    "jinja2",
+    "xml.dom.minidom",
+    "ralbot.html",
+    "ralbot.uvmgen",
+    "ralbot.ipxact",
+]
+
+def measure_imports(rdl_file):
+    """ Returns {module: cumulative import time in us} of the top-level imports, and all imported modules """
+    with tempfile.TemporaryDirectory() as output_dir:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", os.path.join(this_dir, "../ralbotgen.py"),
+             "--no-cache", "--force", "-header", "c",
+             "-o", os.path.join(output_dir, "startup"), rdl_file],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+    if proc.returncode != 0:
+        raise RuntimeError("ralbotgen.py failed:\n" + proc.stderr)
+
+    top_level = {}
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative)
+    return top_level, modules
+
+def check_startup_budget(rdl_file):
+    top_level, modules = measure_imports(rdl_file)
+
+    unwanted = [m for m in UNWANTED_MODULES if m in modules]
+    assert not unwanted, "header-only run imported %s" % ", ".join(unwanted)
+
+    total_ms = sum(top_level.values()) / 1000
+    assert total_ms <= BUDGET_MS, "import time %.1f ms is over the %.1f ms budget" % (total_ms, BUDGET_MS)
+    return total_ms, top_level
+
+def test_header_startup_budget():
+    check_startup_budget(os.path.join(this_dir, "test_write_enable.rdl"))
+
+if __name__ == "__main__":
+    rdl_file = sys.argv[1] if len(sys.argv) > 1 else os.path.join(this_dir, "test_write_enable.rdl")
+    total_ms, top_level = check_startup_budget(rdl_file)
+    for name, us in sorted(top_level.items(), key=lambda x: -x[1])[:10]:
+        print("%8.1f ms  %s" % (us / 1000, name))
+    print("total import time %.1f ms (budget %.1f ms)" % (total_ms, BUDGET_MS))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Streaming exports.
+#
+# The header and UVM exporters stream their output, so their peak traced
+# memory must stay flat while the output grows with the design.
+# stress_streaming.py reports them, and the times, for any design sizes.
+#
+# An export that fails must not leave the temporary files of its output
+# behind, whatever it fails with.
+#
+# Usage: python -m pytest test/test_streaming.py
+
+import os
+import sys
+import tempfile
+import subprocess
+
+from testlib import EXPORTERS, compile_design, design_path
+from ralbot.headergen.exporter import headerGenContext
+from ralbot.uvmgen.exporter import uvmGenContext
+from stress_streaming import STREAMED, run_stress
+
+# Runs ralbotgen.py with the UVM exporter failing on the first register
+FAILING_RUN = """
+import sys, runpy
+from ralbot.uvmgen.exporter import uvmGenContext
+def add_register(self, parent, entry):
+    raise ValueError("add_register failed")
+uvmGenContext.add_register = add_register
+sys.argv[0] = "ralbotgen.py"
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+def fail_add_register(self, parent, entry):
+    raise ValueError("add_register failed")
+
+def test_flat_in_map_size():
+    small = run_stress(1024)
+    large = run_stress(4096)
+    for name, (_, small_peak, small_size) in small.items():
+        _, large_peak, large_size = large[name]
+        assert large_size > small_size * 3, name
+        # Spools hold up to 1 MiB in memory before moving to a file
+        assert large_peak < small_peak * 1.5 + 2**20, name
+
+def test_failed_export_leaves_no_files(monkeypatch):
+    monkeypatch.setattr(headerGenContext, "add_register", fail_add_register)
+    monkeypatch.setattr(uvmGenContext, "add_register", fail_add_register)
+    top = compile_design(design_path("hwa_wrapper.rdl"))
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name, create, path in EXPORTERS:
+            if name not in STREAMED:
+                continue
+            try:
+                create().export(top, os.path.join(out_dir, path))
+            except ValueError:
+                pass
+            else:
+                assert False, name
+        assert os.listdir(out_dir) == []
+
+def test_failed_task_leaves_no_files():
+    # One walk for both tasks, and a forked worker for each
+    for jobs in ("-j1", "-j2"):
+        with tempfile.TemporaryDirectory() as out_dir:
+            proc = subprocess.run(
+                [sys.executable, "-c", FAILING_RUN, "--no-cache", "--force", jobs,
+                 "-o", os.path.join(out_dir, "regs"), "-header", "c", "-uvmregs",
+                 design_path("hwa_wrapper.rdl")],
+                cwd=design_path(".."), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                universal_newlines=True
+            )
+            assert proc.returncode != 0 and "add_register failed" in proc.stdout, proc.stdout
+            assert [name for name in os.listdir(out_dir) if name.startswith(".")] == [], jobs
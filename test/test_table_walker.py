@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# One TableWalker walk driving several exporters must write the same files as
+# running each exporter on its own, and so must a ShardedWalk whose shards are
+# walked in forked workers. A listener failing in a shard must only stop that
+# listener.
+#
+# Usage: python test/test_table_walker.py [file.rdl]
+
+import os
+import sys
+import filecmp
+import tempfile
+import multiprocessing
+
+from testlib import create_exporters, compile_root, compile_source, design_path
+from ralbot.common import RegisterTable, TableWalker, TableListener, ShardableListener, ShardedWalk
+from rdlgen import generate_rdl
+
+class RegCounter(ShardableListener):
+    """ Counts the registers walked. Fails to begin the shards after the first with `fail` """
+    def __init__(self, fail=False):
+        self.regs = 0
+        self.fail = fail
+
+    def enter_Reg(self, entry):
+        self.regs += 1
+
+    def shard_begin(self, parent, start, stop):
+        if self.fail and start > 0:
+            raise ValueError("shard at %d" % start)
+        self.shard_start = self.regs
+
+    def shard_end(self):
+        # Shards are walked one after the other here, not in forked copies
+        fragment, self.regs = self.regs - self.shard_start, self.shard_start
+        return fragment
+
+    def shard_merge(self, parent, fragment):
+        self.regs += fragment
+
+def compare_dirs(dcmp):
+    """ Returns the files that differ between two directory trees """
+    different = dcmp.diff_files + dcmp.left_only + dcmp.right_only
+    for sub in dcmp.subdirs.values():
+        different += compare_dirs(sub)
+    return different
+
+# Sharded walk shared with the forked workers
+_sharded = None
+
+def walk_shard(index):
+    return _sharded.walk_shard(index)
+
+def check_shared_walk(rdl_file, shards=None):
+    """
+    Export separately, then with one shared walk, or with a sharded walk if
+    `shards` is given. Returns the files that differ.
+    """
+    global _sharded
+    root = compile_root(rdl_file)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        separate_dir = os.path.join(tmp_dir, "separate")
+        shared_dir = os.path.join(tmp_dir, "shared")
+
+        for _, exporter, path in create_exporters():
+            exporter.export(root, os.path.join(separate_dir, path))
+
+        table = RegisterTable(root)
+        contexts = []
+        for _, exporter, path in create_exporters():
+            contexts.append(exporter.begin(root, os.path.join(shared_dir, path), table=table))
+        if shards is None:
+            TableWalker().walk(table.top, *contexts)
+        else:
+            _sharded = ShardedWalk(table.top, contexts, shards)
+            _sharded.enter()
+            with multiprocessing.get_context("fork").Pool(2) as pool:
+                results = pool.map(walk_shard, range(len(_sharded.shards)), chunksize=1)
+            _sharded.merge(results)
+            _sharded.exit()
+            _sharded = None
+        for context in contexts:
+            context.finish()
+
+        return compare_dirs(filecmp.dircmp(separate_dir, shared_dir))
+
+def test_shared_walk():
+    for rdl_file in ("test_write_enable.rdl", "hwa_wrapper.rdl"):
+        assert check_shared_walk(design_path(rdl_file)) == []
+
+def test_sharded_walk():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rdl_file = os.path.join(tmp_dir, "blocks.rdl")
+        with open(rdl_file, "w") as f:
+            f.write(generate_rdl(blocks=5, regs=6, fields=3, dims=(2,), desc_length=40, enums=3))
+        for shards in (2, 3, 5):
+            assert check_shared_walk(rdl_file, shards) == []
+    for rdl_file in ("test_write_enable.rdl", "hwa_wrapper.rdl"):
+        assert check_shared_walk(design_path(rdl_file), 4) == []
+
+def test_sharded_walk_errors():
+    table = RegisterTable(compile_source(generate_rdl(blocks=4, regs=4, fields=2)))
+    counter = RegCounter()
+    failing = RegCounter(fail=True)
+    sharded = ShardedWalk(table.top, [failing, counter], 4, catch=ValueError)
+    sharded.enter()
+    sharded.merge([sharded.walk_shard(index) for index in range(len(sharded.shards))])
+    errors = sharded.exit()
+    assert len(sharded.shards) > 1
+    assert list(errors) == [failing]
+    assert counter.regs == len(table.registers)
+
+def test_sharded_walk_fallback():
+    # A listener that cannot be sharded keeps the walk in a single shard
+    table = RegisterTable(compile_source(generate_rdl(blocks=4, regs=4, fields=2)))
+    counter = RegCounter()
+    unsharded = TableListener()
+    sharded = ShardedWalk(table.top, [counter, unsharded], 4)
+    assert len(sharded.shards) == 1
+    assert sharded.walk() == {}
+    assert counter.regs == len(table.registers)
+    assert len(ShardedWalk(table.top, [counter], 4).shards) > 1
+
+if __name__ == "__main__":
+    rdl_file = sys.argv[1] if len(sys.argv) > 1 else design_path("test_write_enable.rdl")
+    different = check_shared_walk(rdl_file)
+    if different:
+        print("outputs differ: %s" % ", ".join(different))
+        sys.exit(1)
+    print("outputs identical")
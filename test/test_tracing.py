@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Tracing of exports.
+#
+# A disabled Tracer must leave the exporters and the walk untouched. An
+# enabled one records the walk of every block and register, and the exporter
+# methods called for them, as nested Chrome trace spans.
+#
+# Usage: python test/test_tracing.py [file.rdl] [trace.json]
+
+import os
+import sys
+import json
+
+from testlib import create_exporters, compile_design, compile_root, design_path
+from ralbot.common import RegisterTable, TableWalker, Tracer, MemorySink
+from ralbot.headergen import headerGenExporter
+
+def trace_export(rdl_file, tracer):
+    """ Exports `rdl_file` with every exporter in one traced walk. Returns the outputs """
+    top = compile_design(rdl_file)
+    table = RegisterTable(top)
+
+    sink = MemorySink()
+    contexts = []
+    for _, exporter, path in create_exporters(sink):
+        contexts.append(tracer.instrument(exporter.begin(top, os.path.join("out", path), table=table)))
+    TableWalker(tracer=tracer).walk(table.top, *contexts)
+    for context in contexts:
+        context.finish()
+    return sink.files
+
+def check_nesting(events):
+    """ Returns the spans that overlap another span without being nested in it """
+    overlapping = []
+    stack = []
+    for event in sorted(events, key=lambda e: (e["ts"], -e["dur"])):
+        end = event["ts"] + event["dur"]
+        while stack and stack[-1] <= event["ts"]:
+            stack.pop()
+        if stack and end > stack[-1] + 1e-3:
+            overlapping.append(event)
+        stack.append(end)
+    return overlapping
+
+def test_tracing():
+    rdl_file = design_path("hwa_wrapper.rdl")
+
+    tracer = Tracer()
+    untraced = trace_export(rdl_file, tracer)
+    assert tracer.events == []
+
+    tracer = Tracer(enabled=True)
+    assert trace_export(rdl_file, tracer) == untraced
+
+    names = {(event["cat"], event["name"]) for event in tracer.events}
+    assert ("walk", "Addrmap") in names
+    assert ("walk", "Reg") in names
+    assert ("headerGenContext", "add_register") in names
+    assert ("uvmGenContext", "add_registerBlock") in names
+    assert ("IPXACTContext", "add_addressBlock") in names
+    assert ("HTMLContext", "render_page") in names
+    top_path = next(event for event in tracer.events if event["name"] == "Addrmap")["args"]["node"].split(".")[0]
+    assert all(event["args"]["node"].startswith(top_path) for event in tracer.events if event["cat"] == "walk")
+    assert check_nesting(tracer.events) == []
+
+    report = json.loads(json.dumps(tracer.report()))
+    assert len(report["traceEvents"]) == len(tracer.events)
+
+def test_disabled_tracer():
+    root = compile_root(design_path("hwa_wrapper.rdl"))
+    context = headerGenExporter(output_sink=MemorySink()).begin(root, "regs")
+    Tracer().instrument(context)
+    assert "add_register" not in vars(context)
+    assert "_walk" not in vars(TableWalker(tracer=Tracer()))
+
+if __name__ == "__main__":
+    rdl_file = sys.argv[1] if len(sys.argv) > 1 else design_path("hwa_wrapper.rdl")
+    tracer = Tracer(enabled=True)
+    trace_export(rdl_file, tracer)
+    if len(sys.argv) > 2:
+        tracer.write(sys.argv[2])
+    print("%d spans" % len(tracer.events))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# UVM class reuse.
+#
+# With reuse_classes, instances with identical definitions must share one
+# class, and instances that differ must not. bench_uvm_reuse.py times both
+# modes on larger designs.
+#
+# Usage: python -m pytest test/test_uvm_reuse.py
+
+import os
+import re
+import tempfile
+
+from testlib import REPO_DESIGNS, compile_design, compile_source, design_path
+from ralbot.common import RegisterTable
+from bench_uvm_reuse import CLASS_RE, generate_soc, bench_reuse, export_model, undefined_classes
+
+def test_reuse_classes():
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "soc.rdl")
+        with open(rdl_path, "w") as f:
+            f.write(generate_soc(subsystems=2, ips=4, regs=8, fields=3))
+        results = bench_reuse(rdl_path, work_dir)
+
+    per_instance = results["per instance"]
+    reused = results["reuse classes"]
+    # 2 subsystems of 4 IPs of 8 registers
+    assert per_instance["classes"] == 2 + 2 * 4 + 2 * 4 * 8
+    # The subsystems, which are address blocks, one IP and one register
+    assert reused["classes"] == 2 + 1 + 1
+    assert reused["bytes"] < per_instance["bytes"] / 2
+    assert per_instance["undefined"] == reused["undefined"] == []
+
+def test_reuse_classes_keeps_differences():
+    # Registers of the same type with different resets, widths or access must
+    # not share a class. All the repo's designs must still reference defined
+    # classes only.
+    for name in REPO_DESIGNS:
+        top = compile_design(design_path(name))
+        table = RegisterTable(top)
+        per_instance, _ = export_model(top, table, False)
+        reused, _ = export_model(top, table, True)
+        assert undefined_classes(reused) == set()
+        assert len(CLASS_RE.findall(reused)) <= len(CLASS_RE.findall(per_instance))
+        assert "\0" not in reused
+
+    top = compile_source(
+        "reg r_t { field { sw=rw; hw=r; } f[7:0] = 0; };\n"
+        "addrmap top {\n"
+        "    r_t a; r_t b; r_t c;\n"
+        "    b.f->reset = 1;\n"
+        "    r_t d; d.f->sw = r;\n"
+        "};\n"
+    )
+    reused, _ = export_model(top, RegisterTable(top), True)
+    # systemrdl names the types of b and d after r_t and their overrides
+    assert len(CLASS_RE.findall(reused)) == 4
+    members = {member: name for name, member in re.findall(r"rand (\w+) (\w+);", reused)}
+    assert members["a"] == members["c"] == "reg_r_t"
+    assert len({members["a"], members["b"], members["d"]}) == 3
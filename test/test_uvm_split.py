@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# UVM register model split into per-block files.
+#
+# The block files of a split export must hold the same classes as the single
+# model file, each block's file defining the classes of its registers and
+# memories. The package must include every block file after those defining
+# the classes it uses, and a model change must only rewrite the files of the
+# blocks it touches. Blocks whose classes are named alike are included once.
+#
+# Usage: python test/test_uvm_split.py
+
+import os
+import re
+import sys
+import tempfile
+
+from testlib import REPO_DESIGNS, compile_design, compile_source, design_path
+from ralbot.common import MemorySink, OutputSink, RegisterTable
+from ralbot.uvmgen import uvmGenExporter
+from rdlgen import generate_rdl
+
+CLASS_RE = re.compile(r"^class \w+ extends .*?^endclass\n", re.MULTILINE | re.DOTALL)
+DEFINED_RE = re.compile(r"^class (\w+) extends", re.MULTILINE)
+USED_RE = re.compile(r"^\s*rand (\w+) \w+", re.MULTILINE)
+INCLUDE_RE = re.compile(r'^\s*`include "(\w+/\w+\.svh)"$', re.MULTILINE)
+
+def export_split(top, table, **kwargs):
+    """ Returns the files of a split export of `top` to out/regs, by path """
+    sink = MemorySink()
+    uvmGenExporter(output_sink=sink, split_blocks=True, **kwargs).export(top, "out/regs", table=table)
+    return {path: content.decode() for path, content in sink.files.items()}
+
+def check_split(top, **kwargs):
+    """ Returns what is wrong with the split export of `top`, compared with the single file """
+    table = RegisterTable(top)
+    sink = MemorySink()
+    uvmGenExporter(output_sink=sink, **kwargs).export(top, "out/regs", table=table)
+    model = sink.getvalue().decode()
+    files = export_split(top, table, **kwargs)
+
+    errors = []
+    if set(files) - {"out/regs_uvmreg_pkg.sv", "out/regs_uvmreg.f"} != {
+        os.path.join("out", path) for path in INCLUDE_RE.findall(files["out/regs_uvmreg_pkg.sv"])
+    }:
+        errors.append("block files and package includes differ")
+    if files["out/regs_uvmreg.f"] != "+incdir+.\nregs_uvmreg_pkg.sv\n":
+        errors.append("unexpected filelist")
+
+    defined = set()
+    split_classes = []
+    for path in INCLUDE_RE.findall(files["out/regs_uvmreg_pkg.sv"]):
+        content = files[os.path.join("out", path)]
+        classes = CLASS_RE.findall(content)
+        split_classes.extend(classes)
+        if path.endswith("_common.svh"):
+            if "uvm_reg_block" in content:
+                errors.append("%s defines blocks" % path)
+        elif os.path.basename(path) != DEFINED_RE.findall(content)[-1] + ".svh":
+            errors.append("%s does not end with its block's class" % path)
+        defined.update(DEFINED_RE.findall(content))
+        used = {name for name in USED_RE.findall(content) if not name.startswith("uvm_")}
+        if used - defined:
+            errors.append("%s uses classes defined after it: %s" % (path, ", ".join(sorted(used - defined))))
+    if sorted(split_classes) != sorted(CLASS_RE.findall(model)):
+        errors.append("classes of the block files differ from the model's")
+    return errors
+
+#===============================================================================
+def test_split_classes():
+    for name in REPO_DESIGNS:
+        top = compile_design(design_path(name))
+        assert check_split(top) == []
+        assert check_split(top, reuse_classes=True) == []
+
+def test_split_reuse_nested():
+    # A reg type used by a block and by the regfile within it: the regfile's
+    # file is written first, so the shared class cannot live in the block's
+    top = compile_source(
+        "reg myreg_t { field { sw=rw; hw=r; } f[7:0] = 0; };\n"
+        "mem mem_t { mementries = 16; memwidth = 32; };\n"
+        "regfile rf_t { myreg_t b; myreg_t c[2]; };\n"
+        "addrmap sub_t { myreg_t a; rf_t rf; external mem_t m; };\n"
+        "addrmap top { myreg_t a; rf_t rf[2]; sub_t sub; external mem_t m; };\n"
+    )
+    assert check_split(top) == []
+    assert check_split(top, reuse_classes=True) == []
+    files = export_split(top, RegisterTable(top), reuse_classes=True)
+    assert INCLUDE_RE.findall(files["out/regs_uvmreg_pkg.sv"])[0] == "regs_uvmreg/regs_uvmreg_common.svh"
+
+def test_split_writes_changed_blocks_only():
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "design.rdl")
+        rdl = generate_rdl(blocks=4, regs=8, fields=2)
+        with open(rdl_path, "w") as f:
+            f.write(rdl)
+        top = compile_design(rdl_path)
+        assert check_split(top) == []
+
+        out_path = os.path.join(work_dir, "out", "regs")
+        uvmGenExporter(split_blocks=True).export(top, out_path)
+        sink = OutputSink()
+        uvmGenExporter(output_sink=sink, split_blocks=True).export(top, out_path)
+        # 4 blocks, the package and the filelist
+        assert (sink.written, sink.skipped) == (0, 6)
+
+        with open(rdl_path, "w") as f:
+            f.write(rdl[:rdl.rindex("};")] + "    b2.r5.f1->reset = 3;\n};\n")
+        sink = OutputSink()
+        uvmGenExporter(output_sink=sink, split_blocks=True).export(compile_design(rdl_path), out_path)
+        assert (sink.written, sink.skipped) == (1, 5)
+        with open(os.path.join(work_dir, "out", "regs_uvmreg", "b2.svh")) as f:
+            assert "f1.configure(this, 16, 16, \"RO\", 0, 'h3, 1, 0, 0);" in f.read()
+
+        # Files of blocks that are gone are removed, other files left alone
+        with open(os.path.join(work_dir, "out", "regs_uvmreg", "notes.txt"), "w") as f:
+            f.write("kept\n")
+        with open(rdl_path, "w") as f:
+            f.write(generate_rdl(blocks=3, regs=8, fields=2))
+        uvmGenExporter(split_blocks=True).export(compile_design(rdl_path), out_path)
+        assert sorted(os.listdir(os.path.join(work_dir, "out", "regs_uvmreg"))) == ["b0.svh", "b1.svh", "b2.svh", "notes.txt"]
+
+def test_split_guards():
+    # Include guards must be identifiers whatever the output name
+    top = compile_design(design_path("hwa_wrapper.rdl"))
+    sink = MemorySink()
+    uvmGenExporter(output_sink=sink, split_blocks=True).export(top, "out/my-regs.v1", table=RegisterTable(top))
+    for path, content in sink.files.items():
+        if path.endswith((".sv", ".svh")):
+            for guard in re.findall(r"^`(?:ifndef|define) (.*)$", content.decode(), re.MULTILINE):
+                assert re.match(r"^\w+$", guard), (path, guard)
+
+def test_split_same_class_names(capsys):
+    # in1 is named block_orf_in1 in both a and b
+    rdl = (
+        "regfile in_t { reg { field { sw=rw; hw=r; } f[7:0] = 0; } ctrl; };\n"
+        "regfile orf_t { in_t in1; };\n"
+        "addrmap sub_t { orf_t orf; };\n"
+        "addrmap top { sub_t a; sub_t b; %s };\n"
+    )
+    for overrides, warned in (("", False), ("b.orf.in1.ctrl.f->reset = 1;", True)):
+        top = compile_source(rdl % overrides)
+        files = export_split(top, RegisterTable(top))
+        includes = INCLUDE_RE.findall(files["out/regs_uvmreg_pkg.sv"])
+        assert includes.count("regs_uvmreg/block_orf_in1.svh") == 1
+        assert ("share the UVM class name 'block_orf_in1'" in capsys.readouterr().err) == warned
+
+if __name__ == "__main__":
+    errors = []
+    for name in REPO_DESIGNS:
+        errors += ["%s: %s" % (name, error) for error in check_split(compile_design(design_path(name)))]
+    for error in errors:
+        print(error)
+    if errors:
+        sys.exit(1)
+    print("split models consistent")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# ralbotgen.py --watch.
+#
+# The watcher must regenerate the outputs when a source changes, and keep
+# running when a source briefly disappears, as with editors saving by
+# renaming a new file over the old one.
+#
+# Usage: python test/test_watch.py
+
+import os
+import sys
+import time
+import subprocess
+import tempfile
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+RDL = """\
+addrmap watched {
+    reg { field { sw=rw; hw=r; } f[7:0] = 0; } %s;
+};
+"""
+
+INTERVAL = 0.05
+TIMEOUT = 30
+
+def wait_for(condition, proc):
+    """ Waits until `condition()` holds. False if the watcher exited or the timeout expired first """
+    deadline = time.time() + TIMEOUT
+    while time.time() < deadline:
+        if condition():
+            return True
+        if proc.poll() is not None:
+            return False
+        time.sleep(INTERVAL)
+    return False
+
+def header_has(path, text):
+    try:
+        with open(path) as f:
+            return text in f.read()
+    except OSError:
+        return False
+
+def test_watch_missing_source():
+    with tempfile.TemporaryDirectory() as work_dir:
+        rdl_path = os.path.join(work_dir, "watched.rdl")
+        header_path = os.path.join(work_dir, "out", "watched.h")
+        with open(rdl_path, "w") as f:
+            f.write(RDL % "first")
+
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(this_dir, "../ralbotgen.py"), "--no-cache", "--watch",
+             "--watch-interval", str(INTERVAL), "-header", "c", "-o", os.path.join(work_dir, "out", "watched"),
+             rdl_path],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True
+        )
+        try:
+            assert wait_for(lambda: header_has(header_path, "FIRST"), proc)
+
+            # Save by rename: the source is missing for a while
+            os.remove(rdl_path)
+            time.sleep(INTERVAL * 10)
+            assert proc.poll() is None
+
+            with open(rdl_path + ".new", "w") as f:
+                f.write(RDL % "second")
+            os.replace(rdl_path + ".new", rdl_path)
+            assert wait_for(lambda: header_has(header_path, "SECOND"), proc)
+        finally:
+            proc.kill()
+            output = proc.communicate()[0]
+        assert "Traceback" not in output, output
+        assert "error" in output
+
+if __name__ == "__main__":
+    test_watch_missing_source()
+    print("watcher survived a missing source")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+# Helpers shared by the tests and benchmarks.
+#
+# Importing this module makes the repo's modules importable, so the tests
+# import it before them. It compiles designs and creates every exporter the
+# way the tests run them.
+
+import os
+import sys
+import tempfile
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(this_dir, "../"))
+
+from systemrdl import RDLCompiler
+from ralbot.headergen import headerGenExporter
+from ralbot.uvmgen import uvmGenExporter
+from ralbot.ipxact import IPXACTExporter
+from ralbot.html import HTMLExporter
+
+# Name, exporter factory taking an optional OutputSink, and path to export to
+EXPORTERS = [
+    ("C header", lambda output_sink=None: headerGenExporter(languages="cpp", output_sink=output_sink), "regs"),
+    ("verilog header", lambda output_sink=None: headerGenExporter(languages="verilog", output_sink=output_sink), "regs"),
+    ("uvm regmodel", lambda output_sink=None: uvmGenExporter(output_sink=output_sink), "regs"),
+    ("IP-XACT", lambda output_sink=None: IPXACTExporter(output_sink=output_sink), "regs.xml"),
+    ("html", lambda output_sink=None: HTMLExporter(output_sink=output_sink), "docs"),
+]
+
+# Designs of the repo that every exporter can export
+REPO_DESIGNS = ("test_write_enable.rdl", "accelera-generic_example.rdl", "hwa_wrapper.rdl")
+
+def design_path(name):
+    """ Returns the path of the repo's design `name` """
+    return os.path.join(this_dir, name)
+
+def create_exporters(output_sink=None):
+    """ Returns a fresh (name, exporter, path) of every exporter """
+    return [(name, create(output_sink), path) for name, create, path in EXPORTERS]
+
+def compile_root(path):
+    """ Returns the elaborated root of the design at `path` """
+    rdlc = RDLCompiler()
+    rdlc.compile_file(path)
+    return rdlc.elaborate()
+
+def compile_design(path):
+    """ Returns the top addrmap of the design at `path` """
+    return compile_root(path).top
+
+def compile_source(source):
+    """ Returns the top addrmap of the RDL `source` text """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "design.rdl")
+        with open(path, "w") as f:
+            f.write(source)
+        return compile_design(path)